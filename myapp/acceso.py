@@ -0,0 +1,183 @@
+"""
+Control de intentos de login antes de verificar la contraseña.
+
+Cada intento fallido se anota en dos ventanas deslizantes del cache de
+Django (compartido entre procesos si el cache lo es): una por email y otra
+por IP. Antes de buscar al usuario y de calcular el hash (check_password
+con PBKDF2 es lo caro) se rechaza el intento si alguna de las ventanas
+está llena o si el perfil ya está bloqueado, así una ráfaga de intentos no
+cuesta un hash por request.
+
+Los fallos por email se guardan además en UserProfile.login_attempts (los
+de la ventana) y al llegar a LOGIN_MAX_INTENTOS el perfil queda con
+is_blocked hasta que un administrador lo desbloquee o el usuario restablezca
+su contraseña. Un login correcto vacía la ventana del email y reinicia
+login_attempts. El correo que avisa del bloqueo se envía desde la cola de
+tareas, fuera del request de login.
+
+La ventana por IP usa REMOTE_ADDR. Detrás de un proxy inverso hay que
+listar sus direcciones (o redes) en LOGIN_PROXIES_CONFIABLES para tomar la
+IP del cliente de X-Forwarded-For; si no, todos los usuarios comparten la
+IP del proxy y una ráfaga de fallos bloquearía los logins de todo el sitio.
+"""
+import ipaddress
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import send_mail
+
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+
+def _ventana():
+    return getattr(settings, 'LOGIN_VENTANA', 900)
+
+
+def _clave_email(email):
+    return f"login:email:{email.strip().lower()}"
+
+
+def _clave_ip(ip):
+    return f"login:ip:{ip}"
+
+
+def _intentos(clave, ahora):
+    """Fallos de la ventana vigente (timestamps) guardados en el cache"""
+    limite = ahora - _ventana()
+    return [t for t in cache.get(clave, []) if t > limite]
+
+
+def _anotar(clave, ahora):
+    with _lock:
+        intentos = _intentos(clave, ahora)
+        intentos.append(ahora)
+        cache.set(clave, intentos, timeout=_ventana())
+    return len(intentos)
+
+
+def _proxies_confiables():
+    redes = []
+    for proxy in getattr(settings, 'LOGIN_PROXIES_CONFIABLES', ()):
+        try:
+            redes.append(ipaddress.ip_network(proxy.strip(), strict=False))
+        except ValueError:
+            logger.warning("LOGIN_PROXIES_CONFIABLES: dirección inválida %r", proxy)
+    return redes
+
+
+def _es_confiable(ip, redes):
+    try:
+        direccion = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(direccion in red for red in redes)
+
+
+def ip_cliente(request):
+    """
+    IP del cliente: REMOTE_ADDR, o si la conexión viene de un proxy
+    confiable, la última dirección de X-Forwarded-For que no sea otro proxy
+    confiable (las anteriores las puede falsificar el cliente).
+    """
+    ip = request.META.get('REMOTE_ADDR') or 'desconocida'
+    redes = _proxies_confiables()
+    if not redes or not _es_confiable(ip, redes):
+        return ip
+    reenviadas = [d.strip() for d in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if d.strip()]
+    for direccion in reversed(reenviadas):
+        if not _es_confiable(direccion, redes):
+            return direccion
+    return reenviadas[0] if reenviadas else ip
+
+
+def rechazo(email, ip):
+    """
+    Motivo para rechazar el intento sin consultar la base ni calcular el
+    hash ('ip' o 'email'), o None si se puede continuar.
+    """
+    ahora = time.time()
+    if len(_intentos(_clave_ip(ip), ahora)) >= getattr(settings, 'LOGIN_MAX_INTENTOS_IP', 30):
+        return 'ip'
+    if len(_intentos(_clave_email(email), ahora)) >= getattr(settings, 'LOGIN_MAX_INTENTOS', 3):
+        return 'email'
+    return None
+
+
+def registrar_fallo(email, ip, user=None):
+    """
+    Anota un intento fallido y lo guarda en el perfil (si existe).
+    Devuelve True si con este intento el perfil quedó bloqueado.
+    """
+    from .models import UserProfile
+
+    ahora = time.time()
+    _anotar(_clave_ip(ip), ahora)
+    fallos = _anotar(_clave_email(email), ahora)
+    if user is None:
+        return False
+
+    bloquear = fallos >= getattr(settings, 'LOGIN_MAX_INTENTOS', 3)
+    UserProfile.objects.filter(id=user.id).update(login_attempts=fallos, is_blocked=bloquear or user.is_blocked)
+    user.login_attempts = fallos
+    bloqueado_ahora = bloquear and not user.is_blocked
+    user.is_blocked = user.is_blocked or bloquear
+    return bloqueado_ahora
+
+
+def registrar_exito(email, user):
+    """Login correcto: vacía la ventana del email y reinicia login_attempts"""
+    from .models import UserProfile
+
+    olvidar(email)
+    if user.login_attempts:
+        UserProfile.objects.filter(id=user.id).update(login_attempts=0)
+        user.login_attempts = 0
+
+
+def olvidar(email):
+    """Borra los fallos recientes del email (p. ej. al desbloquear un usuario)"""
+    cache.delete(_clave_email(email))
+
+
+def desbloquear(user):
+    """Desbloquea el perfil y olvida sus fallos (p. ej. tras restablecer la contraseña)"""
+    from .models import UserProfile
+
+    UserProfile.objects.filter(id=user.id).update(is_blocked=False, login_attempts=0)
+    user.is_blocked = False
+    user.login_attempts = 0
+    olvidar(user.email)
+
+
+def avisar_bloqueo(user):
+    """Encola el correo que avisa al usuario que su cuenta quedó bloqueada"""
+    from . import tareas
+
+    try:
+        return tareas.encolar('aviso_bloqueo', user)
+    except Exception:
+        logger.exception("Error encolando el aviso de bloqueo de %s", user.email)
+        return None
+
+
+def enviar_aviso_bloqueo(user):
+    """Manejador de la tarea 'aviso_bloqueo' (si falla, la cola lo reintenta)"""
+    send_mail(
+        subject='🔒 Tu cuenta de TuChanchita fue bloqueada',
+        message=f'''Hola {user.first_name},
+
+Bloqueamos tu cuenta después de varios intentos fallidos de inicio de sesión.
+
+Si no fuiste tú, no te preocupes: tu contraseña sigue protegida. Puedes volver a entrar restableciendo tu contraseña o pidiéndole a un administrador que desbloquee tu cuenta.
+
+El equipo de TuChanchita 💰''',
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[user.email],
+        fail_silently=False,
+    )
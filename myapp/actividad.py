@@ -0,0 +1,129 @@
+"""
+Registro de actividad de los usuarios (sesiones y días activos de UserMetrics).
+
+Cada request autenticado solo actualiza un contador en memoria: se cuenta
+una sesión nueva cuando pasaron más de MINUTOS_SESION minutos desde la
+última actividad (o es la primera) y un día activo cuando la última
+actividad fue en un día anterior (o es la primera). Los accesos repetidos
+se juntan y las diferencias se suman a la base en lote con F() cada
+ACTIVIDAD_INTERVALO segundos o cuando hay ACTIVIDAD_UMBRAL usuarios con
+cambios pendientes.
+
+La última actividad de un usuario se lee de la base una sola vez por
+proceso; con varios procesos una sesión puede contarse en cada uno.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+MINUTOS_SESION = 30  # Inactividad a partir de la cual se cuenta una sesión nueva
+
+_lock = threading.Lock()
+_usuarios = {}  # user_id -> {'ultima': datetime o None, 'sesiones': int, 'dias': int}
+_pendientes = set()  # user_id con contadores sin guardar
+_ultimo_guardado = time.monotonic()
+
+
+def _ultima_actividad_guardada(user_id):
+    from .models import UserMetrics
+
+    return UserMetrics.objects.filter(user_id=user_id).values_list(
+        'fecha_ultima_actividad', flat=True
+    ).first()
+
+
+def registrar(user_id, ahora=None):
+    """Cuenta el acceso del usuario en memoria (sin escribir en la base)"""
+    ahora = ahora or timezone.now()
+    with _lock:
+        estado = _usuarios.get(user_id)
+    if estado is None:
+        # Fuera del lock: es una lectura de la base (una vez por usuario y proceso)
+        ultima = _ultima_actividad_guardada(user_id)
+        with _lock:
+            estado = _usuarios.setdefault(
+                user_id, {'ultima': ultima, 'sesiones': 0, 'dias': 0}
+            )
+
+    with _lock:
+        ultima = estado['ultima']
+        if ultima is None or ahora - ultima > timedelta(minutes=MINUTOS_SESION):
+            estado['sesiones'] += 1
+        if ultima is None or ultima.date() < ahora.date():
+            estado['dias'] += 1
+        estado['ultima'] = max(ultima, ahora) if ultima else ahora
+        _pendientes.add(user_id)
+
+
+def guardar():
+    """Suma a UserMetrics los contadores pendientes de todos los usuarios"""
+    global _ultimo_guardado
+    from .models import UserMetrics, UserProfile
+
+    with _lock:
+        pendientes = {}
+        for user_id in _pendientes:
+            estado = _usuarios[user_id]
+            pendientes[user_id] = dict(estado)
+            estado.update(sesiones=0, dias=0)
+        _pendientes.clear()
+        # Los usuarios inactivos se vuelven a leer de la base si regresan
+        limite = timezone.now() - timedelta(minutes=MINUTOS_SESION)
+        for user_id in [u for u, e in _usuarios.items() if u not in pendientes and e['ultima'] and e['ultima'] < limite]:
+            del _usuarios[user_id]
+        _ultimo_guardado = time.monotonic()
+    if not pendientes:
+        return 0
+
+    try:
+        with transaction.atomic():
+            existentes = set(UserProfile.objects.filter(id__in=pendientes).values_list('id', flat=True))
+            con_metricas = set(
+                UserMetrics.objects.filter(user_id__in=existentes).values_list('user_id', flat=True)
+            )
+            UserMetrics.objects.bulk_create(
+                [UserMetrics(user_id=user_id) for user_id in existentes - con_metricas],
+                ignore_conflicts=True
+            )
+            for user_id in existentes:
+                datos = pendientes[user_id]
+                UserMetrics.objects.filter(user_id=user_id).update(
+                    sesiones_totales=F('sesiones_totales') + datos['sesiones'],
+                    dias_activos=F('dias_activos') + datos['dias'],
+                    fecha_ultima_actividad=datos['ultima'],
+                )
+    except Exception as e:
+        print(f"Error guardando la actividad de usuarios: {str(e)}")
+        # Devolver los contadores a memoria para el próximo intento
+        with _lock:
+            for user_id, datos in pendientes.items():
+                estado = _usuarios.setdefault(user_id, {'ultima': datos['ultima'], 'sesiones': 0, 'dias': 0})
+                estado['sesiones'] += datos['sesiones']
+                estado['dias'] += datos['dias']
+                _pendientes.add(user_id)
+        return 0
+    return len(existentes)
+
+
+def guardar_si_corresponde():
+    """Guarda si pasó ACTIVIDAD_INTERVALO o hay ACTIVIDAD_UMBRAL usuarios pendientes"""
+    pendientes = len(_pendientes)
+    if not pendientes:
+        return 0
+    vencido = time.monotonic() - _ultimo_guardado >= getattr(settings, 'ACTIVIDAD_INTERVALO', 30)
+    if not vencido and pendientes < getattr(settings, 'ACTIVIDAD_UMBRAL', 50):
+        return 0
+    return guardar()
+
+
+def reiniciar():
+    """Olvida la actividad en memoria sin guardarla (útil en tests)"""
+    with _lock:
+        _usuarios.clear()
+        _pendientes.clear()
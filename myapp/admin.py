@@ -38,10 +38,10 @@ class PuntajeTriviaAdmin(admin.ModelAdmin):
 
 @admin.register(FraseCompletar)
 class FraseCompletarAdmin(admin.ModelAdmin):
-    list_display = ('frase_completa', 'palabra_clave', 'categoria', 'nivel_dificultad', 'activa', 'fecha_creacion')
-    list_filter = ('categoria', 'nivel_dificultad', 'activa', 'fecha_creacion')
+    list_display = ('frase_completa', 'palabra_clave', 'categoria', 'nivel_dificultad', 'origen', 'activa', 'fecha_creacion')
+    list_filter = ('categoria', 'nivel_dificultad', 'origen', 'activa', 'fecha_creacion')
     search_fields = ('frase_completa', 'palabra_clave', 'categoria')
-    readonly_fields = ('fecha_creacion',)
+    readonly_fields = ('fecha_creacion', 'frase_con_espacio', 'hash_contenido')
 
 
 @admin.register(PuntajeCompletarFrases)
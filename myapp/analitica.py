@@ -0,0 +1,144 @@
+"""
+Analítica de portafolios sobre el historial de precios guardado.
+
+Arma la serie diaria de cada símbolo (último precio de cada día de
+PriceSnapshot, sin llamar a la API) y en una sola pasada calcula la
+rentabilidad ponderada en el tiempo, la volatilidad anualizada de cada
+posición y del portafolio, la máxima caída (drawdown) y el peso de cada
+posición. El resultado se guarda en memoria por usuario hasta que cambian
+sus inversiones o llega un precio nuevo de alguno de sus símbolos.
+"""
+import math
+import statistics
+import threading
+from collections import defaultdict
+
+from django.db.models import Max
+
+from . import precios
+from .models import PriceSnapshot
+
+
+DIAS_HISTORIAL = 365
+DIAS_HABILES_POR_ANIO = 252
+
+_lock = threading.Lock()
+_cache = {}  # user_id -> (firma, resultado)
+
+
+def _volatilidad_anual(retornos):
+    if len(retornos) < 2:
+        return None
+    return statistics.stdev(retornos) * math.sqrt(DIAS_HABILES_POR_ANIO)
+
+
+def _porcentaje(valor):
+    return round(valor * 100, 2) if valor is not None else None
+
+
+def series_diarias(simbolos, dias=DIAS_HISTORIAL):
+    """
+    Precio de cierre diario de cada símbolo sobre un mismo calendario:
+    (fechas, {símbolo: [precio o None por fecha]}). Los días sin dato
+    repiten el último precio conocido.
+    """
+    cierres = defaultdict(dict)
+    for simbolo, puntos in precios.historial(simbolos, dias=dias).items():
+        for fecha, precio in puntos:
+            cierres[simbolo][fecha.date()] = precio  # vienen en orden, queda el último del día
+    fechas = sorted({fecha for por_dia in cierres.values() for fecha in por_dia})
+
+    series = {}
+    for simbolo, por_dia in cierres.items():
+        ultimo = None
+        serie = []
+        for fecha in fechas:
+            ultimo = por_dia.get(fecha, ultimo)
+            serie.append(ultimo)
+        series[simbolo] = serie
+    return fechas, series
+
+
+def calcular(inversiones):
+    """
+    Métricas del portafolio formado por las inversiones (con el precio
+    actual ya asignado, ver portafolio.valorar). Los porcentajes vienen
+    multiplicados por 100.
+    """
+    inversiones = list(inversiones)
+    fechas, series = series_diarias({inv.symbol for inv in inversiones})
+
+    # Rentabilidad ponderada en el tiempo: cada día solo cuentan las
+    # posiciones que ya existían el día anterior, así las compras nuevas no
+    # se confunden con ganancias
+    retornos_portafolio = []
+    indice, pico, max_caida = 1.0, 1.0, 0.0
+    for t in range(1, len(fechas)):
+        valor_anterior = valor_hoy = 0.0
+        for inv in inversiones:
+            serie = series.get(inv.symbol.upper())
+            if not serie or inv.date > fechas[t - 1] or serie[t - 1] is None:
+                continue
+            valor_anterior += inv.shares * serie[t - 1]
+            valor_hoy += inv.shares * serie[t]
+        if not valor_anterior:
+            continue
+        retorno = valor_hoy / valor_anterior - 1
+        retornos_portafolio.append(retorno)
+        indice *= 1 + retorno
+        pico = max(pico, indice)
+        max_caida = max(max_caida, (pico - indice) / pico)
+
+    valores = {inv.id: inv.current_value() or inv.total_invested() for inv in inversiones}
+    total = sum(valores.values())
+
+    posiciones = []
+    for inv in inversiones:
+        serie = [p for p in series.get(inv.symbol.upper(), []) if p is not None]
+        retornos = [hoy / ayer - 1 for ayer, hoy in zip(serie, serie[1:]) if ayer]
+        posiciones.append({
+            'id': inv.id,
+            'symbol': inv.symbol,
+            'peso': _porcentaje(valores[inv.id] / total) if total else None,
+            'volatilidad': _porcentaje(_volatilidad_anual(retornos)),
+        })
+
+    return {
+        'desde': fechas[0] if fechas else None,
+        'dias': len(fechas),
+        'rentabilidad': _porcentaje(indice - 1) if retornos_portafolio else None,
+        'volatilidad': _porcentaje(_volatilidad_anual(retornos_portafolio)),
+        'max_caida': _porcentaje(max_caida) if retornos_portafolio else None,
+        'posiciones': posiciones,
+    }
+
+
+def _firma(inversiones):
+    """Cambia cuando cambian las inversiones o se guarda un precio nuevo de sus símbolos"""
+    ultimo_punto = PriceSnapshot.objects.filter(
+        symbol__in={inv.symbol.upper() for inv in inversiones}
+    ).aggregate(ultimo=Max('id'))['ultimo']
+    posiciones = tuple(sorted((inv.id, inv.shares, inv.price_at_purchase) for inv in inversiones))
+    precios_actuales = tuple(inv.get_current_price() for inv in sorted(inversiones, key=lambda i: i.id))
+    return ultimo_punto, posiciones, precios_actuales
+
+
+def analizar_usuario(user, inversiones):
+    """Métricas del portafolio del usuario, recalculadas solo si cambió la firma"""
+    inversiones = list(inversiones)
+    firma = _firma(inversiones)
+    with _lock:
+        guardado = _cache.get(user.id)
+    if guardado and guardado[0] == firma:
+        return guardado[1]
+
+    resultado = calcular(inversiones)
+    with _lock:
+        _cache[user.id] = (firma, resultado)
+    return resultado
+
+
+def reiniciar():
+    """Vacía la caché en memoria (útil en tests)"""
+    with _lock:
+        _cache.clear()
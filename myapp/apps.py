@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class MyappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myapp'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from django.db.models.signals import post_delete, post_save
+
+        from . import roles
+
+        # Cambios de staff/superusuario invalidan el rol guardado en las sesiones
+        post_save.connect(roles.usuario_guardado, sender=User, dispatch_uid='roles_usuario_guardado')
+        post_delete.connect(roles.usuario_borrado, sender=User, dispatch_uid='roles_usuario_borrado')
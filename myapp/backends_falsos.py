@@ -0,0 +1,309 @@
+"""
+Backends falsos de Gemini y Twelve Data para medir latencias sin API keys.
+
+- GenaiFalso imita el módulo `google.generativeai` (configure y
+  GenerativeModel) y se instala en proceso con `gemini_falso()`: el
+  registro de myapp.gemini lo sondea y usa como si fuera el real. Responde
+  según el prompt con JSON de evaluación, brecha, frase o verificación, o
+  con texto para el chatbot, también en streaming.
+- ServidorTwelveData es un servidor HTTP local que imita `/price` y `/quote`
+  (un símbolo o varios separados por comas). Se usa apuntando
+  TWELVE_DATA_URL a `servidor.url`.
+
+Ambos aceptan una ConfigFalsa con latencia, variación y tasa de fallos.
+"""
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from . import gemini
+from .evaluacion_ia import CATEGORIAS_EVALUACION, SECCIONES_BRECHA
+
+
+class ConfigFalsa:
+    """Comportamiento de un backend falso (tiempos en segundos)"""
+
+    def __init__(self, latencia=0.0, variacion=0.0, tasa_fallo=0.0, semilla=None):
+        self.latencia = latencia
+        self.variacion = variacion  # +/- al azar sobre la latencia
+        self.tasa_fallo = tasa_fallo  # 0.0 a 1.0
+        self.semilla = semilla
+        self._random = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def demora(self):
+        with self._lock:
+            extra = self._random.uniform(-self.variacion, self.variacion) if self.variacion else 0.0
+        return max(0.0, self.latencia + extra)
+
+    def falla(self):
+        if not self.tasa_fallo:
+            return False
+        with self._lock:
+            return self._random.random() < self.tasa_fallo
+
+
+class ErrorSimulado(RuntimeError):
+    """Fallo inyectado por un backend falso"""
+
+
+# ============================================
+# GEMINI
+# ============================================
+
+FRASES = [
+    ('La inflación reduce el poder adquisitivo del dinero con el tiempo', 'inflación'),
+    ('El interés compuesto permite que el dinero crezca exponencialmente', 'interés compuesto'),
+    ('La diversificación reduce el riesgo al distribuir inversiones en diferentes activos', 'diversificación'),
+    ('El phishing es un fraude que busca robar datos personales mediante engaño', 'phishing'),
+    ('Un fondo de emergencia debe cubrir entre 3 y 6 meses de gastos', 'fondo de emergencia'),
+]
+
+RESPUESTA_CHAT = (
+    "Para empezar a ahorrar te recomiendo separar un porcentaje fijo de tus ingresos apenas los recibas. "
+    "Por ejemplo, si ganas S/. 1,500 al mes, apartar el 10% (S/. 150) en una cuenta de ahorros te permite "
+    "construir un fondo de emergencia. **Revisa tus gastos hormiga** y anótalos en un presupuesto mensual."
+)
+
+TAMANIO_FRAGMENTO = 40
+
+
+def _pregunta(tema, i):
+    return {
+        'pregunta': f'Pregunta {i + 1} sobre {tema}: ¿cuál es la opción correcta?',
+        'opciones': {'A': 'La correcta', 'B': 'Otra opción', 'C': 'Tampoco', 'D': 'Ninguna'},
+        'respuesta_correcta': 'A',
+        'dificultad': 'facil',
+    }
+
+
+def _cantidad(prompt, defecto):
+    coincidencia = re.search(r'Genera (\d+) preguntas', prompt)
+    return int(coincidencia.group(1)) if coincidencia else defecto
+
+
+def responder(prompt, generation_config=None):
+    """Texto que devolvería la IA para el prompt (lo elige por el formato pedido)"""
+    generation_config = generation_config or {}
+    if 'response_schema' in generation_config or 'evaluación financiera completa' in prompt:
+        datos = {c: [_pregunta(c, i) for i in range(10)] for c in CATEGORIAS_EVALUACION}
+        datos.update({t: [_pregunta(t, i) for i in range(5)] for t in SECCIONES_BRECHA})
+        return json.dumps(datos, ensure_ascii=False)
+    if '"frase_completa"' in prompt:
+        frase, palabra = random.choice(FRASES)
+        return json.dumps({'frase_completa': frase, 'palabra_clave': palabra}, ensure_ascii=False)
+    if '"es_correcta"' in prompt:
+        return json.dumps({'es_correcta': False, 'es_similar': True, 'explicacion': 'Respuesta cercana'})
+    if '"preguntas"' in prompt:
+        return json.dumps(
+            {'preguntas': [_pregunta('finanzas', i) for i in range(_cantidad(prompt, 5))]},
+            ensure_ascii=False
+        )
+    return RESPUESTA_CHAT
+
+
+class RespuestaFalsa:
+    def __init__(self, text):
+        self.text = text
+
+
+class ModeloFalso:
+    """Imita genai.GenerativeModel con la latencia y fallos de la configuración"""
+
+    def __init__(self, nombre, config):
+        self.model_name = nombre
+        self.config = config
+        self.llamadas = 0
+
+    def _esperar(self, request_options):
+        demora = self.config.demora()
+        limite = (request_options or {}).get('timeout')
+        if limite is not None and demora > limite:
+            time.sleep(limite)
+            raise TimeoutError(f"Gemini falso: la llamada superó {limite}s")
+        time.sleep(demora)
+        if self.config.falla():
+            raise ErrorSimulado("Gemini falso: error 503 simulado")
+
+    def generate_content(self, prompt, stream=False, generation_config=None, request_options=None, **kwargs):
+        self.llamadas += 1
+        texto = responder(prompt, generation_config)
+        if not stream:
+            self._esperar(request_options)
+            return RespuestaFalsa(texto)
+        return self._stream(texto, request_options)
+
+    def _stream(self, texto, request_options):
+        # La latencia es hasta el primer fragmento; el resto llega rápido
+        self._esperar(request_options)
+        for inicio in range(0, len(texto), TAMANIO_FRAGMENTO):
+            yield RespuestaFalsa(texto[inicio:inicio + TAMANIO_FRAGMENTO])
+
+
+class GenaiFalso(types.ModuleType):
+    """Reemplazo en proceso de `google.generativeai`"""
+
+    def __init__(self, config=None):
+        super().__init__('google.generativeai')
+        self.config = config or ConfigFalsa()
+        self.modelos = []
+
+    def configure(self, api_key=None, **kwargs):
+        self.api_key = api_key
+
+    def GenerativeModel(self, nombre, **kwargs):
+        modelo = ModeloFalso(nombre, self.config)
+        self.modelos.append(modelo)
+        return modelo
+
+
+@contextmanager
+def gemini_falso(config=None):
+    """
+    Instala GenaiFalso como `google.generativeai` y reinicia el registro de
+    modelos para que lo resuelva. Al salir restaura el módulo original.
+    Requiere que GEMINI_API_KEY tenga algún valor.
+    """
+    import google
+
+    genai = GenaiFalso(config)
+    anterior = sys.modules.get('google.generativeai')
+    # `import google.generativeai` lee el atributo del paquete si ya se importó
+    atributo_anterior = getattr(google, 'generativeai', None)
+    sys.modules['google.generativeai'] = genai
+    google.generativeai = genai
+    gemini.reiniciar()
+    try:
+        yield genai
+    finally:
+        if anterior is None:
+            sys.modules.pop('google.generativeai', None)
+        else:
+            sys.modules['google.generativeai'] = anterior
+        if atributo_anterior is None:
+            del google.generativeai
+        else:
+            google.generativeai = atributo_anterior
+        gemini.reiniciar()
+
+
+# ============================================
+# TWELVE DATA
+# ============================================
+
+def precio_base(simbolo):
+    """Precio estable por símbolo (entre 20 y 520) para que las corridas sean comparables"""
+    semilla = int(hashlib.sha256(simbolo.upper().encode('utf-8')).hexdigest()[:8], 16)
+    return 20 + (semilla % 50000) / 100
+
+
+def _cotizacion(simbolo, precio):
+    cierre_anterior = round(precio * 0.99, 5)
+    return {
+        'symbol': simbolo,
+        'name': f'{simbolo} Inc',
+        'exchange': 'NASDAQ',
+        'currency': 'USD',
+        'datetime': time.strftime('%Y-%m-%d'),
+        'open': f'{cierre_anterior:.5f}',
+        'high': f'{precio * 1.01:.5f}',
+        'low': f'{precio * 0.98:.5f}',
+        'close': f'{precio:.5f}',
+        'volume': '1000000',
+        'previous_close': f'{cierre_anterior:.5f}',
+        'change': f'{precio - cierre_anterior:.5f}',
+        'percent_change': f'{(precio - cierre_anterior) / cierre_anterior * 100:.5f}',
+        'is_market_open': False,
+    }
+
+
+class _ManejadorTwelveData(BaseHTTPRequestHandler):
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, estado, datos):
+        cuerpo = json.dumps(datos).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        servidor = self.server.twelve
+        url = urlparse(self.path)
+        parametros = parse_qs(url.query)
+        simbolos = [s.strip().upper() for s in parametros.get('symbol', [''])[0].split(',') if s.strip()]
+
+        with servidor.lock:
+            servidor.solicitudes.append(self.path)
+        time.sleep(servidor.config.demora())
+
+        if servidor.config.falla():
+            # Mismo formato de error que la API real cuando se agota el plan
+            return self._responder(429, {'code': 429, 'message': 'Simulated rate limit', 'status': 'error'})
+        if url.path not in ('/price', '/quote'):
+            return self._responder(404, {'code': 404, 'message': 'Not found', 'status': 'error'})
+        if not simbolos:
+            return self._responder(400, {'code': 400, 'message': 'symbol is required', 'status': 'error'})
+
+        def datos(simbolo):
+            precio = servidor.precio(simbolo)
+            if url.path == '/price':
+                return {'price': f'{precio:.5f}'}
+            return _cotizacion(simbolo, precio)
+
+        if len(simbolos) == 1:
+            return self._responder(200, datos(simbolos[0]))
+        self._responder(200, {simbolo: datos(simbolo) for simbolo in simbolos})
+
+
+class ServidorTwelveData:
+    """
+    Servidor HTTP local (en un hilo) que imita /price y /quote de Twelve
+    Data. Los precios varían un poco en cada consulta alrededor de
+    precio_base(símbolo).
+    """
+
+    def __init__(self, config=None, host='127.0.0.1', puerto=0):
+        self.config = config or ConfigFalsa()
+        self.lock = threading.Lock()
+        self.solicitudes = []
+        self._random = random.Random(self.config.semilla)
+        self._http = ThreadingHTTPServer((host, puerto), _ManejadorTwelveData)
+        self._http.daemon_threads = True
+        self._http.twelve = self
+        self._hilo = None
+
+    @property
+    def url(self):
+        host, puerto = self._http.server_address[:2]
+        return f'http://{host}:{puerto}'
+
+    def precio(self, simbolo):
+        with self.lock:
+            variacion = self._random.uniform(-0.01, 0.01)
+        return precio_base(simbolo) * (1 + variacion)
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.detener()
@@ -0,0 +1,93 @@
+"""
+Banco de frases para Completar Frases.
+
+El juego sirve frases del banco curado FraseCompletar (cargado con
+`populate_frases_completar`) al instante. Cada usuario recorre el banco con
+un cursor propio por nivel de dificultad, en un orden al azar fijo
+(FraseCompletar.orden), así que no se repite ninguna frase hasta que lo
+termina. Recién ahí se pide a la IA, en segundo plano, que agregue frases
+nuevas al banco.
+"""
+import re
+
+from django.db.models import Q
+
+
+ESPACIO = "______________________"
+
+NIVELES = {1: 'Fácil', 2: 'Medio', 3: 'Difícil'}
+NIVEL_POR_DEFECTO = 2  # Frases de la IA pedidas sin un nivel
+
+
+def enmascarar(frase_completa, palabra_clave):
+    """
+    Reemplaza la primera aparición de la palabra clave (sin importar
+    mayúsculas) por el espacio en blanco. Retorna '' si no aparece.
+    """
+    if not frase_completa or not palabra_clave:
+        return ''
+    patron = re.compile(re.escape(palabra_clave.strip()), re.IGNORECASE)
+    enmascarada, reemplazos = patron.subn(ESPACIO, frase_completa, count=1)
+    return enmascarada if reemplazos else ''
+
+
+def frases_servibles(nivel=0):
+    from .models import FraseCompletar
+
+    frases = FraseCompletar.objects.filter(activa=True).exclude(frase_con_espacio='')
+    if nivel:
+        frases = frases.filter(nivel_dificultad=nivel)
+    return frases
+
+
+def siguiente_frase(user, nivel=0):
+    """
+    Siguiente frase del banco para el usuario según su cursor. Al terminar
+    el recorrido vuelve a empezar y encola la reposición con la IA.
+    Retorna None solo si el banco está vacío para ese nivel.
+    """
+    from . import pool
+    from .models import CursorFrasesCompletar
+
+    cursor, _ = CursorFrasesCompletar.objects.get_or_create(user=user, nivel=nivel)
+    frases = frases_servibles(nivel).order_by('orden', 'id')
+
+    frase = frases.filter(
+        Q(orden__gt=cursor.ultimo_orden) | Q(orden=cursor.ultimo_orden, id__gt=cursor.ultimo_id)
+    ).first()
+    if frase is None:
+        frase = frases.first()
+        if frase is None:
+            return None
+        # El usuario ya vio todo el banco: pedir frases nuevas a la IA de su nivel
+        cursor.vueltas += 1
+        pool.reponer('frase', forzar=True, datos={'nivel': nivel} if nivel else None)
+
+    cursor.ultimo_orden = frase.orden
+    cursor.ultimo_id = frase.id
+    cursor.save()
+    return frase
+
+
+def agregar_frase(frase_completa, palabra_clave, categoria='ia', nivel_dificultad=NIVEL_POR_DEFECTO):
+    """
+    Agrega una frase generada por la IA al banco. Retorna (frase, creada);
+    si ya existía (mismo contenido normalizado) devuelve la existente.
+    """
+    from .models import FraseCompletar
+    from .pool import hash_contenido
+
+    existente = FraseCompletar.objects.filter(hash_contenido=hash_contenido(frase_completa, palabra_clave)).first()
+    if existente:
+        return existente, False
+
+    frase = FraseCompletar.objects.create(
+        frase_completa=frase_completa,
+        palabra_clave=palabra_clave,
+        categoria=categoria,
+        nivel_dificultad=nivel_dificultad,
+        origen='ia',
+        # Sin la palabra clave en la frase no se puede jugar
+        activa=bool(enmascarar(frase_completa, palabra_clave))
+    )
+    return frase, True
@@ -0,0 +1,211 @@
+"""
+Banco local de preguntas de evaluación.
+
+Se usa como respaldo cuando la generación con IA no responde a tiempo o
+falla, para que la evaluación nunca se muestre con categorías vacías.
+Las preguntas siguen el mismo formato que devuelve la IA.
+"""
+import random
+
+
+def _p(pregunta, a, b, c, d, correcta, dificultad='facil'):
+    return {
+        'pregunta': pregunta,
+        'opciones': {'A': a, 'B': b, 'C': c, 'D': d},
+        'respuesta_correcta': correcta,
+        'dificultad': dificultad,
+    }
+
+
+BANCO_EVALUACION = {
+    'presupuesto': [
+        _p('¿Qué es un presupuesto personal?',
+           'Un plan de ingresos y gastos para un periodo', 'Un préstamo bancario',
+           'Un tipo de cuenta de ahorros', 'Un impuesto mensual', 'A', 'muy_facil'),
+        _p('Según la regla 50/30/20, ¿qué porcentaje del ingreso se destina al ahorro?',
+           '50%', '30%', '20%', '10%', 'C', 'facil'),
+        _p('Si ganas S/. 2,000 y tus gastos fijos suman S/. 1,500, ¿cuánto te queda para gastos variables y ahorro?',
+           'S/. 300', 'S/. 500', 'S/. 1,000', 'S/. 3,500', 'B', 'muy_facil'),
+        _p('¿Cuál de estos es un gasto fijo?',
+           'Salidas al cine', 'Alquiler de vivienda', 'Ropa de temporada', 'Regalos', 'B', 'facil'),
+        _p('¿Qué conviene hacer primero al recibir tu sueldo?',
+           'Pagar gastos hormiga', 'Separar el monto de ahorro planificado',
+           'Comprar lo que estaba en oferta', 'Prestar dinero a amigos', 'B', 'intermedia'),
+        _p('¿Qué son los "gastos hormiga"?',
+           'Pagos de impuestos', 'Gastos pequeños y frecuentes que suman mucho al mes',
+           'Cuotas de un crédito hipotecario', 'Gastos de emergencia', 'B', 'facil'),
+        _p('Si tus gastos superan tus ingresos de forma recurrente, ¿qué indica tu presupuesto?',
+           'Superávit', 'Equilibrio', 'Déficit', 'Liquidez', 'C', 'intermedia'),
+        _p('¿Cada cuánto es recomendable revisar tu presupuesto personal?',
+           'Una vez al año', 'Solo cuando hay problemas', 'Mensualmente', 'Nunca, se hace una sola vez', 'C', 'facil'),
+        _p('¿Qué herramienta ayuda más a cumplir un presupuesto?',
+           'Registrar todos los gastos', 'Usar solo tarjeta de crédito',
+           'Evitar mirar el saldo', 'Pedir adelantos de sueldo', 'A', 'intermedia'),
+        _p('Un presupuesto base cero significa que:',
+           'No se gasta nada en el mes', 'Cada sol de ingreso tiene un destino asignado',
+           'Se eliminan todos los ahorros', 'Los gastos son iguales a cero', 'B', 'complicada'),
+    ],
+    'ahorro': [
+        _p('¿Qué es un fondo de emergencia?',
+           'Dinero reservado para imprevistos', 'Un seguro de vida',
+           'Un préstamo de emergencia', 'Dinero para vacaciones', 'A', 'muy_facil'),
+        _p('¿Cuántos meses de gastos se recomienda que cubra un fondo de emergencia?',
+           '1 semana', 'Entre 3 y 6 meses', '5 años', 'Ninguno', 'B', 'facil'),
+        _p('¿Qué institución protege los depósitos con el Fondo de Seguro de Depósitos en Perú?',
+           'SUNAT', 'El FSD, supervisado junto con la SBS', 'INDECOPI', 'La ONP', 'B', 'intermedia'),
+        _p('¿Qué indicador debes comparar al elegir una cuenta de ahorros?',
+           'TEA', 'TREA', 'IGV', 'ITF', 'B', 'complicada'),
+        _p('El interés compuesto significa que:',
+           'Solo se gana interés sobre el capital inicial', 'Se ganan intereses sobre los intereses acumulados',
+           'El banco cobra dos veces', 'El interés baja cada año', 'B', 'facil'),
+        _p('¿Dónde es más seguro guardar tus ahorros?',
+           'En efectivo en casa', 'En una entidad supervisada por la SBS',
+           'Prestados a conocidos', 'En una cadena de inversión por WhatsApp', 'B', 'muy_facil'),
+        _p('Un depósito a plazo fijo se caracteriza por:',
+           'Poder retirar el dinero en cualquier momento sin costo', 'Mantener el dinero un tiempo acordado a cambio de mayor interés',
+           'No pagar intereses', 'Ser un tipo de préstamo', 'B', 'intermedia'),
+        _p('¿Qué efecto tiene la inflación sobre el dinero ahorrado sin intereses?',
+           'Aumenta su poder adquisitivo', 'No tiene efecto', 'Reduce su poder adquisitivo', 'Lo duplica', 'C', 'intermedia'),
+        _p('¿Qué es "págate a ti mismo primero"?',
+           'Gastar el sueldo en gustos personales', 'Ahorrar apenas recibes el ingreso',
+           'Pagar primero las deudas de otros', 'Cobrar por adelantado', 'B', 'facil'),
+        _p('La CTS en Perú funciona principalmente como:',
+           'Un bono de productividad', 'Un seguro de desempleo y ahorro del trabajador',
+           'Un impuesto laboral', 'Un préstamo del empleador', 'B', 'complicada'),
+    ],
+    'credito': [
+        _p('¿Qué es la TCEA?',
+           'La tasa que incluye intereses, comisiones y gastos del crédito', 'Un tipo de tarjeta de débito',
+           'El impuesto a las compras', 'La tasa de ahorro', 'A', 'intermedia'),
+        _p('Pagar solo el mínimo de la tarjeta de crédito provoca que:',
+           'La deuda se cancele más rápido', 'Se paguen más intereses a largo plazo',
+           'El banco te devuelva dinero', 'Mejore automáticamente tu historial', 'B', 'facil'),
+        _p('¿Qué entidad registra el historial crediticio en Perú?',
+           'La central de riesgos de la SBS', 'La RENIEC', 'El MINSA', 'La municipalidad', 'A', 'intermedia'),
+        _p('¿Cuál es una buena práctica con la tarjeta de crédito?',
+           'Usarla para retirar efectivo', 'Pagar el total del mes antes de la fecha límite',
+           'Tener muchas tarjetas a la vez', 'Prestarla a familiares', 'B', 'muy_facil'),
+        _p('¿Qué significa estar calificado como "Normal" en la central de riesgos?',
+           'Que tienes deudas vencidas', 'Que pagas tus deudas a tiempo',
+           'Que no puedes pedir créditos', 'Que tienes un crédito hipotecario', 'B', 'facil'),
+        _p('Un crédito con TCEA de 60% frente a otro de 35% es:',
+           'Más barato', 'Más caro', 'Igual', 'Imposible de comparar', 'B', 'facil'),
+        _p('¿Qué porcentaje de tus ingresos se recomienda como máximo para pagar deudas?',
+           'Alrededor del 30-40%', '80%', '100%', '0%', 'A', 'intermedia'),
+        _p('El periodo de facturación de una tarjeta de crédito es:',
+           'El rango de fechas en que se acumulan tus consumos', 'El día en que vence la tarjeta',
+           'El tiempo que dura una compra', 'El plazo para cancelar la tarjeta', 'A', 'intermedia'),
+        _p('Disponer de efectivo con la tarjeta de crédito suele:',
+           'Ser gratuito', 'Generar intereses desde el primer día y comisiones',
+           'Dar puntos dobles', 'Reducir la deuda', 'B', 'complicada'),
+        _p('Refinanciar una deuda significa:',
+           'Cambiar sus condiciones de plazo o tasa', 'Pagarla completa',
+           'Olvidarla', 'Transferirla a otra persona sin acuerdo', 'A', 'complicada'),
+    ],
+    'inversiones': [
+        _p('¿Qué representa una acción?',
+           'Una parte de la propiedad de una empresa', 'Un préstamo a un banco',
+           'Un seguro', 'Un impuesto', 'A', 'muy_facil'),
+        _p('La diversificación sirve para:',
+           'Aumentar el riesgo', 'Reducir el riesgo distribuyendo inversiones',
+           'Evitar pagar impuestos', 'Garantizar ganancias', 'B', 'facil'),
+        _p('Un bono es:',
+           'Una participación en una empresa', 'Un instrumento de deuda que paga intereses',
+           'Un tipo de cuenta corriente', 'Un seguro de salud', 'B', 'facil'),
+        _p('¿Qué entidad supervisa el mercado de valores en Perú?',
+           'SMV', 'SUNAT', 'RENIEC', 'OSIPTEL', 'A', 'intermedia'),
+        _p('Mayor rentabilidad esperada generalmente implica:',
+           'Menor riesgo', 'Mayor riesgo', 'Ningún riesgo', 'Rentabilidad garantizada', 'B', 'facil'),
+        _p('Un fondo mutuo es:',
+           'Un patrimonio común administrado por una sociedad gestora', 'Una cuenta sueldo',
+           'Un préstamo personal', 'Un seguro de vida', 'A', 'intermedia'),
+        _p('¿Qué es el horizonte de inversión?',
+           'El tiempo que planeas mantener la inversión', 'La ganancia máxima posible',
+           'El banco donde inviertes', 'El precio de una acción', 'A', 'intermedia'),
+        _p('Una promesa de "ganancias garantizadas del 10% mensual" es señal de:',
+           'Buena inversión', 'Posible esquema fraudulento', 'Bono del gobierno', 'Fondo mutuo regulado', 'B', 'facil'),
+        _p('¿Qué mide la volatilidad de una inversión?',
+           'Cuánto varía su precio en el tiempo', 'Su tasa de impuestos',
+           'El número de accionistas', 'El tamaño de la empresa', 'A', 'complicada'),
+        _p('¿Qué son los dividendos?',
+           'Parte de las utilidades repartidas a los accionistas', 'Comisiones del broker',
+           'Deudas de la empresa', 'Impuestos a la renta', 'A', 'complicada'),
+    ],
+    'fraudes': [
+        _p('¿Qué es el phishing?',
+           'Un fraude para obtener datos personales mediante engaños', 'Un tipo de inversión',
+           'Un método de ahorro', 'Un seguro bancario', 'A', 'muy_facil'),
+        _p('Si recibes un SMS del "banco" pidiendo tu clave, debes:',
+           'Responder con tu clave', 'Ignorarlo y comunicarte por los canales oficiales',
+           'Reenviarlo a tus contactos', 'Hacer clic en el enlace', 'B', 'muy_facil'),
+        _p('El smishing es un fraude que usa:',
+           'Llamadas telefónicas', 'Mensajes de texto', 'Correo postal', 'Cajeros automáticos', 'B', 'facil'),
+        _p('El vishing es un fraude realizado mediante:',
+           'Llamadas telefónicas', 'Redes sociales', 'Tarjetas clonadas', 'Cheques', 'A', 'facil'),
+        _p('¿Qué es el skimming?',
+           'Clonación de tarjetas mediante dispositivos en cajeros o POS', 'Un tipo de préstamo',
+           'Un seguro de tarjetas', 'Un método de pago', 'A', 'intermedia'),
+        _p('¿Qué dato NUNCA te pedirá tu banco por teléfono o correo?',
+           'Tu nombre', 'Tu clave o token digital', 'Tu ciudad', 'Tu correo', 'B', 'facil'),
+        _p('Una página web segura para pagos debe mostrar:',
+           'HTTPS y el dominio oficial', 'Muchos anuncios', 'Errores de ortografía', 'Ventanas emergentes', 'A', 'intermedia'),
+        _p('¿Qué es la autenticación en dos pasos?',
+           'Usar dos contraseñas iguales', 'Un segundo factor de verificación además de la clave',
+           'Iniciar sesión dos veces', 'Tener dos cuentas', 'B', 'intermedia'),
+        _p('Si detectas un cargo no reconocido en tu tarjeta, lo primero es:',
+           'Esperar al próximo mes', 'Bloquear la tarjeta y reportarlo al banco',
+           'Pagarlo para evitar intereses', 'Publicarlo en redes', 'B', 'facil'),
+        _p('El pharming consiste en:',
+           'Redirigir a sitios falsos aunque escribas la dirección correcta', 'Enviar SMS falsos',
+           'Clonar tarjetas', 'Robar billeteras', 'A', 'complicada'),
+    ],
+}
+
+
+BANCO_BRECHA = {
+    'teorico': [
+        _p('¿Qué es la inflación?',
+           'El aumento generalizado de precios', 'La baja de los sueldos',
+           'Un impuesto', 'El tipo de cambio', 'A'),
+        _p('¿Qué diferencia hay entre TEA y TCEA?',
+           'Ninguna', 'La TCEA incluye comisiones y gastos además del interés',
+           'La TEA es para ahorros y la TCEA para seguros', 'La TCEA siempre es menor', 'B'),
+        _p('¿Qué es la liquidez?',
+           'La facilidad de convertir un activo en efectivo', 'La cantidad de deudas',
+           'El valor de una casa', 'Un tipo de interés', 'A'),
+        _p('¿Qué es un activo?',
+           'Algo que genera o conserva valor', 'Una deuda', 'Un gasto mensual', 'Un impuesto', 'A'),
+        _p('¿Qué es el costo de oportunidad?',
+           'Lo que se deja de ganar al elegir una alternativa', 'El precio de una oferta',
+           'Un interés bancario', 'Un descuento', 'A'),
+    ],
+    'practico': [
+        _p('Recibes un bono inesperado de S/. 500. ¿Qué harías primero?',
+           'Gastarlo todo en el día', 'Destinar una parte a tu fondo de emergencia',
+           'Prestarlo sin garantía', 'Apostar en línea', 'B'),
+        _p('Tu tarjeta te ofrece pagar el mínimo este mes. ¿Qué haces?',
+           'Pago el mínimo siempre', 'Pago el total o lo máximo posible',
+           'No pago nada', 'Saco otra tarjeta para pagar', 'B'),
+        _p('Te llaman ofreciendo duplicar tu dinero en un mes. ¿Qué haces?',
+           'Invierto de inmediato', 'Verifico si la entidad está registrada en la SMV/SBS y desconfío',
+           'Le paso mis datos', 'Le presto a un amigo para invertir', 'B'),
+        _p('Quieres comprar un celular caro. ¿Cuál es la mejor opción?',
+           'Comprarlo en 36 cuotas sin ver la tasa', 'Ahorrar y comparar precios antes de comprar',
+           'Usar la disposición de efectivo', 'Pedir un préstamo informal', 'B'),
+        _p('A fin de mes te sobran S/. 100. ¿Qué haces?',
+           'Los gasto en delivery', 'Los ahorro o adelanto deudas caras',
+           'Los dejo olvidados', 'Compro lotería', 'B'),
+    ],
+}
+
+
+def preguntas_locales(categoria, cantidad=10):
+    """Devuelve hasta `cantidad` preguntas del banco local para una categoría"""
+    banco = BANCO_EVALUACION.get(categoria, [])
+    return random.sample(banco, min(cantidad, len(banco)))
+
+
+def preguntas_brecha_locales(tipo='teorico', cantidad=5):
+    """Devuelve hasta `cantidad` preguntas locales de brecha teórico-práctica"""
+    banco = BANCO_BRECHA.get(tipo, [])
+    return random.sample(banco, min(cantidad, len(banco)))
@@ -0,0 +1,115 @@
+"""
+Caché persistente de respuestas de la IA.
+
+Cada respuesta se guarda en la base de datos bajo el hash de
+(modelo, prompt, parámetros). Cada familia de prompts tiene su propio TTL
+(0 = sin caché) y la tabla se mantiene bajo un máximo de entradas
+desalojando las menos usadas recientemente (LRU).
+"""
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+
+# TTL por familia en segundos. Las familias deterministas (verificación de
+# respuestas, preguntas de brecha) se cachean; las que buscan variedad no.
+TTL_POR_DEFECTO = {
+    'verificacion': 30 * 24 * 3600,
+    'brecha': 24 * 3600,
+    'evaluacion': 0,
+    'frase': 0,
+}
+
+_lock = threading.Lock()
+_contadores = defaultdict(lambda: {'aciertos': 0, 'fallos': 0})
+
+
+def ttl_familia(familia):
+    """Segundos de vida de las respuestas de una familia (0 = no se cachea)"""
+    ttls = dict(TTL_POR_DEFECTO)
+    ttls.update(getattr(settings, 'IA_CACHE_TTL', {}))
+    return ttls.get(familia, 0)
+
+
+def calcular_clave(modelo, prompt, params=None):
+    """Hash sha256 de (modelo, prompt, parámetros)"""
+    contenido = json.dumps([modelo, prompt, params or {}], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def _contar(familia, campo):
+    with _lock:
+        _contadores[familia][campo] += 1
+
+
+def obtener(familia, modelo, prompt, params=None):
+    """Devuelve la respuesta cacheada vigente o None"""
+    from .models import RespuestaIACache
+
+    clave = calcular_clave(modelo, prompt, params)
+    ahora = timezone.now()
+    entrada = RespuestaIACache.objects.filter(clave=clave, expira_en__gt=ahora).only('respuesta').first()
+    if entrada is None:
+        _contar(familia, 'fallos')
+        return None
+
+    RespuestaIACache.objects.filter(pk=entrada.pk).update(
+        ultimo_acceso=ahora,
+        aciertos=F('aciertos') + 1
+    )
+    _contar(familia, 'aciertos')
+    return entrada.respuesta
+
+
+def guardar(familia, modelo, prompt, respuesta, params=None):
+    """Guarda (o renueva) una respuesta y aplica el límite de tamaño"""
+    from .models import RespuestaIACache
+
+    ttl = ttl_familia(familia)
+    if ttl <= 0:
+        return
+
+    ahora = timezone.now()
+    RespuestaIACache.objects.update_or_create(
+        clave=calcular_clave(modelo, prompt, params),
+        defaults={
+            'familia': familia,
+            'modelo': modelo or '',
+            'respuesta': respuesta,
+            'expira_en': ahora + timedelta(seconds=ttl),
+            'ultimo_acceso': ahora,
+        }
+    )
+    desalojar()
+
+
+def desalojar():
+    """Borra las entradas vencidas y, si se supera el máximo, las menos usadas recientemente"""
+    from .models import RespuestaIACache
+
+    RespuestaIACache.objects.filter(expira_en__lte=timezone.now()).delete()
+
+    maximo = getattr(settings, 'IA_CACHE_MAX_ENTRADAS', 5000)
+    exceso = RespuestaIACache.objects.count() - maximo
+    if exceso > 0:
+        ids = list(
+            RespuestaIACache.objects.order_by('ultimo_acceso').values_list('id', flat=True)[:exceso]
+        )
+        RespuestaIACache.objects.filter(id__in=ids).delete()
+
+
+def estadisticas():
+    """Aciertos y fallos de la caché por familia desde que arrancó el proceso"""
+    with _lock:
+        return {familia: dict(valores) for familia, valores in _contadores.items()}
+
+
+def reiniciar_estadisticas():
+    with _lock:
+        _contadores.clear()
@@ -0,0 +1,177 @@
+"""
+Contexto acotado para el chatbot.
+
+El prompt ya no concatena toda la conversación: se envían las últimas
+CHAT_TURNOS_RECIENTES preguntas y respuestas tal cual (hasta
+CHAT_PRESUPUESTO_TOKENS) y los turnos anteriores se pliegan en un resumen
+acumulado. Se guardan como máximo CHAT_TURNOS_GUARDADOS turnos (con
+textos recortados) más el resumen, así que el historial tampoco crece sin límite.
+
+ContextoChat guarda el historial en un diccionario (la sesión en versiones
+anteriores). Las vistas usan ContextoChatUsuario, que lo guarda fuera de la
+sesión: una fila de TurnoChat por turno, usadas como buffer circular (se
+insertan solo los turnos nuevos y se borran los que salen), y el resumen
+en EstadoChat, que solo se escribe si cambió.
+"""
+from django.conf import settings
+
+
+INSTRUCCIONES = "Eres un asistente financiero útil especializado en finanzas personales para jóvenes peruanos. Responde de manera clara, concisa y adaptada al contexto peruano (soles, sistema financiero peruano)."
+
+# Aproximación sin tokenizador: ~4 caracteres por token en español
+CARACTERES_POR_TOKEN = 4
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def estimar_tokens(texto):
+    return (len(texto or '') + CARACTERES_POR_TOKEN - 1) // CARACTERES_POR_TOKEN
+
+
+def _recortar(texto, maximo):
+    texto = ' '.join((texto or '').split())
+    if len(texto) <= maximo:
+        return texto
+    return texto[:maximo - 1].rstrip() + '…'
+
+
+def _primera_oracion(texto):
+    texto = ' '.join((texto or '').replace('*', '').split())
+    for separador in ('. ', '? ', '! '):
+        if separador in texto:
+            return texto.split(separador, 1)[0] + separador.strip()
+    return texto
+
+
+def _formatear_turno(turno):
+    texto = f"Usuario: {turno.get('pregunta', '')}\n"
+    if 'respuesta' in turno:
+        texto += f"Asistente: {turno['respuesta']}\n"
+    return texto
+
+
+class ContextoChat:
+    """Historial del chatbot guardado en la sesión con presupuesto de tokens"""
+
+    def __init__(self, session):
+        self.session = session
+        self.historial = list(session.get('chat_historial', []))
+        self.resumen = session.get('chat_resumen', '')
+        # Cuántos de los turnos guardados ya están incluidos en el resumen
+        self.resumidos = min(session.get('chat_resumidos', 0), len(self.historial))
+
+    def conversacion(self, mensaje):
+        """Prompt con instrucciones, resumen, turnos recientes que entran en el presupuesto y el mensaje nuevo"""
+        encabezado = INSTRUCCIONES + "\n\n"
+        if self.resumen:
+            encabezado += f"Resumen de la conversación anterior:\n{self.resumen}\n\n"
+        cierre = f"Usuario: {mensaje}\nAsistente:"
+
+        disponible = _config('CHAT_PRESUPUESTO_TOKENS', 2000) - estimar_tokens(encabezado + cierre)
+        recientes = self.historial[self.resumidos:][-_config('CHAT_TURNOS_RECIENTES', 6):]
+        incluidos = []
+        # Del más nuevo al más antiguo, mientras quepan en el presupuesto
+        for turno in reversed(recientes):
+            texto = _formatear_turno(turno)
+            costo = estimar_tokens(texto)
+            if costo > disponible:
+                break
+            disponible -= costo
+            incluidos.insert(0, texto)
+
+        return encabezado + ''.join(incluidos) + cierre
+
+    def agregar_turno(self, pregunta, respuesta):
+        """Guarda el turno, pliega los antiguos en el resumen y aplica los límites de la sesión"""
+        maximo = _config('CHAT_MAX_CARACTERES', 4000)
+        self.historial.append({
+            'pregunta': _recortar(pregunta, maximo),
+            'respuesta': (respuesta or '')[:maximo],
+        })
+
+        recientes = _config('CHAT_TURNOS_RECIENTES', 6)
+        while len(self.historial) - self.resumidos > recientes:
+            self._plegar(self.historial[self.resumidos])
+            self.resumidos += 1
+
+        guardados = max(_config('CHAT_TURNOS_GUARDADOS', 20), recientes)
+        if len(self.historial) > guardados:
+            descartados = len(self.historial) - guardados
+            self.historial = self.historial[descartados:]
+            self.resumidos = max(0, self.resumidos - descartados)
+
+        self.guardar()
+
+    def _plegar(self, turno):
+        """Agrega una línea por turno al resumen y descarta las más antiguas si supera su presupuesto"""
+        linea = (
+            f"- Usuario: {_recortar(turno.get('pregunta', ''), 160)} "
+            f"-> Asistente: {_recortar(_primera_oracion(turno.get('respuesta', '')), 200)}"
+        )
+        lineas = [l for l in self.resumen.split('\n') if l] + [linea]
+        maximo = _config('CHAT_RESUMEN_MAX_TOKENS', 400)
+        while len(lineas) > 1 and estimar_tokens('\n'.join(lineas)) > maximo:
+            lineas.pop(0)
+        self.resumen = '\n'.join(lineas)
+
+    def guardar(self):
+        self.session['chat_historial'] = self.historial
+        self.session['chat_resumen'] = self.resumen
+        self.session['chat_resumidos'] = self.resumidos
+
+
+class ContextoChatUsuario(ContextoChat):
+    """ContextoChat guardado en TurnoChat/EstadoChat del usuario, escribiendo solo los cambios"""
+
+    def __init__(self, user_id, session=None):
+        from .models import EstadoChat, TurnoChat
+
+        self.user_id = user_id
+        self.session = session
+        self.historial = list(
+            TurnoChat.objects.filter(user_id=user_id).order_by('id').values('id', 'pregunta', 'respuesta')
+        )
+        estado = EstadoChat.objects.filter(user_id=user_id).first()
+        self.resumen = estado.resumen if estado else ''
+        self.resumidos = min(estado.resumidos if estado else 0, len(self.historial))
+        self._guardado = (self.resumen, self.resumidos)
+        self._ids = [turno['id'] for turno in self.historial]
+        if session is not None and 'chat_historial' in session:
+            self._migrar_sesion(session)
+
+    def _migrar_sesion(self, session):
+        """Pasa a la base el historial que quedara en una sesión anterior a este cambio"""
+        historial = session.pop('chat_historial', None) or []
+        resumen = session.pop('chat_resumen', '')
+        resumidos = session.pop('chat_resumidos', 0)
+        if self.historial or not historial:
+            return
+        self.historial = [
+            {'pregunta': turno.get('pregunta', ''), 'respuesta': turno.get('respuesta', '')}
+            for turno in historial
+        ]
+        self.resumen = resumen
+        self.resumidos = min(resumidos, len(self.historial))
+        self.guardar()
+
+    def guardar(self):
+        from .models import EstadoChat, TurnoChat
+
+        vigentes = {turno['id'] for turno in self.historial if 'id' in turno}
+        descartados = [i for i in self._ids if i not in vigentes]
+        if descartados:
+            TurnoChat.objects.filter(id__in=descartados).delete()
+        nuevos = [turno for turno in self.historial if 'id' not in turno]
+        for turno in nuevos:
+            turno['id'] = TurnoChat.objects.create(
+                user_id=self.user_id, pregunta=turno['pregunta'], respuesta=turno['respuesta']
+            ).id
+        self._ids = [turno['id'] for turno in self.historial]
+
+        if (self.resumen, self.resumidos) != self._guardado:
+            EstadoChat.objects.update_or_create(
+                user_id=self.user_id, defaults={'resumen': self.resumen, 'resumidos': self.resumidos}
+            )
+            self._guardado = (self.resumen, self.resumidos)
@@ -0,0 +1,100 @@
+"""
+Estado de la partida de trivia fuera de la sesión.
+
+Antes la sesión guardaba la lista de preguntas respondidas (que crecía con
+cada respuesta) y con el backend de sesiones en base cada request volvía a
+serializar y escribir toda la fila de django_session. Ahora la partida
+vive en EstadoTrivia, una fila por usuario con las preguntas respondidas
+como bitset (un bit por id de pregunta), y al guardar solo se escriben los
+campos que cambiaron. La sesión vuelve a tener solo el id del usuario y
+banderas chicas.
+
+Las partidas que seguían en sesiones anteriores a este cambio se pasan a
+EstadoTrivia la primera vez que se usan (ver PartidaTrivia.del_request).
+"""
+from .models import EstadoTrivia
+
+
+# Claves que usaba la sesión antes de EstadoTrivia
+CLAVES_SESION = {
+    'puntos_trivia': 'puntos',
+    'fallos_trivia': 'fallos',
+    'pregunta_actual_id': 'pregunta_actual_id',
+}
+
+
+def a_bitset(ids):
+    """Bytes con el bit i encendido por cada id (little-endian por byte)"""
+    ids = [i for i in ids if i is not None and i >= 0]
+    if not ids:
+        return b''
+    bits = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        bits[i // 8] |= 1 << (i % 8)
+    return bytes(bits)
+
+
+def de_bitset(datos):
+    """Ids con el bit encendido en el bitset"""
+    return {
+        posicion * 8 + bit
+        for posicion, byte in enumerate(bytes(datos or b''))
+        if byte
+        for bit in range(8)
+        if byte & (1 << bit)
+    }
+
+
+class PartidaTrivia:
+    """Partida de trivia de un usuario; guardar() escribe solo lo que cambió"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        estado = EstadoTrivia.objects.filter(user_id=user_id).first()
+        self._existe = estado is not None
+        self.puntos = estado.puntos if estado else 0
+        self.fallos = estado.fallos if estado else 0
+        self.pregunta_actual_id = estado.pregunta_actual_id if estado else None
+        self.respondidas = de_bitset(estado.respondidas) if estado else set()
+        self._guardado = self._campos()
+
+    @classmethod
+    def del_request(cls, request):
+        """Partida del usuario de la sesión, pasando a la base la que quedara en la sesión"""
+        partida = cls(request.session['user_id'])
+        if any(clave in request.session for clave in list(CLAVES_SESION) + ['preguntas_respondidas']):
+            for clave, campo in CLAVES_SESION.items():
+                if clave in request.session:
+                    setattr(partida, campo, request.session.pop(clave))
+            partida.respondidas.update(request.session.pop('preguntas_respondidas', None) or [])
+            partida.guardar()
+        return partida
+
+    def _campos(self):
+        return {
+            'puntos': self.puntos,
+            'fallos': self.fallos,
+            'pregunta_actual_id': self.pregunta_actual_id,
+            'respondidas': a_bitset(self.respondidas),
+        }
+
+    def marcar_respondida(self, pregunta_id):
+        if pregunta_id is not None:
+            self.respondidas.add(pregunta_id)
+
+    def terminar(self):
+        """Deja la partida lista para empezar otra"""
+        self.puntos = 0
+        self.fallos = 0
+        self.respondidas = set()
+
+    def guardar(self):
+        campos = self._campos()
+        cambios = {campo: valor for campo, valor in campos.items() if self._guardado.get(campo) != valor}
+        if not self._existe:
+            EstadoTrivia.objects.update_or_create(user_id=self.user_id, defaults=campos)
+            self._existe = True
+        elif cambios:
+            EstadoTrivia.objects.filter(user_id=self.user_id).update(**cambios)
+        self._guardado = campos
+        return cambios
@@ -0,0 +1,262 @@
+"""
+Generación de una evaluación completa en una sola llamada a la IA.
+
+En vez de 7 prompts (5 categorías + brecha teórica y práctica) se pide un
+único JSON con todas las secciones, restringido por un esquema. La
+respuesta se lee en streaming con ParserEvaluacion, que valida y entrega
+cada pregunta apenas se cierra su objeto, así que si la llamada se corta o
+vence el límite de tiempo se recuperan las secciones (o partes) ya
+recibidas.
+"""
+import contextvars
+import json
+import threading
+from concurrent.futures import TimeoutError as FuturoTimeoutError
+
+from . import gemini
+
+
+CATEGORIAS_EVALUACION = ['presupuesto', 'ahorro', 'credito', 'inversiones', 'fraudes']
+SECCIONES_BRECHA = ['teorico', 'practico']
+
+DESCRIPCION_CATEGORIAS = {
+    'presupuesto': 'Presupuestos y planificación financiera',
+    'ahorro': 'Ahorro y gestión de ahorros',
+    'credito': 'Crédito, tarjetas de crédito y deudas',
+    'inversiones': 'Inversiones y productos financieros',
+    'fraudes': 'Fraudes digitales y seguridad financiera'
+}
+
+OPCIONES = ['A', 'B', 'C', 'D']
+
+ESQUEMA_PREGUNTA = {
+    'type': 'object',
+    'properties': {
+        'pregunta': {'type': 'string'},
+        'opciones': {
+            'type': 'object',
+            'properties': {letra: {'type': 'string'} for letra in OPCIONES},
+            'required': OPCIONES,
+        },
+        'respuesta_correcta': {'type': 'string', 'enum': OPCIONES},
+        'dificultad': {'type': 'string'},
+    },
+    'required': ['pregunta', 'opciones', 'respuesta_correcta'],
+}
+
+ESQUEMA_EVALUACION = {
+    'type': 'object',
+    'properties': {
+        seccion: {'type': 'array', 'items': ESQUEMA_PREGUNTA}
+        for seccion in CATEGORIAS_EVALUACION + SECCIONES_BRECHA
+    },
+    'required': CATEGORIAS_EVALUACION + SECCIONES_BRECHA,
+}
+
+
+def construir_prompt(cantidad_categoria=10, cantidad_brecha=5):
+    categorias = '\n'.join(
+        f'- "{categoria}": {cantidad_categoria} preguntas sobre {DESCRIPCION_CATEGORIAS[categoria]}'
+        for categoria in CATEGORIAS_EVALUACION
+    )
+    return f"""Genera una evaluación financiera completa para jóvenes en Perú.
+
+Secciones (cada una es una lista de preguntas de opción múltiple):
+{categorias}
+- "teorico": {cantidad_brecha} preguntas que evalúen el conocimiento teórico sobre conceptos financieros básicos
+- "practico": {cantidad_brecha} preguntas que evalúen cómo se aplican los conocimientos financieros en situaciones reales de la vida diaria
+
+Requisitos:
+- Cada pregunta debe tener exactamente 4 opciones (A, B, C, D) y solo una correcta
+- En las categorías, la dificultad debe variar: 2 muy fáciles, 3 fáciles, 3 intermedias, 2 complicadas
+- Las preguntas complicadas deben ser conocimientos que alguien con experiencia en el área sabría
+- Contexto: Perú, soles peruanos (S/.), sistema financiero peruano
+- No repitas preguntas entre secciones
+- Formato: un único objeto JSON con una clave por sección, en el orden indicado:
+{{
+  "presupuesto": [
+    {{
+      "pregunta": "Texto de la pregunta",
+      "opciones": {{"A": "Opción A", "B": "Opción B", "C": "Opción C", "D": "Opción D"}},
+      "respuesta_correcta": "A",
+      "dificultad": "muy_facil|facil|intermedia|complicada"
+    }}
+  ],
+  "ahorro": [...], "credito": [...], "inversiones": [...], "fraudes": [...],
+  "teorico": [...], "practico": [...]
+}}
+
+Responde SOLO con el JSON, sin texto adicional."""
+
+
+def validar_pregunta(pregunta):
+    """Devuelve la pregunta normalizada si tiene el formato esperado, o None"""
+    if not isinstance(pregunta, dict):
+        return None
+
+    texto = pregunta.get('pregunta')
+    opciones = pregunta.get('opciones')
+    correcta = str(pregunta.get('respuesta_correcta', '')).strip().upper()[:1]
+    if not isinstance(texto, str) or not texto.strip() or not isinstance(opciones, dict):
+        return None
+    if any(not isinstance(opciones.get(letra), str) or not opciones[letra].strip() for letra in OPCIONES):
+        return None
+    if correcta not in OPCIONES:
+        return None
+
+    validada = {
+        'pregunta': texto.strip(),
+        'opciones': {letra: opciones[letra].strip() for letra in OPCIONES},
+        'respuesta_correcta': correcta,
+    }
+    if pregunta.get('dificultad'):
+        validada['dificultad'] = pregunta['dificultad']
+    return validada
+
+
+class ParserEvaluacion:
+    """
+    Parser incremental del JSON de la evaluación.
+
+    Se le pasan fragmentos de texto con `alimentar()` y va extrayendo cada
+    objeto pregunta en cuanto se cierra, sin esperar al final del documento.
+    Ignora el texto previo al primer "{" (p. ej. un bloque ```json).
+    """
+
+    def __init__(self, secciones=None):
+        self.secciones_validas = set(secciones or CATEGORIAS_EVALUACION + SECCIONES_BRECHA)
+        self.preguntas = {}
+        self.completas = set()
+        self.descartadas = 0
+        self._lock = threading.Lock()
+        self._texto = ''
+        self._pos = 0
+        self._profundidad = 0
+        self._en_string = False
+        self._escape = False
+        self._inicio_string = None
+        self._clave = None
+        self._seccion = None
+        self._inicio_objeto = None
+
+    def alimentar(self, fragmento):
+        self._texto += fragmento
+        texto = self._texto
+        for i in range(self._pos, len(texto)):
+            c = texto[i]
+            if self._en_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._en_string = False
+                    if self._profundidad == 1:
+                        self._clave = self._leer(self._inicio_string, i + 1)
+                continue
+
+            if c == '"':
+                self._en_string = True
+                self._inicio_string = i
+            elif c in '{[':
+                self._profundidad += 1
+                if self._profundidad == 2 and c == '[' and self._clave in self.secciones_validas:
+                    self._seccion = self._clave
+                    with self._lock:
+                        self.preguntas.setdefault(self._seccion, [])
+                elif self._profundidad == 3 and c == '{' and self._seccion:
+                    self._inicio_objeto = i
+            elif c in '}]':
+                if self._profundidad == 3 and c == '}' and self._inicio_objeto is not None:
+                    self._agregar(self._leer(self._inicio_objeto, i + 1))
+                    self._inicio_objeto = None
+                elif self._profundidad == 2 and c == ']' and self._seccion:
+                    with self._lock:
+                        self.completas.add(self._seccion)
+                    self._seccion = None
+                self._profundidad = max(0, self._profundidad - 1)
+        self._pos = len(texto)
+
+    def _leer(self, inicio, fin):
+        try:
+            return json.loads(self._texto[inicio:fin])
+        except ValueError:
+            return None
+
+    def _agregar(self, pregunta):
+        validada = validar_pregunta(pregunta)
+        with self._lock:
+            if validada is None:
+                self.descartadas += 1
+            else:
+                self.preguntas[self._seccion].append(validada)
+
+    def resultado(self, minimo=1):
+        """
+        Copia de las preguntas válidas por sección (completas o parciales).
+        Las secciones con menos de `minimo` preguntas válidas se omiten.
+        """
+        with self._lock:
+            return {
+                seccion: list(preguntas)
+                for seccion, preguntas in self.preguntas.items()
+                if len(preguntas) >= minimo
+            }
+
+
+def generar_en_una_llamada(tiempo_limite=None, executor=None, cantidad_categoria=10, cantidad_brecha=5):
+    """
+    Pide la evaluación completa en una sola llamada en streaming.
+
+    Retorna (preguntas_evaluacion, preguntas_brecha) solo con las secciones
+    que llegaron con al menos la mitad de las preguntas pedidas; las demás
+    faltan y quien llama decide cómo completarlas. Si se pasa `executor`,
+    la lectura corre en ese pool y se respeta `tiempo_limite` devolviendo
+    lo recibido hasta ese momento; el stream se cierra en el siguiente
+    fragmento para no dejar ocupado al hilo hasta que el modelo termine.
+    """
+    parser = ParserEvaluacion()
+    cancelado = threading.Event()
+
+    def consumir():
+        stream = gemini.generar_contenido_stream(
+            construir_prompt(cantidad_categoria, cantidad_brecha),
+            familia='evaluacion',
+            generation_config={
+                'response_mime_type': 'application/json',
+                'response_schema': ESQUEMA_EVALUACION,
+            }
+        )
+        try:
+            for fragmento in stream:
+                if cancelado.is_set():
+                    break
+                parser.alimentar(fragmento)
+        finally:
+            stream.close()
+
+    try:
+        if executor is None:
+            consumir()
+        else:
+            # Copiar el contexto para que las métricas atribuyan la llamada a la vista
+            executor.submit(contextvars.copy_context().run, consumir).result(timeout=tiempo_limite)
+    except FuturoTimeoutError:
+        cancelado.set()
+        print("La evaluación en una llamada superó el límite de tiempo; se usan las secciones recibidas")
+    except Exception as e:
+        print(f"Error generando la evaluación en una llamada: {str(e)}")
+
+    if parser.descartadas:
+        print(f"Evaluación en una llamada: {parser.descartadas} preguntas inválidas descartadas")
+
+    secciones = parser.resultado()
+    preguntas_evaluacion = {
+        c: secciones[c][:cantidad_categoria] for c in CATEGORIAS_EVALUACION
+        if len(secciones.get(c, [])) >= (cantidad_categoria + 1) // 2
+    }
+    preguntas_brecha = {
+        t: secciones[t][:cantidad_brecha] for t in SECCIONES_BRECHA
+        if len(secciones.get(t, [])) >= (cantidad_brecha + 1) // 2
+    }
+    return preguntas_evaluacion, preguntas_brecha
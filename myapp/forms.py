@@ -4,6 +4,8 @@ from django import forms
 from .models import PaymentMethod
 import re
 import requests
+from django.conf import settings
+from . import http_cliente
 
 class PaymentMethodForm(forms.ModelForm):
     class Meta:
@@ -146,7 +148,12 @@ class RegisterForm(forms.ModelForm):
         url = f"https://emailvalidation.abstractapi.com/v1/?api_key={API_KEY}&email={email}"
 
         try:
-            response = requests.get(url, timeout=10)  # Agregar timeout
+            # Sin reintentos y con poca espera: el usuario está esperando el registro
+            response = http_cliente.get(
+                url,
+                timeout=getattr(settings, 'VALIDACION_EMAIL_TIMEOUT', 3),
+                reintentos=0
+            )
             
             # Verificar que la respuesta sea exitosa
             if response.status_code != 200:
@@ -0,0 +1,410 @@
+"""
+Registro compartido del modelo de Gemini.
+
+El modelo funcional se resuelve una sola vez por proceso (probando los
+candidatos en orden) y se reutiliza en todas las vistas. Solo se vuelve a
+sondear, en segundo plano, cuando se reportan fallos después de que el
+tiempo de vida (TTL) de la última verificación expiró.
+
+Todas las llamadas pasan por un circuit breaker y llevan un tiempo límite
+según su familia (chatbot, evaluacion, frase, ...). Tras
+GEMINI_CIRCUITO_FALLOS fallos seguidos el circuito se abre y las llamadas
+fallan al instante con CircuitoAbierto (las vistas usan sus alternativas
+locales); pasados GEMINI_CIRCUITO_ESPERA segundos se deja pasar una sola
+llamada de prueba (semiabierto) que decide si se cierra o vuelve a abrirse.
+
+Cada llamada se registra en myapp.metricas (latencia, errores y tokens por
+modelo y familia).
+"""
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from . import metricas
+
+
+MODELOS_POR_DEFECTO = [
+    'gemini-2.0-flash',
+    'gemini-2.0-flash-exp',
+    'gemini-1.5-flash',
+    'gemini-1.5-pro',
+    'gemini-pro',
+]
+
+# Si ningún modelo responde, no volver a sondear en cada request
+ESPERA_TRAS_RESOLUCION_FALLIDA = 60
+
+# Segundos máximos por llamada según la familia (GEMINI_TIEMPOS_LIMITE los sobrescribe)
+TIEMPOS_LIMITE_POR_DEFECTO = {
+    'sondeo': 10,
+    'chatbot': 30,
+    'evaluacion': 45,
+    'brecha': 20,
+    'frase': 15,
+    'verificacion': 8,
+}
+TIEMPO_LIMITE_GENERICO = 30
+
+
+class CircuitoAbierto(RuntimeError):
+    """La API de Gemini viene fallando: no se intenta la llamada"""
+
+
+_lock = threading.Lock()  # Solo para leer o escribir _estado/_circuito, nunca durante llamadas de red
+_lock_resolucion = threading.Lock()  # Una sola primera resolución a la vez
+_estado = {
+    'modelo': None,
+    'nombre': None,
+    'verificado_en': 0.0,
+    'fallido_en': 0.0,
+    'fallos': 0,
+    'sondeando': False,
+}
+
+_circuito = {
+    'estado': 'cerrado',  # cerrado | abierto | semiabierto
+    'fallos': 0,
+    'abierto_en': 0.0,
+    'prueba_en_curso': False,
+}
+
+
+def _api_key():
+    return getattr(settings, 'GEMINI_API_KEY', None)
+
+
+def _ttl():
+    return getattr(settings, 'GEMINI_MODELO_TTL', 600)
+
+
+def _candidatos():
+    return getattr(settings, 'GEMINI_MODELOS', MODELOS_POR_DEFECTO)
+
+
+def tiempo_limite(familia=None):
+    """Segundos máximos para una llamada de la familia dada"""
+    tiempos = dict(TIEMPOS_LIMITE_POR_DEFECTO)
+    tiempos.update(getattr(settings, 'GEMINI_TIEMPOS_LIMITE', {}))
+    return tiempos.get(familia, TIEMPO_LIMITE_GENERICO)
+
+
+def _con_tiempo_limite(familia, kwargs):
+    opciones = dict(kwargs.get('request_options') or {})
+    opciones.setdefault('timeout', tiempo_limite(familia))
+    kwargs['request_options'] = opciones
+    return kwargs
+
+
+# ============================================
+# CIRCUIT BREAKER
+# ============================================
+
+def _espera_circuito():
+    return getattr(settings, 'GEMINI_CIRCUITO_ESPERA', 30)
+
+
+def circuito_abierto():
+    """True si ahora mismo una llamada fallaría al instante (sin modificar el estado)"""
+    with _lock:
+        if _circuito['estado'] == 'abierto':
+            return time.monotonic() - _circuito['abierto_en'] < _espera_circuito()
+        if _circuito['estado'] == 'semiabierto':
+            return _circuito['prueba_en_curso']
+        return False
+
+
+def estado_circuito():
+    with _lock:
+        return _circuito['estado']
+
+
+def _permitir_llamada():
+    """Lanza CircuitoAbierto si no corresponde llamar; en semiabierto deja pasar una sola prueba"""
+    with _lock:
+        if _circuito['estado'] == 'cerrado':
+            return
+        if _circuito['estado'] == 'abierto':
+            if time.monotonic() - _circuito['abierto_en'] < _espera_circuito():
+                raise CircuitoAbierto("Circuito de Gemini abierto")
+            _circuito['estado'] = 'semiabierto'
+            _circuito['prueba_en_curso'] = False
+        if _circuito['prueba_en_curso']:
+            raise CircuitoAbierto("Circuito de Gemini semiabierto: ya hay una llamada de prueba")
+        _circuito['prueba_en_curso'] = True
+
+
+def _registrar_en_circuito(exito):
+    with _lock:
+        _circuito['prueba_en_curso'] = False
+        if exito:
+            _circuito['estado'] = 'cerrado'
+            _circuito['fallos'] = 0
+            return
+        _circuito['fallos'] += 1
+        if _circuito['estado'] == 'semiabierto' or _circuito['fallos'] >= getattr(settings, 'GEMINI_CIRCUITO_FALLOS', 5):
+            if _circuito['estado'] != 'abierto':
+                print(f"Circuito de Gemini abierto tras {_circuito['fallos']} fallos")
+            _circuito['estado'] = 'abierto'
+            _circuito['abierto_en'] = time.monotonic()
+
+
+def _resolver():
+    """Prueba los modelos candidatos en orden y devuelve (nombre, modelo) del primero que responde"""
+    import google.generativeai as genai
+
+    genai.configure(api_key=_api_key())
+
+    for modelo_nombre in _candidatos():
+        try:
+            modelo = genai.GenerativeModel(modelo_nombre)
+            # Una sola prueba mínima por proceso, no por request
+            with metricas.medir('gemini', f'{modelo_nombre}:sondeo'):
+                modelo.generate_content(
+                    "test",
+                    generation_config={'max_output_tokens': 1},
+                    request_options={'timeout': tiempo_limite('sondeo')}
+                )
+            return modelo_nombre, modelo
+        except Exception as e:
+            print(f"Modelo {modelo_nombre} no disponible: {str(e)}")
+            continue
+
+    return None, None
+
+
+def _guardar_resolucion(nombre, modelo):
+    ahora = time.monotonic()
+    if modelo is not None:
+        _estado['modelo'] = modelo
+        _estado['nombre'] = nombre
+        _estado['verificado_en'] = ahora
+        _estado['fallos'] = 0
+    else:
+        _estado['fallido_en'] = ahora
+
+
+def _sondear_en_segundo_plano():
+    try:
+        nombre, modelo = _resolver()
+        with _lock:
+            _guardar_resolucion(nombre, modelo)
+    except Exception as e:
+        print(f"Error re-sondeando modelos de Gemini: {str(e)}")
+    finally:
+        with _lock:
+            _estado['sondeando'] = False
+
+
+def obtener_modelo():
+    """Devuelve el modelo de Gemini resuelto para este proceso (o None si no hay ninguno disponible)"""
+    if not _api_key():
+        return None
+
+    with _lock:
+        if _estado['modelo'] is not None:
+            return _estado['modelo']
+        if time.monotonic() - _estado['fallido_en'] < ESPERA_TRAS_RESOLUCION_FALLIDA:
+            return None
+
+    # Primera resolución del proceso: se hace de forma síncrona y una sola a la
+    # vez (los demás requests esperan su resultado). _lock no se retiene durante
+    # el sondeo para que el circuit breaker siga respondiendo al instante.
+    with _lock_resolucion:
+        with _lock:
+            if _estado['modelo'] is not None:
+                return _estado['modelo']
+            if time.monotonic() - _estado['fallido_en'] < ESPERA_TRAS_RESOLUCION_FALLIDA:
+                return None
+        try:
+            nombre, modelo = _resolver()
+        except Exception as e:
+            print(f"Error configurando Gemini: {str(e)}")
+            nombre, modelo = None, None
+        with _lock:
+            _guardar_resolucion(nombre, modelo)
+        return modelo
+
+
+def nombre_modelo():
+    """Nombre del modelo resuelto actualmente (None si aún no se resolvió)"""
+    return _estado['nombre']
+
+
+def reportar_exito():
+    """Marca el modelo actual como sano tras una llamada exitosa"""
+    with _lock:
+        _estado['fallos'] = 0
+        _estado['verificado_en'] = time.monotonic()
+
+
+def reportar_fallo():
+    """
+    Registra un fallo del modelo actual. Si la última verificación ya expiró
+    (TTL), lanza un re-sondeo en segundo plano sin bloquear al request.
+    """
+    with _lock:
+        _estado['fallos'] += 1
+        vencido = time.monotonic() - _estado['verificado_en'] >= _ttl()
+        if not vencido or _estado['sondeando']:
+            return
+        _estado['sondeando'] = True
+
+    thread = threading.Thread(target=_sondear_en_segundo_plano)
+    thread.daemon = True
+    thread.start()
+
+
+def _operacion(familia):
+    return f"{nombre_modelo() or 'desconocido'}:{familia or 'general'}"
+
+
+def _tokens(prompt, respuesta, texto=None):
+    """Tokens de entrada y salida según usage_metadata, o estimados por caracteres si no vienen"""
+    from .contexto_chat import estimar_tokens
+
+    uso = getattr(respuesta, 'usage_metadata', None)
+    entrada = getattr(uso, 'prompt_token_count', None)
+    salida = getattr(uso, 'candidates_token_count', None)
+    if isinstance(entrada, int) and isinstance(salida, int):
+        return entrada, salida
+
+    if texto is None:
+        try:
+            texto = respuesta.text
+        except Exception:
+            texto = ''
+    return (
+        estimar_tokens(prompt if isinstance(prompt, str) else ''),
+        estimar_tokens(texto if isinstance(texto, str) else '')
+    )
+
+
+def generar_contenido(prompt, familia=None, **kwargs):
+    """
+    Llama a generate_content con el modelo compartido, con el tiempo límite
+    de la familia y a través del circuit breaker, y reporta el resultado al
+    registro. Devuelve la respuesta de Gemini; lanza la excepción original
+    si la llamada falla, CircuitoAbierto si el circuito no la deja pasar y
+    RuntimeError si no hay modelo disponible.
+    """
+    modelo = obtener_modelo()
+    if modelo is None:
+        raise RuntimeError("No hay un modelo de Gemini disponible")
+
+    _permitir_llamada()
+    try:
+        with metricas.medir('gemini', _operacion(familia)) as llamada:
+            response = modelo.generate_content(prompt, **_con_tiempo_limite(familia, kwargs))
+            llamada.tokens(*_tokens(prompt, response))
+    except Exception:
+        _registrar_en_circuito(False)
+        reportar_fallo()
+        raise
+
+    _registrar_en_circuito(True)
+    reportar_exito()
+    return response
+
+
+def generar_contenido_stream(prompt, familia=None, **kwargs):
+    """
+    Igual que generar_contenido pero con stream=True: va devolviendo el texto
+    de cada fragmento a medida que llega. El éxito se reporta al terminar el
+    stream y el fallo en cuanto se corta con error.
+    """
+    modelo = obtener_modelo()
+    if modelo is None:
+        raise RuntimeError("No hay un modelo de Gemini disponible")
+
+    _permitir_llamada()
+    terminado = False
+    try:
+        with metricas.medir('gemini', _operacion(familia)) as llamada:
+            fragmento, partes = None, []
+            for fragmento in modelo.generate_content(prompt, stream=True, **_con_tiempo_limite(familia, kwargs)):
+                try:
+                    texto = fragmento.text
+                except ValueError:
+                    # Fragmento sin partes de texto (p. ej. solo metadatos)
+                    continue
+                if texto:
+                    partes.append(texto)
+                    yield texto
+            # El último fragmento trae el uso de tokens de toda la respuesta
+            llamada.tokens(*_tokens(prompt, fragmento, ''.join(p for p in partes if isinstance(p, str))))
+        terminado = True
+    except Exception:
+        _registrar_en_circuito(False)
+        reportar_fallo()
+        raise
+    finally:
+        if not terminado:
+            # El consumidor abandonó el stream: liberar la prueba del semiabierto
+            with _lock:
+                _circuito['prueba_en_curso'] = False
+
+    _registrar_en_circuito(True)
+    reportar_exito()
+
+
+def extraer_json(texto):
+    """Convierte el texto de la IA en JSON, quitando el bloque markdown si lo trae"""
+    texto = texto.strip()
+    if texto.startswith('```'):
+        texto = texto.split('```')[1]
+        if texto.startswith('json'):
+            texto = texto[4:]
+    return json.loads(texto.strip())
+
+
+def generar_json(prompt, familia=None, **kwargs):
+    """
+    Genera una respuesta y la devuelve ya parseada como JSON.
+    
+    Si la familia de prompts tiene TTL en la caché persistente, primero se
+    busca ahí la respuesta para (modelo, prompt, parámetros). Solo se guardan
+    en caché respuestas que son JSON válido.
+    """
+    from . import cache_ia
+
+    usar_cache = familia is not None and cache_ia.ttl_familia(familia) > 0
+    if usar_cache:
+        if obtener_modelo() is None:
+            raise RuntimeError("No hay un modelo de Gemini disponible")
+        try:
+            texto = cache_ia.obtener(familia, nombre_modelo(), prompt, kwargs)
+            if texto is not None:
+                return extraer_json(texto)
+        except Exception as e:
+            print(f"Error leyendo la caché de IA: {str(e)}")
+
+    texto = generar_contenido(prompt, familia=familia, **kwargs).text
+    datos = extraer_json(texto)
+
+    if usar_cache:
+        try:
+            cache_ia.guardar(familia, nombre_modelo(), prompt, texto, kwargs)
+        except Exception as e:
+            print(f"Error guardando en la caché de IA: {str(e)}")
+    return datos
+
+
+def reiniciar():
+    """Olvida el modelo resuelto (útil en tests o tras cambiar la API key)"""
+    with _lock:
+        _estado.update({
+            'modelo': None,
+            'nombre': None,
+            'verificado_en': 0.0,
+            'fallido_en': 0.0,
+            'fallos': 0,
+            'sondeando': False,
+        })
+        _circuito.update({
+            'estado': 'cerrado',
+            'fallos': 0,
+            'abierto_en': 0.0,
+            'prueba_en_curso': False,
+        })
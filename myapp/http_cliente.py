@@ -0,0 +1,102 @@
+"""
+Cliente HTTP compartido para todas las llamadas salientes (Twelve Data,
+validación de correos, etc.).
+
+- Una `requests.Session` por host, con conexiones keep-alive reutilizables
+  (sin repetir el handshake TLS en cada request).
+- Timeouts de conexión y lectura por defecto (HTTP_TIMEOUT_CONEXION y
+  HTTP_TIMEOUT_LECTURA), así un servicio lento no deja un worker colgado.
+- Reintentos acotados (HTTP_REINTENTOS) ante errores de conexión, timeouts
+  y respuestas 429/5xx, con espera exponencial y jitter.
+- Máximo de requests simultáneos por host (HTTP_MAX_POR_HOST); si no hay
+  lugar en HTTP_ESPERA_LUGAR segundos se lanza HostSaturado.
+
+Los errores son los de `requests` (HostSaturado hereda de
+ConnectionError), así el código que ya captura RequestException no cambia.
+"""
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+ESTADOS_REINTENTABLES = frozenset({429, 500, 502, 503, 504})
+
+_lock = threading.Lock()
+_sesiones = {}  # host -> requests.Session
+_lugares = {}  # host -> BoundedSemaphore
+
+
+class HostSaturado(requests.exceptions.ConnectionError):
+    """El host ya tiene HTTP_MAX_POR_HOST requests en curso"""
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def _host(url):
+    partes = urlsplit(url)
+    return f'{partes.scheme}://{partes.netloc}'
+
+
+def sesion(url):
+    """Sesión (y pool de conexiones) del host de la URL"""
+    host = _host(url)
+    with _lock:
+        if host not in _sesiones:
+            maximo = _config('HTTP_MAX_POR_HOST', 8)
+            nueva = requests.Session()
+            nueva.mount(host, HTTPAdapter(pool_connections=1, pool_maxsize=maximo))
+            _sesiones[host] = nueva
+            _lugares[host] = threading.BoundedSemaphore(maximo)
+        return _sesiones[host], _lugares[host]
+
+
+def espera_reintento(intento):
+    """Segundos antes del reintento número `intento` (1, 2...): exponencial con jitter"""
+    base = _config('HTTP_ESPERA_BASE', 0.2)
+    return base * 2 ** (intento - 1) + random.uniform(0, base)
+
+
+def get(url, params=None, headers=None, timeout=None, reintentos=None):
+    """
+    GET con la sesión del host, timeouts por defecto y reintentos. Devuelve
+    la última respuesta (aunque sea 429/5xx) o lanza la última excepción.
+    """
+    sesion_host, lugares = sesion(url)
+    if timeout is None:
+        timeout = (_config('HTTP_TIMEOUT_CONEXION', 3.05), _config('HTTP_TIMEOUT_LECTURA', 10))
+    if reintentos is None:
+        reintentos = _config('HTTP_REINTENTOS', 2)
+
+    intento = 0
+    while True:
+        if not lugares.acquire(timeout=_config('HTTP_ESPERA_LUGAR', 5)):
+            raise HostSaturado(f"Demasiados requests simultáneos a {_host(url)}")
+        try:
+            response = sesion_host.get(url, params=params, headers=headers, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if intento >= reintentos:
+                raise
+        else:
+            if response.status_code not in ESTADOS_REINTENTABLES or intento >= reintentos:
+                return response
+            response.close()
+        finally:
+            lugares.release()
+        intento += 1
+        time.sleep(espera_reintento(intento))
+
+
+def reiniciar():
+    """Cierra las sesiones abiertas (útil en tests o al cambiar la configuración)"""
+    with _lock:
+        for sesion_host in _sesiones.values():
+            sesion_host.close()
+        _sesiones.clear()
+        _lugares.clear()
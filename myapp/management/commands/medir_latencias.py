@@ -0,0 +1,194 @@
+"""
+Comando de management que mide la latencia de las vistas de IA e
+inversiones contra backends falsos (sin API keys ni red).
+
+Levanta el Gemini falso en proceso y el servidor falso de Twelve Data,
+recorre los flujos de un usuario (evaluación, chatbot, completar frases e
+inversiones) con el cliente de pruebas de Django y muestra p50/p95/p99 por
+vista. Todo se ejecuta dentro de una transacción que se revierte al final,
+así que no deja datos en la base.
+"""
+import io
+import json
+import math
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from myapp import backends_falsos, precios
+from myapp.evaluacion_ia import CATEGORIAS_EVALUACION
+from myapp.models import FraseCompletar, UserProfile
+
+
+PERCENTILES = [50, 95, 99]
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano (valores no vacíos)"""
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+class Medidor:
+    """Ejecuta requests con el cliente de pruebas y guarda su duración por vista"""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self.tiempos = defaultdict(list)
+        self.errores = defaultdict(int)
+
+    def medir(self, metodo, nombre_url, datos=None):
+        etiqueta = f'{metodo} {nombre_url}'
+        inicio = time.perf_counter()
+        try:
+            response = getattr(self.cliente, metodo.lower())(reverse(nombre_url), datos or {})
+            if response.streaming:
+                # El tiempo incluye recibir el stream completo
+                b''.join(response.streaming_content)
+        except Exception:
+            self.errores[etiqueta] += 1
+            response = None
+        else:
+            if response.status_code >= 500:
+                self.errores[etiqueta] += 1
+        self.tiempos[etiqueta].append((time.perf_counter() - inicio) * 1000)
+        return response
+
+    def resumen(self):
+        return {
+            etiqueta: {
+                'n': len(tiempos),
+                'errores': self.errores[etiqueta],
+                **{f'p{p}': round(percentil(tiempos, p), 1) for p in PERCENTILES},
+            }
+            for etiqueta, tiempos in sorted(self.tiempos.items())
+        }
+
+
+def flujo_evaluacion(medidor):
+    medidor.medir('GET', 'evaluacion_view')
+    respuestas = {f'pregunta_{c}_{i}': 'A' for c in CATEGORIAS_EVALUACION for i in range(10)}
+    respuestas.update({f'brecha_teorico_{i}': 'A' for i in range(5)})
+    respuestas.update({f'brecha_practico_{i}': 'A' for i in range(5)})
+    medidor.medir('POST', 'evaluacion_view', respuestas)
+
+
+def flujo_chat(medidor):
+    medidor.medir('POST', 'chatbot', {'mensaje': '¿Cómo empiezo a ahorrar?'})
+    medidor.medir('POST', 'chatbot_stream', {'mensaje': '¿Y cuánto debería ahorrar cada mes?'})
+
+
+def flujo_frases(medidor):
+    medidor.medir('GET', 'completar_frases')
+    medidor.medir('POST', 'completar_frases', {'respuesta': 'ahorro'})
+
+
+def flujo_inversiones(medidor):
+    medidor.medir('POST', 'investments', {'company': 'AAPL', 'shares': 1})
+    medidor.medir('GET', 'investments')
+
+
+FLUJOS = {
+    'evaluacion': flujo_evaluacion,
+    'chat': flujo_chat,
+    'frases': flujo_frases,
+    'inversiones': flujo_inversiones,
+}
+
+
+class Command(BaseCommand):
+    help = 'Mide p50/p95/p99 de las vistas de IA e inversiones contra Gemini y Twelve Data falsos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=20, help='Veces que se recorre cada flujo.')
+        parser.add_argument(
+            '--flujos',
+            default=','.join(FLUJOS),
+            help=f'Flujos a medir separados por comas ({", ".join(FLUJOS)}).',
+        )
+        parser.add_argument('--latencia-ia', type=float, default=300, help='Latencia del Gemini falso en ms.')
+        parser.add_argument('--latencia-precios', type=float, default=80, help='Latencia del Twelve Data falso en ms.')
+        parser.add_argument('--variacion', type=float, default=0.3, help='Variación al azar de las latencias (fracción).')
+        parser.add_argument('--tasa-fallo', type=float, default=0.0, help='Probabilidad de fallo de cada llamada (0 a 1).')
+        parser.add_argument('--semilla', type=int, default=None, help='Semilla para que las corridas sean repetibles.')
+        parser.add_argument('--json', action='store_true', help='Muestra el resultado en JSON.')
+
+    def handle(self, *args, **options):
+        flujos = [f.strip() for f in options['flujos'].split(',') if f.strip()]
+        desconocidos = set(flujos) - set(FLUJOS)
+        if desconocidos:
+            raise CommandError(f'Flujos desconocidos: {", ".join(sorted(desconocidos))}')
+
+        def config(latencia_ms):
+            return backends_falsos.ConfigFalsa(
+                latencia=latencia_ms / 1000,
+                variacion=latencia_ms / 1000 * options['variacion'],
+                tasa_fallo=options['tasa_fallo'],
+                semilla=options['semilla'],
+            )
+
+        with backends_falsos.ServidorTwelveData(config(options['latencia_precios'])) as servidor, \
+                override_settings(
+                    GEMINI_API_KEY='clave-falsa',
+                    TWELVE_API_KEY='clave-falsa',
+                    TWELVE_DATA_URL=servidor.url,
+                    TAREAS_MODO='comando',
+                    ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver'],
+                ), \
+                backends_falsos.gemini_falso(config(options['latencia_ia'])) as genai:
+            # Empezar sin precios en memoria para medir también la primera consulta
+            precios.reiniciar()
+            with transaction.atomic():
+                medidor = self.recorrer(flujos, options['iteraciones'])
+                transaction.set_rollback(True)
+            llamadas_ia = sum(modelo.llamadas for modelo in genai.modelos)
+            llamadas_precios = len(servidor.solicitudes)
+
+        resumen = medidor.resumen()
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'vistas': resumen,
+                'llamadas_ia': llamadas_ia,
+                'llamadas_precios': llamadas_precios,
+            }, indent=2))
+            return
+
+        self.stdout.write(f'{"Vista":<28}{"n":>6}{"errores":>9}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+        for etiqueta, datos in resumen.items():
+            self.stdout.write(
+                f'{etiqueta:<28}{datos["n"]:>6}{datos["errores"]:>9}'
+                f'{datos["p50"]:>10.1f}{datos["p95"]:>10.1f}{datos["p99"]:>10.1f}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Llamadas a la IA: {llamadas_ia} · consultas de precios: {llamadas_precios}'
+        ))
+
+    def recorrer(self, flujos, iteraciones):
+        if not FraseCompletar.objects.exists():
+            call_command('populate_frases_completar', stdout=io.StringIO())
+
+        user = UserProfile.objects.create(
+            email=f'latencias-{time.time_ns()}@example.com',
+            password=make_password(None),
+            first_name='Benchmark',
+            last_name='Latencias'
+        )
+        cliente = Client(raise_request_exception=False)
+        session = cliente.session
+        session['user_id'] = user.id
+        session.save()
+
+        medidor = Medidor(cliente)
+        for _ in range(iteraciones):
+            for nombre in flujos:
+                FLUJOS[nombre](medidor)
+        return medidor
@@ -0,0 +1,54 @@
+"""
+Comando de management para ver las métricas de las llamadas a servicios
+externos (Gemini y Twelve Data) acumuladas por todos los procesos
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from myapp import metricas
+
+
+class Command(BaseCommand):
+    help = 'Muestra llamadas, errores, latencias y tokens de las llamadas a Gemini y Twelve Data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--por',
+            choices=['operacion', 'vista'],
+            default='operacion',
+            help='Agrupar por servicio y operación (modelo:familia o endpoint) o por vista.',
+        )
+        parser.add_argument('--json', action='store_true', help='Muestra el resultado en JSON.')
+        parser.add_argument('--reiniciar', action='store_true', help='Borra las métricas acumuladas.')
+
+    def handle(self, *args, **options):
+        if options['reiniciar']:
+            metricas.reiniciar()
+            self.stdout.write(self.style.SUCCESS('Métricas borradas.'))
+            return
+
+        filas = metricas.resumen(options['por'])
+        if options['json']:
+            self.stdout.write(json.dumps(filas, indent=2, ensure_ascii=False))
+            return
+
+        if not filas:
+            self.stdout.write(self.style.WARNING('Todavía no hay métricas registradas.'))
+            return
+
+        self.stdout.write(
+            f'{"Clave":<45}{"llamadas":>9}{"errores":>9}{"total s":>10}'
+            f'{"prom ms":>9}{"p95 ms":>9}{"tokens ent":>11}{"tokens sal":>11}'
+        )
+        for fila in filas:
+            errores = sum(fila['errores'].values())
+            p95 = fila['p95_ms'] if fila['p95_ms'] is not None else 0
+            self.stdout.write(
+                f'{fila["clave"][:44]:<45}{fila["llamadas"]:>9}{errores:>9}'
+                f'{fila["tiempo_total_ms"] / 1000:>10.1f}{fila["tiempo_promedio_ms"]:>9.0f}{p95:>9.0f}'
+                f'{fila["tokens_entrada"]:>11}{fila["tokens_salida"]:>11}'
+            )
+            if fila['errores']:
+                detalle = ', '.join(f'{clase}: {cantidad}' for clase, cantidad in sorted(fila['errores'].items()))
+                self.stdout.write(f'    errores -> {detalle}')
@@ -3,6 +3,7 @@ Comando de management para poblar la base de datos con frases de economía para
 """
 from django.core.management.base import BaseCommand
 from myapp.models import FraseCompletar
+from myapp.pool import hash_contenido
 
 
 class Command(BaseCommand):
@@ -463,8 +464,9 @@ class Command(BaseCommand):
         existentes = 0
         
         for frase_data in frases_data:
+            # Por hash: una frase que solo cambia en mayúsculas o espacios ya existe
             obj, created = FraseCompletar.objects.get_or_create(
-                frase_completa=frase_data['frase_completa'],
+                hash_contenido=hash_contenido(frase_data['frase_completa'], frase_data['palabra_clave']),
                 defaults=frase_data
             )
             if created:
@@ -0,0 +1,50 @@
+"""
+Comando de management que actualiza la caché de precios de todos los
+símbolos con inversiones, con llamadas agrupadas a Twelve Data, y agrega
+los precios nuevos a la serie histórica (PriceSnapshot). Pensado para
+correr periódicamente (cron) y que las páginas de inversiones no tengan
+que esperar a la API. Al final compacta los puntos viejos de la serie.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp import portafolio, precios
+
+
+class Command(BaseCommand):
+    help = 'Actualiza los precios en caché y el historial de todos los símbolos con inversiones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sin-compactar',
+            action='store_true',
+            help='No reduce los puntos viejos del historial a uno por hora o por día.',
+        )
+        parser.add_argument(
+            '--solo-compactar',
+            action='store_true',
+            help='Solo compacta el historial, sin consultar la API.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['solo_compactar']:
+            self.refrescar()
+        if not options['sin_compactar']:
+            borrados = precios.compactar()
+            self.stdout.write(f'Puntos de historial compactados: {borrados}')
+
+    def refrescar(self):
+        if not getattr(settings, 'TWELVE_API_KEY', None):
+            raise CommandError('TWELVE_API_KEY no está configurada.')
+
+        cotizaciones = portafolio.refrescar_todos()
+        if not cotizaciones:
+            self.stdout.write(self.style.WARNING('No hay inversiones registradas.'))
+            return
+
+        sin_precio = sorted(simbolo for simbolo, precio in cotizaciones.items() if precio is None)
+        self.stdout.write(self.style.SUCCESS(
+            f'Precios actualizados: {len(cotizaciones) - len(sin_precio)} de {len(cotizaciones)} símbolos.'
+        ))
+        if sin_precio:
+            self.stdout.write(self.style.WARNING(f'Sin precio: {", ".join(sin_precio)}'))
@@ -0,0 +1,62 @@
+"""
+Comando de management para procesar la cola de trabajos en segundo plano
+con un número fijo de hilos (usar con TAREAS_MODO = 'comando')
+"""
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp import tareas
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de trabajos en segundo plano (generación de evaluaciones y frases) con un pool fijo de hilos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=None,
+            help='Cantidad de hilos trabajadores (por defecto TAREAS_HILOS).',
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesa los trabajos listos y termina, sin quedarse escuchando la cola.',
+        )
+        parser.add_argument(
+            '--estado',
+            action='store_true',
+            help='Solo muestra la profundidad de la cola y termina.',
+        )
+
+    def mostrar_estado(self):
+        resumen = tareas.profundidad_cola()
+        if not resumen:
+            self.stdout.write(self.style.SUCCESS('La cola está vacía.'))
+            return
+        for tipo, estados in sorted(resumen.items()):
+            detalle = ', '.join(f'{estado}: {total}' for estado, total in sorted(estados.items()))
+            self.stdout.write(f'  {tipo}: {detalle}')
+
+    def handle(self, *args, **options):
+        if options['estado']:
+            self.mostrar_estado()
+            return
+
+        if options['una_vez']:
+            procesadas = tareas.procesar_pendientes()
+            self.stdout.write(self.style.SUCCESS(f'Trabajos procesados: {procesadas}'))
+            self.mostrar_estado()
+            return
+
+        detener = threading.Event()
+        hilos = tareas.iniciar_trabajadores(cantidad=options['hilos'], detener=detener)
+        self.stdout.write(self.style.SUCCESS(f'Procesando la cola con {len(hilos)} hilos. Ctrl+C para detener.'))
+        try:
+            while any(h.is_alive() for h in hilos):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Deteniendo trabajadores...'))
+            detener.set()
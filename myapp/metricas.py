@@ -0,0 +1,246 @@
+"""
+Métricas de las llamadas a servicios externos (Gemini, Twelve Data).
+
+Cada llamada se envuelve con `medir(servicio, operacion)`, que registra en
+memoria cantidad de llamadas, errores por clase, histograma de latencia y
+tokens de entrada/salida, agrupados por (servicio, operación, vista). La
+vista la fija MetricasVistaMiddleware para el request en curso, así se ve
+qué vistas gastan más tiempo esperando a servicios externos.
+
+Lo acumulado en memoria se suma cada METRICAS_INTERVALO segundos a la
+tabla MetricaLlamadaExterna (al terminar un request o un trabajo de la
+cola), así el comando `metricas_externas` y el endpoint de administración
+ven los datos de todos los procesos.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+
+# Límites superiores (ms) de los buckets del histograma; el último es "más"
+BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+SIN_VISTA = '(sin vista)'
+
+_vista_actual = contextvars.ContextVar('metricas_vista', default=None)
+
+_lock = threading.Lock()
+_pendientes = {}
+_ultimo_guardado = time.monotonic()
+
+
+def fijar_vista(nombre):
+    """Vista a la que se atribuyen las llamadas externas del contexto actual"""
+    _vista_actual.set(nombre)
+
+
+def vista_actual():
+    return _vista_actual.get() or SIN_VISTA
+
+
+def _bucket(ms):
+    for i, limite in enumerate(BUCKETS_MS):
+        if ms <= limite:
+            return i
+    return len(BUCKETS_MS)
+
+
+def _vacio():
+    return {
+        'llamadas': 0,
+        'errores': {},
+        'tiempo_total_ms': 0.0,
+        'tiempo_max_ms': 0.0,
+        'histograma': [0] * (len(BUCKETS_MS) + 1),
+        'tokens_entrada': 0,
+        'tokens_salida': 0,
+    }
+
+
+def registrar(servicio, operacion, ms, error=None, tokens_entrada=0, tokens_salida=0, vista=None):
+    """Suma una llamada a las métricas en memoria"""
+    clave = (servicio, operacion, vista or vista_actual())
+    with _lock:
+        datos = _pendientes.setdefault(clave, _vacio())
+        datos['llamadas'] += 1
+        datos['tiempo_total_ms'] += ms
+        datos['tiempo_max_ms'] = max(datos['tiempo_max_ms'], ms)
+        datos['histograma'][_bucket(ms)] += 1
+        datos['tokens_entrada'] += tokens_entrada or 0
+        datos['tokens_salida'] += tokens_salida or 0
+        if error:
+            datos['errores'][error] = datos['errores'].get(error, 0) + 1
+
+
+class Llamada:
+    """Datos que la llamada en curso agrega antes de terminar (estado HTTP, tokens)"""
+
+    def __init__(self):
+        self.error = None
+        self.tokens_entrada = 0
+        self.tokens_salida = 0
+
+    def estado_http(self, codigo):
+        if isinstance(codigo, int) and codigo >= 400:
+            self.error = f'HTTP {codigo}'
+
+    def respuesta_twelve_data(self, datos):
+        """Twelve Data informa algunos errores (p. ej. límite de créditos) con estado 200"""
+        if isinstance(datos, dict) and datos.get('status') == 'error':
+            self.error = f"API {datos.get('code', 'error')}"
+
+    def tokens(self, entrada, salida):
+        self.tokens_entrada = entrada
+        self.tokens_salida = salida
+
+
+@contextmanager
+def medir(servicio, operacion):
+    """
+    Mide la llamada externa del bloque. Una excepción se registra con su
+    clase como error y se vuelve a lanzar.
+    """
+    llamada = Llamada()
+    inicio = time.perf_counter()
+    try:
+        yield llamada
+    except Exception as e:
+        llamada.error = type(e).__name__
+        raise
+    finally:
+        registrar(
+            servicio, operacion, (time.perf_counter() - inicio) * 1000,
+            error=llamada.error,
+            tokens_entrada=llamada.tokens_entrada,
+            tokens_salida=llamada.tokens_salida
+        )
+
+
+# ============================================
+# PERSISTENCIA
+# ============================================
+
+def _combinar(destino, origen):
+    destino['llamadas'] += origen['llamadas']
+    destino['tiempo_total_ms'] += origen['tiempo_total_ms']
+    destino['tiempo_max_ms'] = max(destino['tiempo_max_ms'], origen['tiempo_max_ms'])
+    destino['tokens_entrada'] += origen['tokens_entrada']
+    destino['tokens_salida'] += origen['tokens_salida']
+    histograma = list(destino['histograma'] or [])
+    histograma += [0] * (len(origen['histograma']) - len(histograma))
+    destino['histograma'] = [a + b for a, b in zip(histograma, origen['histograma'])]
+    errores = dict(destino['errores'] or {})
+    for clase, cantidad in origen['errores'].items():
+        errores[clase] = errores.get(clase, 0) + cantidad
+    destino['errores'] = errores
+
+
+def guardar():
+    """Suma lo acumulado en memoria a MetricaLlamadaExterna y vacía la memoria"""
+    global _ultimo_guardado
+    from .models import MetricaLlamadaExterna
+
+    with _lock:
+        pendientes = dict(_pendientes)
+        _pendientes.clear()
+        _ultimo_guardado = time.monotonic()
+    if not pendientes:
+        return 0
+
+    try:
+        with transaction.atomic():
+            for (servicio, operacion, vista), datos in pendientes.items():
+                fila, _ = MetricaLlamadaExterna.objects.select_for_update().get_or_create(
+                    servicio=servicio, operacion=operacion, vista=vista
+                )
+                actual = {campo: getattr(fila, campo) for campo in _vacio()}
+                _combinar(actual, datos)
+                for campo, valor in actual.items():
+                    setattr(fila, campo, valor)
+                fila.save()
+    except Exception as e:
+        print(f"Error guardando métricas de llamadas externas: {str(e)}")
+        # Devolver lo pendiente a memoria para el próximo intento
+        with _lock:
+            for clave, datos in pendientes.items():
+                _combinar(_pendientes.setdefault(clave, _vacio()), datos)
+        return 0
+    return len(pendientes)
+
+
+def guardar_si_corresponde():
+    """Guarda si pasaron METRICAS_INTERVALO segundos desde el último guardado"""
+    if not _pendientes:
+        return 0
+    if time.monotonic() - _ultimo_guardado < getattr(settings, 'METRICAS_INTERVALO', 60):
+        return 0
+    return guardar()
+
+
+def reiniciar():
+    """Borra las métricas en memoria y en la base"""
+    from .models import MetricaLlamadaExterna
+
+    with _lock:
+        _pendientes.clear()
+    MetricaLlamadaExterna.objects.all().delete()
+
+
+# ============================================
+# RESUMEN
+# ============================================
+
+def percentil_histograma(histograma, p, maximo=None):
+    """
+    Límite superior (ms) del bucket donde cae el percentil p; en el último
+    bucket (sin límite) devuelve `maximo`. None si no hay datos.
+    """
+    total = sum(histograma)
+    if not total:
+        return None
+    objetivo = p / 100 * total
+    acumulado = 0
+    for i, cantidad in enumerate(histograma[:len(BUCKETS_MS)]):
+        acumulado += cantidad
+        if acumulado >= objetivo:
+            return BUCKETS_MS[i]
+    return maximo
+
+
+def resumen(por='operacion'):
+    """
+    Métricas agregadas de la base (incluye lo pendiente de este proceso),
+    por 'operacion' (servicio y operación) o por 'vista', ordenadas por
+    tiempo total descendente.
+    """
+    from .models import MetricaLlamadaExterna
+
+    guardar()
+    grupos = {}
+    for fila in MetricaLlamadaExterna.objects.all():
+        clave = fila.vista if por == 'vista' else f'{fila.servicio} {fila.operacion}'
+        datos = grupos.setdefault(clave, _vacio())
+        _combinar(datos, {campo: getattr(fila, campo) for campo in _vacio()})
+
+    resultado = []
+    for clave, datos in grupos.items():
+        llamadas = datos['llamadas']
+        resultado.append({
+            'clave': clave,
+            'llamadas': llamadas,
+            'errores': datos['errores'],
+            'tiempo_total_ms': round(datos['tiempo_total_ms'], 1),
+            'tiempo_promedio_ms': round(datos['tiempo_total_ms'] / llamadas, 1) if llamadas else 0,
+            'tiempo_max_ms': round(datos['tiempo_max_ms'], 1),
+            'p50_ms': percentil_histograma(datos['histograma'], 50, round(datos['tiempo_max_ms'], 1)),
+            'p95_ms': percentil_histograma(datos['histograma'], 95, round(datos['tiempo_max_ms'], 1)),
+            'p99_ms': percentil_histograma(datos['histograma'], 99, round(datos['tiempo_max_ms'], 1)),
+            'histograma': dict(zip([str(b) for b in BUCKETS_MS] + ['mas'], datos['histograma'])),
+            'tokens_entrada': datos['tokens_entrada'],
+            'tokens_salida': datos['tokens_salida'],
+        })
+    return sorted(resultado, key=lambda r: r['tiempo_total_ms'], reverse=True)
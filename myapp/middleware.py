@@ -0,0 +1,46 @@
+"""
+Middleware de la aplicación.
+"""
+from django.conf import settings
+from django.db import connection
+from django.utils.functional import SimpleLazyObject
+
+from . import metricas, perfil
+
+
+class MetricasVistaMiddleware:
+    """
+    Atribuye las llamadas externas (Gemini, Twelve Data) a la vista del
+    request y guarda periódicamente las métricas acumuladas.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metricas.fijar_vista(None)
+        response = self.get_response(request)
+        metricas.guardar_si_corresponde()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        metricas.fijar_vista(match.view_name if match and match.view_name else view_func.__name__)
+        return None
+
+
+class PerfilMiddleware:
+    """
+    Deja en request.profile el UserProfile de la sesión, cargado de forma
+    perezosa una sola vez por request (ver perfil.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: perfil.obtener_o_error(request))
+        if not getattr(settings, 'PERFIL_VERIFICAR_CONSULTAS', False):
+            return self.get_response(request)
+        with connection.execute_wrapper(perfil.VerificadorConsultas(request)):
+            return self.get_response(request)
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0023_fraudpreventioncontent_visualizaciones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RespuestaIACache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('familia', models.CharField(db_index=True, max_length=50)),
+                ('modelo', models.CharField(max_length=100)),
+                ('respuesta', models.TextField()),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('expira_en', models.DateTimeField()),
+                ('ultimo_acceso', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('aciertos', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:31
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0024_respuestaiacache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaSegundoPlano',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('clave', models.CharField(max_length=100)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('intentos', models.IntegerField(default=0)),
+                ('ejecutar_despues', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_error', models.TextField(blank=True, default='')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tareas', to='myapp.userprofile')),
+            ],
+            options={
+                'ordering': ['ejecutar_despues', 'id'],
+                'indexes': [models.Index(fields=['estado', 'ejecutar_despues'], name='myapp_tarea_estado_0b885c_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('estado__in', ['pendiente', 'en_proceso'])), fields=('clave',), name='tarea_activa_unica_por_clave')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def pasar_pendientes_al_pool(apps, schema_editor):
+    """Las pre-generadas privadas que nadie usó pasan al pool compartido"""
+    for nombre in ('PregeneradaEvaluacion', 'PregeneradaFraseCompletar'):
+        modelo = apps.get_model('myapp', nombre)
+        modelo.objects.filter(usada=False, user__isnull=False).update(user=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0025_tareasegundoplano'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pregeneradaevaluacion',
+            name='hash_contenido',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='pregeneradaevaluacion',
+            name='hashes_preguntas',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='pregeneradaevaluacion',
+            name='usada_por',
+            field=models.ManyToManyField(blank=True, related_name='evaluaciones_pool_vistas', to='myapp.userprofile'),
+        ),
+        migrations.AddField(
+            model_name='pregeneradaevaluacion',
+            name='veces_servida',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pregeneradafrasecompletar',
+            name='hash_contenido',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='pregeneradafrasecompletar',
+            name='usada_por',
+            field=models.ManyToManyField(blank=True, related_name='frases_pool_vistas', to='myapp.userprofile'),
+        ),
+        migrations.AddField(
+            model_name='pregeneradafrasecompletar',
+            name='veces_servida',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='pregeneradaevaluacion',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pregeneradas_evaluaciones', to='myapp.userprofile'),
+        ),
+        migrations.AlterField(
+            model_name='pregeneradafrasecompletar',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pregeneradas_frases', to='myapp.userprofile'),
+        ),
+        migrations.RunPython(pasar_pendientes_al_pool, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:39
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0026_pool_compartido_pregeneradas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvaluacionServida',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('preguntas_evaluacion', models.JSONField()),
+                ('preguntas_brecha', models.JSONField()),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_respuesta', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='evaluaciones_servidas', to='myapp.userprofile')),
+            ],
+            options={
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:59
+
+import django.db.models.deletion
+import myapp.models
+from django.db import migrations, models
+
+
+def completar_banco(apps, schema_editor):
+    """
+    Calcula máscara, hash y orden al azar de las frases existentes y pasa
+    al banco las frases pre-generadas por la IA que no estaban repetidas.
+    """
+    from myapp.banco_frases import enmascarar
+    from myapp.pool import hash_contenido
+
+    FraseCompletar = apps.get_model('myapp', 'FraseCompletar')
+    PregeneradaFraseCompletar = apps.get_model('myapp', 'PregeneradaFraseCompletar')
+
+    vistos = set()
+    for frase in FraseCompletar.objects.all():
+        h = hash_contenido(frase.frase_completa, frase.palabra_clave)
+        frase.frase_con_espacio = enmascarar(frase.frase_completa, frase.palabra_clave)
+        frase.hash_contenido = h if h not in vistos else None
+        frase.orden = myapp.models.orden_aleatorio()
+        frase.save(update_fields=['frase_con_espacio', 'hash_contenido', 'orden'])
+        vistos.add(h)
+
+    for pregenerada in PregeneradaFraseCompletar.objects.all():
+        h = hash_contenido(pregenerada.frase_completa, pregenerada.palabra_clave)
+        if h in vistos:
+            continue
+        vistos.add(h)
+        frase_con_espacio = enmascarar(pregenerada.frase_completa, pregenerada.palabra_clave)
+        FraseCompletar.objects.create(
+            frase_completa=pregenerada.frase_completa,
+            palabra_clave=pregenerada.palabra_clave,
+            categoria='ia',
+            nivel_dificultad=2,
+            origen='ia',
+            activa=bool(frase_con_espacio),
+            frase_con_espacio=frase_con_espacio,
+            hash_contenido=h,
+            orden=myapp.models.orden_aleatorio()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0027_evaluacionservida'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frasecompletar',
+            name='frase_con_espacio',
+            field=models.TextField(blank=True, default='', help_text='Frase con la palabra clave ya oculta (se calcula al guardar)'),
+        ),
+        migrations.AddField(
+            model_name='frasecompletar',
+            name='hash_contenido',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='frasecompletar',
+            name='orden',
+            field=models.IntegerField(db_index=True, default=myapp.models.orden_aleatorio, help_text='Orden (al azar) en que los usuarios recorren el banco'),
+        ),
+        migrations.AddField(
+            model_name='frasecompletar',
+            name='origen',
+            field=models.CharField(choices=[('curada', 'Curada'), ('ia', 'Generada por IA')], default='curada', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='CursorFrasesCompletar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nivel', models.IntegerField(default=0)),
+                ('ultimo_orden', models.IntegerField(default=-1)),
+                ('ultimo_id', models.IntegerField(default=0)),
+                ('vueltas', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cursores_frases', to='myapp.userprofile')),
+            ],
+            options={
+                'unique_together': {('user', 'nivel')},
+            },
+        ),
+        migrations.RunPython(completar_banco, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='PregeneradaFraseCompletar',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0028_banco_frases_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricaLlamadaExterna',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('servicio', models.CharField(max_length=50)),
+                ('operacion', models.CharField(max_length=150)),
+                ('vista', models.CharField(max_length=150)),
+                ('llamadas', models.IntegerField(default=0)),
+                ('errores', models.JSONField(blank=True, default=dict)),
+                ('tiempo_total_ms', models.FloatField(default=0)),
+                ('tiempo_max_ms', models.FloatField(default=0)),
+                ('histograma', models.JSONField(blank=True, default=list)),
+                ('tokens_entrada', models.BigIntegerField(default=0)),
+                ('tokens_salida', models.BigIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('servicio', 'operacion', 'vista')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0029_metricallamadaexterna'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CotizacionCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('simbolo', models.CharField(max_length=10, unique=True)),
+                ('precio', models.FloatField()),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
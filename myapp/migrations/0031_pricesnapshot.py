@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0030_cotizacioncache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=10)),
+                ('price', models.FloatField()),
+                ('captured_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['symbol', 'captured_at'],
+                'unique_together': {('symbol', 'captured_at')},
+            },
+        ),
+    ]
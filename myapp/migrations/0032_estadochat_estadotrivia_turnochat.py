@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0031_pricesnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoChat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resumen', models.TextField(blank=True, default='')),
+                ('resumidos', models.IntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='estado_chat', to='myapp.userprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EstadoTrivia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('puntos', models.IntegerField(default=0)),
+                ('fallos', models.IntegerField(default=0)),
+                ('pregunta_actual_id', models.IntegerField(blank=True, null=True)),
+                ('respondidas', models.BinaryField(default=b'')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='estado_trivia', to='myapp.userprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TurnoChat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pregunta', models.TextField()),
+                ('respuesta', models.TextField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turnos_chat', to='myapp.userprofile')),
+            ],
+            options={
+                'ordering': ['user', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+import hashlib
+import unicodedata
+
+from django.db import migrations
+
+
+# Copia de pool.hash_contenido: la migración no debe depender del código
+# actual de la aplicación
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.split())
+
+
+def _hash_contenido(*partes):
+    contenido = '|'.join(_normalizar(p) for p in partes)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def deduplicar_frases(apps, schema_editor):
+    """
+    0028 deja con hash_contenido=None las frases repetidas (mismo texto
+    normalizado que otra), y FraseCompletar.save() lanzaría IntegrityError
+    al volver a guardarlas. Se borran las repetidas y las demás frases sin
+    hash reciben el suyo, así toda frase cumple el hash único.
+    """
+    FraseCompletar = apps.get_model('myapp', 'FraseCompletar')
+
+    vistos = set(
+        FraseCompletar.objects.exclude(hash_contenido__isnull=True).values_list('hash_contenido', flat=True)
+    )
+    repetidas = []
+    for frase in FraseCompletar.objects.filter(hash_contenido__isnull=True).order_by('id'):
+        h = _hash_contenido(frase.frase_completa, frase.palabra_clave)
+        if h in vistos:
+            repetidas.append(frase.id)
+            continue
+        vistos.add(h)
+        FraseCompletar.objects.filter(id=frase.id).update(hash_contenido=h)
+    FraseCompletar.objects.filter(id__in=repetidas).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0032_estadochat_estadotrivia_turnochat'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicar_frases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0033_deduplicar_frases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tareasegundoplano',
+            name='datos',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,5 +1,4 @@
 from django.db import models
-import requests
 from django.conf import settings
 from datetime import date, timedelta
 from django.db.models import Sum
@@ -7,6 +6,8 @@ from django.utils import timezone
 from datetime import date
 from django.utils.timezone import now
 from datetime import timedelta
+import random
+import uuid
 
 
 class UserProfile(models.Model):
@@ -90,9 +91,11 @@ class Investment(models.Model):
         return round(self.shares * self.price_at_purchase, 2)
 
     def get_current_price(self):
-        url = f"https://api.twelvedata.com/price?symbol={self.symbol}&apikey={settings.TWELVE_API_KEY}"
-        response = requests.get(url).json()
-        return float(response['price']) if 'price' in response else None
+        # Una sola valuación por instancia: el template llama a varios métodos por fila
+        if not hasattr(self, '_precio_actual'):
+            from . import precios
+            self._precio_actual = precios.obtener_precio(self.symbol)
+        return self._precio_actual
 
     def current_value(self):
         current_price = self.get_current_price()
@@ -196,21 +199,42 @@ class PuntajeTrivia(models.Model):
     ultima_actualizacion = models.DateTimeField(auto_now=True)
 
 
+def orden_aleatorio():
+    """Posición al azar de una frase en el recorrido del banco"""
+    return random.randint(0, 2 ** 31 - 1)
+
+
 class FraseCompletar(models.Model):
     """Frases de economía para completar con IA"""
+    ORIGENES = [
+        ('curada', 'Curada'),
+        ('ia', 'Generada por IA'),
+    ]
+    
     frase_completa = models.TextField(help_text="Frase completa con la palabra clave")
     palabra_clave = models.CharField(max_length=200, help_text="Palabra o frase que se oculta")
+    frase_con_espacio = models.TextField(blank=True, default='', help_text="Frase con la palabra clave ya oculta (se calcula al guardar)")
     categoria = models.CharField(max_length=100, default='general', help_text="Categoría de la frase")
     nivel_dificultad = models.IntegerField(default=1, help_text="1=fácil, 2=medio, 3=difícil")
+    origen = models.CharField(max_length=10, choices=ORIGENES, default='curada')
+    hash_contenido = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    orden = models.IntegerField(default=orden_aleatorio, db_index=True, help_text="Orden (al azar) en que los usuarios recorren el banco")
     activa = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return f"{self.frase_completa[:50]}... ({self.categoria})"
     
+    def save(self, *args, **kwargs):
+        from .banco_frases import enmascarar
+        from .pool import hash_contenido
+        self.frase_con_espacio = enmascarar(self.frase_completa, self.palabra_clave)
+        self.hash_contenido = hash_contenido(self.frase_completa, self.palabra_clave)
+        super().save(*args, **kwargs)
+    
     def obtener_frase_con_espacio(self):
         """Retorna la frase con el espacio en blanco"""
-        return self.frase_completa.replace(self.palabra_clave, "______________________")
+        return self.frase_con_espacio or self.frase_completa.replace(self.palabra_clave, "______________________")
 
 
 class PuntajeCompletarFrases(models.Model):
@@ -359,7 +383,7 @@ class UserMetrics(models.Model):
         """Actualiza el porcentaje de mejora en competencias basado en primera y última evaluación"""
         # Obtener todas las evaluaciones ordenadas por número de evaluación
         todas_evaluaciones = FinancialCompetencyAssessment.objects.filter(
-            user=self.user
+            user_id=self.user_id
         ).order_by('numero_evaluacion', 'fecha_evaluacion')
         
         if not todas_evaluaciones.exists():
@@ -734,32 +758,184 @@ class PersonalizedRecommendation(models.Model):
 
 
 class PregeneradaEvaluacion(models.Model):
-    """Evaluación pre-generada por IA para un usuario"""
-    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='pregeneradas_evaluaciones')
+    """Evaluación pre-generada por IA (user vacío = pool compartido entre usuarios)"""
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='pregeneradas_evaluaciones', null=True, blank=True)
     preguntas_evaluacion = models.JSONField()  # Todas las preguntas por categoría
     preguntas_brecha = models.JSONField()  # Preguntas de brecha teórico-práctica
+    hash_contenido = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    hashes_preguntas = models.JSONField(default=list, blank=True)  # Para no repetir preguntas dentro del pool
+    usada_por = models.ManyToManyField(UserProfile, related_name='evaluaciones_pool_vistas', blank=True)
+    veces_servida = models.IntegerField(default=0)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
-    usada = models.BooleanField(default=False)
+    usada = models.BooleanField(default=False)  # En el pool: retirada tras POOL_USOS_MAXIMOS
     fecha_uso = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         ordering = ['-fecha_creacion']
     
     def __str__(self):
-        return f"Evaluación pre-generada para {self.user.email} - {'Usada' if self.usada else 'Disponible'}"
+        duenio = self.user.email if self.user else 'pool compartido'
+        return f"Evaluación pre-generada para {duenio} - {'Usada' if self.usada else 'Disponible'}"
 
 
-class PregeneradaFraseCompletar(models.Model):
-    """Frase pre-generada por IA para el juego Completar Frases"""
-    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='pregeneradas_frases')
-    frase_completa = models.TextField()
-    palabra_clave = models.CharField(max_length=200)
+class RespuestaIACache(models.Model):
+    """Respuesta de la IA guardada por hash de (modelo, prompt, parámetros)"""
+    clave = models.CharField(max_length=64, unique=True)  # sha256 en hexadecimal
+    familia = models.CharField(max_length=50, db_index=True)  # verificacion, brecha, evaluacion, frase...
+    modelo = models.CharField(max_length=100)
+    respuesta = models.TextField()
     fecha_creacion = models.DateTimeField(auto_now_add=True)
-    usada = models.BooleanField(default=False)
-    fecha_uso = models.DateTimeField(null=True, blank=True)
+    expira_en = models.DateTimeField()
+    ultimo_acceso = models.DateTimeField(default=timezone.now, db_index=True)  # para desalojo LRU
+    aciertos = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"Caché IA {self.familia} ({self.clave[:12]}) - {self.aciertos} aciertos"
+
+
+class TareaSegundoPlano(models.Model):
+    """Trabajo de generación en segundo plano (cola persistente en la base de datos)"""
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('fallida', 'Fallida'),
+    ]
+    
+    tipo = models.CharField(max_length=50)  # evaluacion, frase...
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, null=True, blank=True, related_name='tareas')
+    clave = models.CharField(max_length=100)  # tipo + usuario, para no duplicar trabajos activos
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.IntegerField(default=0)
+    ejecutar_despues = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True, default='')
+    datos = models.JSONField(default=dict, blank=True)  # parámetros del trabajo, p. ej. {'nivel': 3}
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['ejecutar_despues', 'id']
+        indexes = [
+            models.Index(fields=['estado', 'ejecutar_despues']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['clave'],
+                condition=models.Q(estado__in=['pendiente', 'en_proceso']),
+                name='tarea_activa_unica_por_clave',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Tarea {self.tipo} ({self.clave}) - {self.estado}"
+
+
+class EvaluacionServida(models.Model):
+    """Set exacto de preguntas que se le mostró a un usuario; el POST se califica contra este set"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='evaluaciones_servidas')
+    preguntas_evaluacion = models.JSONField()
+    preguntas_brecha = models.JSONField()
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_respuesta = models.DateTimeField(null=True, blank=True)  # Se llena al calificar (una sola vez)
     
     class Meta:
         ordering = ['-fecha_creacion']
     
     def __str__(self):
-        return f"Frase pre-generada para {self.user.email} - {'Usada' if self.usada else 'Disponible'}"
\ No newline at end of file
+        estado = 'Respondida' if self.fecha_respuesta else 'Pendiente'
+        return f"Evaluación servida a {self.user.email} - {estado}"
+
+
+class CursorFrasesCompletar(models.Model):
+    """Posición de cada usuario en el recorrido del banco de frases (por nivel; 0 = todos)"""
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='cursores_frases')
+    nivel = models.IntegerField(default=0)
+    ultimo_orden = models.IntegerField(default=-1)
+    ultimo_id = models.IntegerField(default=0)
+    vueltas = models.IntegerField(default=0)  # Veces que el usuario recorrió el banco completo
+    
+    class Meta:
+        unique_together = ['user', 'nivel']
+    
+    def __str__(self):
+        return f"Cursor de frases de {self.user.email} (nivel {self.nivel})"
+
+
+class MetricaLlamadaExterna(models.Model):
+    """Métricas acumuladas de llamadas a servicios externos por (servicio, operación, vista)"""
+    servicio = models.CharField(max_length=50)  # gemini, twelvedata
+    operacion = models.CharField(max_length=150)  # modelo:familia o endpoint
+    vista = models.CharField(max_length=150)  # vista del request que hizo la llamada
+    llamadas = models.IntegerField(default=0)
+    errores = models.JSONField(default=dict, blank=True)  # clase de error -> cantidad
+    tiempo_total_ms = models.FloatField(default=0)
+    tiempo_max_ms = models.FloatField(default=0)
+    histograma = models.JSONField(default=list, blank=True)  # cantidad por bucket de metricas.BUCKETS_MS
+    tokens_entrada = models.BigIntegerField(default=0)
+    tokens_salida = models.BigIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['servicio', 'operacion', 'vista']
+    
+    def __str__(self):
+        return f"{self.servicio} {self.operacion} ({self.vista}): {self.llamadas} llamadas"
+
+
+class CotizacionCache(models.Model):
+    """Último precio conocido de cada símbolo, compartido entre procesos (ver precios.py)"""
+    simbolo = models.CharField(max_length=10, unique=True)
+    precio = models.FloatField()
+    actualizado = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.simbolo}: {self.precio} ({self.actualizado:%Y-%m-%d %H:%M})"
+
+
+class PriceSnapshot(models.Model):
+    """Punto de la serie histórica de precios de un símbolo (ver precios.py)"""
+    symbol = models.CharField(max_length=10)
+    price = models.FloatField()
+    captured_at = models.DateTimeField()  # truncado al minuto
+    
+    class Meta:
+        ordering = ['symbol', 'captured_at']
+        unique_together = ['symbol', 'captured_at']
+    
+    def __str__(self):
+        return f"{self.symbol}: {self.price} ({self.captured_at:%Y-%m-%d %H:%M})"
+
+
+class EstadoTrivia(models.Model):
+    """Partida de trivia en curso de un usuario (ver estado_juego.py)"""
+    user = models.OneToOneField(UserProfile, on_delete=models.CASCADE, related_name='estado_trivia')
+    puntos = models.IntegerField(default=0)
+    fallos = models.IntegerField(default=0)
+    pregunta_actual_id = models.IntegerField(null=True, blank=True)
+    respondidas = models.BinaryField(default=b'')  # bitset: bit i = pregunta i respondida
+    
+    def __str__(self):
+        return f"Trivia de {self.user.email}: {self.puntos} puntos, {self.fallos} fallos"
+
+
+class EstadoChat(models.Model):
+    """Resumen acumulado del chatbot de un usuario (ver contexto_chat.py)"""
+    user = models.OneToOneField(UserProfile, on_delete=models.CASCADE, related_name='estado_chat')
+    resumen = models.TextField(blank=True, default='')
+    resumidos = models.IntegerField(default=0)  # turnos guardados que ya están en el resumen
+    
+    def __str__(self):
+        return f"Chat de {self.user.email}"
+
+
+class TurnoChat(models.Model):
+    """Pregunta y respuesta del chatbot; se guardan los últimos CHAT_TURNOS_GUARDADOS por usuario"""
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='turnos_chat')
+    pregunta = models.TextField()
+    respuesta = models.TextField()
+    
+    class Meta:
+        ordering = ['user', 'id']
+    
+    def __str__(self):
+        return f"{self.user.email}: {self.pregunta[:40]}"
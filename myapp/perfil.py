@@ -0,0 +1,79 @@
+"""
+Perfil (UserProfile) del usuario de la sesión, cargado una sola vez por request.
+
+PerfilMiddleware deja en `request.profile` un objeto perezoso (como
+`request.user` de Django): la consulta se hace la primera vez que se usa y
+después lo reutilizan la vista, los context processors y los templates.
+Con PERFIL_SELECT_RELATED se traen en la misma consulta relaciones como
+'metrics' o 'context'.
+
+Con PERFIL_VERIFICAR_CONSULTAS activo, cualquier otra consulta del mismo
+perfil por id durante el request lanza AssertionError (útil en desarrollo
+y tests para encontrar cargas redundantes).
+"""
+import re
+
+from django.conf import settings
+
+from .models import UserProfile
+
+
+_CONSULTA_PERFIL = re.compile(
+    r'^SELECT .* FROM "myapp_userprofile"(?: LEFT OUTER JOIN .*)? WHERE "myapp_userprofile"\."id" = %s',
+    re.DOTALL
+)
+
+
+def obtener(request):
+    """UserProfile de la sesión (cargado una vez por request) o None"""
+    user_id = request.session.get('user_id') if hasattr(request, 'session') else None
+    guardado = getattr(request, '_perfil_cache', None)
+    # Si la sesión cambió de usuario en medio del request (login/logout) se vuelve a cargar
+    if guardado is None or guardado[0] != user_id:
+        perfil = None
+        if user_id is not None:
+            consulta = UserProfile.objects.all()
+            relacionados = getattr(settings, 'PERFIL_SELECT_RELATED', ())
+            if relacionados:
+                consulta = consulta.select_related(*relacionados)
+            perfil = consulta.filter(id=user_id).first()
+        guardado = (user_id, perfil)
+        request._perfil_cache = guardado
+    return guardado[1]
+
+
+def obtener_o_error(request):
+    """Como obtener, pero sin perfil lanza UserProfile.DoesNotExist (igual que .get())"""
+    perfil = obtener(request)
+    if perfil is None:
+        raise UserProfile.DoesNotExist('No hay un perfil para la sesión actual.')
+    return perfil
+
+
+class VerificadorConsultas:
+    """
+    execute_wrapper que cuenta las consultas del perfil de la sesión por id
+    y lanza AssertionError a partir de la segunda.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.consultas = 0
+
+    def _user_id(self):
+        # Sin forzar la carga de la sesión (que también es una consulta)
+        datos = getattr(self.request.session, '_session_cache', None)
+        return datos.get('user_id') if datos else None
+
+    def __call__(self, execute, sql, params, many, context):
+        user_id = self._user_id()
+        if (
+            user_id is not None and params and not many
+            and str(params[0]) == str(user_id) and _CONSULTA_PERFIL.match(sql)
+        ):
+            self.consultas += 1
+            if self.consultas > 1:
+                raise AssertionError(
+                    f"Consulta redundante del perfil {user_id}: usar request.profile. SQL: {sql}"
+                )
+        return execute(sql, params, many, context)
@@ -0,0 +1,216 @@
+"""
+Pool compartido de evaluaciones pre-generadas y reposición del banco de frases.
+
+En lugar de una cola privada por usuario, las evaluaciones generadas por la
+IA van a un pool global (filas con user vacío). Cada usuario toma del pool
+lo que todavía no vio (usada_por) y cada set se retira tras
+POOL_USOS_MAXIMOS usos. Las frases de Completar Frases se sirven del banco
+FraseCompletar (ver banco_frases); aquí solo se repone. Un reponedor
+(trabajos 'pool_evaluacion' y 'pool_frase' de la cola de tareas) mantiene
+ambos en la profundidad configurada, así el gasto en IA crece con el
+tráfico y no con usuarios × visitas. Las preguntas y frases repetidas se
+descartan por hash.
+"""
+import hashlib
+import unicodedata
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+# Tipo de trabajo de la cola -> configuración del pool
+OBJETIVO_POR_DEFECTO = {
+    'evaluacion': 10,
+    'frase': 40,
+}
+
+TAREA_POR_TIPO = {
+    'evaluacion': 'pool_evaluacion',
+    'frase': 'pool_frase',
+}
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def objetivo(tipo):
+    """Cantidad de elementos disponibles que el reponedor intenta mantener"""
+    objetivos = dict(OBJETIVO_POR_DEFECTO)
+    objetivos.update(_config('POOL_OBJETIVOS', {}))
+    return objetivos.get(tipo, 0)
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.split())
+
+
+def hash_contenido(*partes):
+    """sha256 del contenido normalizado (sin mayúsculas, tildes ni espacios extra)"""
+    contenido = '|'.join(_normalizar(p) for p in partes)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def _disponibles(tipo):
+    from .models import PregeneradaEvaluacion
+
+    if tipo == 'frase':
+        from .banco_frases import frases_servibles
+        return frases_servibles()
+    return PregeneradaEvaluacion.objects.filter(user__isnull=True, usada=False)
+
+
+def inventario():
+    """Elementos disponibles y objetivo por tipo, p. ej. {'frase': {'disponibles': 12, 'objetivo': 40}}"""
+    return {
+        tipo: {'disponibles': _disponibles(tipo).count(), 'objetivo': objetivo(tipo)}
+        for tipo in OBJETIVO_POR_DEFECTO
+    }
+
+
+def deficit(tipo):
+    return max(0, objetivo(tipo) - _disponibles(tipo).count())
+
+
+def reponer(tipo, forzar=False, datos=None):
+    """
+    Encola la reposición del pool si está por debajo del objetivo (o si
+    `forzar`, p. ej. cuando un usuario ya vio todo lo disponible). `datos`
+    se pasa al trabajo (p. ej. {'nivel': 3} para frases de ese nivel).
+    """
+    from . import tareas
+
+    if not forzar and deficit(tipo) == 0:
+        return None
+    try:
+        return tareas.encolar(TAREA_POR_TIPO[tipo], datos=datos)
+    except Exception as e:
+        print(f"Error encolando reposición del pool de {tipo}: {str(e)}")
+        return None
+
+
+# ============================================
+# ALTAS EN EL POOL
+# ============================================
+
+def agregar_evaluacion(preguntas_evaluacion, preguntas_brecha):
+    """
+    Agrega un set de evaluación al pool descartando las preguntas que ya
+    están en otro set disponible. Retorna el set creado o None si no quedó
+    ninguna pregunta nueva.
+    """
+    from .models import PregeneradaEvaluacion
+
+    existentes = set()
+    for hashes in _disponibles('evaluacion').values_list('hashes_preguntas', flat=True):
+        existentes.update(hashes or [])
+
+    hashes_nuevos = []
+
+    def filtrar(preguntas):
+        unicas = []
+        for pregunta in preguntas or []:
+            h = hash_contenido(pregunta.get('pregunta', ''))
+            if h in existentes:
+                continue
+            existentes.add(h)
+            hashes_nuevos.append(h)
+            unicas.append(pregunta)
+        return unicas
+
+    preguntas_evaluacion = {c: filtrar(p) for c, p in preguntas_evaluacion.items()}
+    preguntas_brecha = {t: filtrar(p) for t, p in preguntas_brecha.items()}
+    if not hashes_nuevos:
+        return None
+
+    try:
+        with transaction.atomic():
+            return PregeneradaEvaluacion.objects.create(
+                preguntas_evaluacion=preguntas_evaluacion,
+                preguntas_brecha=preguntas_brecha,
+                hash_contenido=hash_contenido(*sorted(hashes_nuevos)),
+                hashes_preguntas=hashes_nuevos
+            )
+    except IntegrityError:
+        return None
+
+
+# ============================================
+# CONSUMO
+# ============================================
+
+def marcar_servida(elemento, user):
+    """Registra que el usuario vio el elemento y lo retira al llegar a POOL_USOS_MAXIMOS"""
+    elemento.usada_por.add(user)
+    modelo = type(elemento)
+    modelo.objects.filter(pk=elemento.pk).update(
+        veces_servida=F('veces_servida') + 1,
+        fecha_uso=timezone.now()
+    )
+    modelo.objects.filter(
+        pk=elemento.pk,
+        veces_servida__gte=_config('POOL_USOS_MAXIMOS', 100)
+    ).update(usada=True)
+
+
+def _tomar(tipo, user):
+    elemento = _disponibles(tipo).exclude(usada_por=user).order_by('veces_servida', 'fecha_creacion').first()
+    if elemento is None:
+        # El usuario ya vio todo el pool: hace falta contenido nuevo
+        reponer(tipo, forzar=True)
+        return None
+
+    marcar_servida(elemento, user)
+    reponer(tipo)
+    return elemento
+
+
+def tomar_evaluacion(user):
+    """Set de evaluación del pool que el usuario no vio (o None)"""
+    return _tomar('evaluacion', user)
+
+
+# ============================================
+# REPOSICIÓN (la ejecuta la cola de tareas)
+# ============================================
+
+def _cantidad_a_generar(tipo):
+    # Al menos uno: si se encoló forzado, un usuario se quedó sin contenido nuevo
+    return min(max(deficit(tipo), 1), _config('POOL_LOTE', 5))
+
+
+def reponer_evaluaciones(user=None):
+    """Genera sets de evaluación para el pool hasta cubrir el déficit (un lote por trabajo)"""
+    from .views import generar_evaluacion
+
+    for _ in range(_cantidad_a_generar('evaluacion')):
+        # Sin límite de tiempo ni banco local: solo preguntas generadas por la IA
+        todas_preguntas, preguntas_brecha = generar_evaluacion(usar_banco_local=False)
+
+        secciones = list(todas_preguntas.values()) + list(preguntas_brecha.values())
+        if not any(secciones):
+            # Lanzar para que la cola reintente más tarde
+            raise RuntimeError("La IA no devolvió preguntas para ninguna sección")
+        agregar_evaluacion(todas_preguntas, preguntas_brecha)
+
+
+def reponer_frases(user=None, nivel=0):
+    """
+    Genera frases para el banco hasta cubrir el déficit (un lote por
+    trabajo), del nivel del usuario que se quedó sin frases si se indica.
+    """
+    from .banco_frases import NIVEL_POR_DEFECTO, agregar_frase
+    from .views import generar_frase_completar_ia
+
+    for _ in range(_cantidad_a_generar('frase')):
+        frase_data = generar_frase_completar_ia(nivel=nivel)
+        if not frase_data:
+            raise RuntimeError("La IA no devolvió una frase")
+        agregar_frase(
+            frase_data['frase_completa'], frase_data['palabra_clave'],
+            nivel_dificultad=nivel or NIVEL_POR_DEFECTO
+        )
@@ -0,0 +1,63 @@
+"""
+Valuación de portafolios de inversión.
+
+Junta los símbolos distintos de las inversiones, obtiene todos los precios
+de una vez con precios.obtener_precios (caché + una llamada agrupada a
+Twelve Data) y los reparte a cada Investment, así los métodos
+get_current_price/current_value/profit_loss ya no hacen llamadas propias.
+El historial para los gráficos sale solo de la serie guardada.
+"""
+from . import precios
+from .models import Investment
+
+
+def valorar(inversiones, forzar=False):
+    """Asigna el precio actual a cada inversión con una sola consulta por lote de símbolos"""
+    inversiones = list(inversiones)
+    cotizaciones = precios.obtener_precios({inv.symbol for inv in inversiones}, forzar=forzar)
+    for inv in inversiones:
+        inv._precio_actual = cotizaciones.get(precios._normalizar(inv.symbol))
+    return inversiones
+
+
+def valorar_usuario(user):
+    """Inversiones del usuario ya valoradas y los totales del portafolio"""
+    inversiones = valorar(Investment.objects.filter(user=user))
+    total_invertido = round(sum(inv.total_invested() for inv in inversiones), 2)
+    valoradas = [inv for inv in inversiones if inv.current_value() is not None]
+    if valoradas:
+        valor_actual = round(sum(inv.current_value() for inv in valoradas), 2)
+        ganancia = round(sum(inv.profit_loss() for inv in valoradas), 2)
+    else:
+        valor_actual = ganancia = None
+    return {
+        'inversiones': inversiones,
+        'total_invertido': total_invertido,
+        'valor_actual': valor_actual,
+        'ganancia': ganancia,
+        'sin_precio': len(inversiones) - len(valoradas),
+    }
+
+
+def historial_grafico(inversiones, dias=30):
+    """
+    Historial de precios de los símbolos de las inversiones listo para el
+    gráfico ({símbolo: [{'x': milisegundos, 'y': precio}, ...]}), leído de la
+    serie guardada sin llamar a la API. Omite símbolos sin puntos.
+    """
+    series = precios.historial({inv.symbol for inv in inversiones}, dias=dias)
+    return {
+        simbolo: [{'x': int(fecha.timestamp() * 1000), 'y': precio} for fecha, precio in puntos]
+        for simbolo, puntos in series.items()
+        if puntos
+    }
+
+
+def refrescar_todos():
+    """
+    Vuelve a consultar los precios de todos los símbolos con inversiones (de
+    todos los usuarios) para que las páginas encuentren la caché al día.
+    Devuelve {símbolo: precio o None}.
+    """
+    simbolos = Investment.objects.values_list('symbol', flat=True).distinct()
+    return precios.obtener_precios(simbolos, forzar=True)
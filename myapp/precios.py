@@ -0,0 +1,246 @@
+"""
+Precios de acciones de Twelve Data con caché compartida.
+
+Cada símbolo se consulta a la API como máximo una vez cada PRECIOS_TTL
+segundos, sin importar cuántos usuarios o filas lo muestren: primero se
+busca en la memoria del proceso, después en la tabla CotizacionCache
+(compartida entre procesos) y solo si ambas están vencidas se llama a la
+API. Si la API falla se devuelve el último precio conocido.
+
+Cada precio nuevo agrega además un punto a la serie histórica
+(PriceSnapshot), sin repetir puntos con el mismo precio; `compactar()`
+reduce los puntos viejos a uno por hora o por día, y `historial()` lee la
+serie sin llamar a la API.
+
+Los símbolos que faltan se piden juntos (el endpoint /price acepta varios
+separados por comas) a través del cliente HTTP compartido, así valorar un
+portafolio cuesta una llamada y no una por posición.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import http_cliente, metricas
+
+
+# Máximo de símbolos por llamada (Twelve Data admite hasta 120 por request)
+SIMBOLOS_POR_LLAMADA = 50
+
+_lock = threading.Lock()
+_cache = {}  # símbolo -> (precio, guardado_en como timestamp)
+
+
+def _ttl():
+    return getattr(settings, 'PRECIOS_TTL', 300)
+
+
+def _normalizar(simbolo):
+    return (simbolo or '').strip().upper()
+
+
+def _precio(datos):
+    try:
+        return float(datos['price'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def consultar_api(simbolos):
+    """
+    Precios actuales desde Twelve Data (sin caché) en una sola llamada.
+    Devuelve {símbolo: precio} solo con los símbolos que tuvieron precio.
+    """
+    simbolos = [_normalizar(s) for s in simbolos if _normalizar(s)]
+    if not simbolos:
+        return {}
+    try:
+        with metricas.medir('twelvedata', '/price') as llamada:
+            response = http_cliente.get(
+                f"{settings.TWELVE_DATA_URL}/price",
+                params={'symbol': ','.join(simbolos), 'apikey': settings.TWELVE_API_KEY},
+                timeout=getattr(settings, 'PRECIOS_TIMEOUT', 5),
+            )
+            llamada.estado_http(response.status_code)
+            datos = response.json()
+            llamada.respuesta_twelve_data(datos)
+    except Exception as e:
+        print(f"Error consultando precios de {', '.join(simbolos)}: {str(e)}")
+        return {}
+
+    if not isinstance(datos, dict):
+        return {}
+    # Con un solo símbolo la respuesta no viene agrupada por símbolo
+    if len(simbolos) == 1:
+        datos = {simbolos[0]: datos}
+    precios = {}
+    for simbolo in simbolos:
+        precio = _precio(datos.get(simbolo))
+        if precio is not None:
+            precios[simbolo] = precio
+    return precios
+
+
+def _guardar_en_proceso(simbolo, precio, guardado_en):
+    with _lock:
+        _cache[simbolo] = (precio, guardado_en)
+
+
+def guardar(precios):
+    """Guarda precios recién obtenidos ({símbolo: precio}) en la memoria del proceso y en la base"""
+    from .models import CotizacionCache, PriceSnapshot
+
+    precios = {_normalizar(s): p for s, p in precios.items()}
+    if not precios:
+        return
+    ahora = timezone.now()
+    existentes = {
+        fila.simbolo: fila
+        for fila in CotizacionCache.objects.filter(simbolo__in=precios)
+    }
+    nuevas = []
+    puntos = []
+    minuto = ahora.replace(second=0, microsecond=0)
+    for simbolo, precio in precios.items():
+        fila = existentes.get(simbolo)
+        if fila:
+            if fila.precio != precio:
+                puntos.append(PriceSnapshot(symbol=simbolo, price=precio, captured_at=minuto))
+            fila.precio = precio
+            fila.actualizado = ahora  # bulk_update no aplica auto_now
+        else:
+            nuevas.append(CotizacionCache(simbolo=simbolo, precio=precio))
+            puntos.append(PriceSnapshot(symbol=simbolo, price=precio, captured_at=minuto))
+    CotizacionCache.objects.bulk_update(existentes.values(), ['precio', 'actualizado'])
+    CotizacionCache.objects.bulk_create(nuevas, ignore_conflicts=True)
+    # Un precio sin cambios no agrega punto; dos en el mismo minuto se quedan con el primero
+    PriceSnapshot.objects.bulk_create(puntos, ignore_conflicts=True)
+
+    guardado_en = time.time()
+    for simbolo, precio in precios.items():
+        _guardar_en_proceso(simbolo, precio, guardado_en)
+
+
+def obtener_precios(simbolos, forzar=False):
+    """
+    Precios de varios símbolos ({símbolo: precio o None}) usando la caché del
+    proceso, la de la base y por último una llamada a la API por cada
+    SIMBOLOS_POR_LLAMADA símbolos que falten. Con forzar se ignora la caché
+    (pero se sigue usando el último precio si la API falla).
+    """
+    from .models import CotizacionCache
+
+    simbolos = sorted({_normalizar(s) for s in simbolos if _normalizar(s)})
+    resultado = {}
+    ttl = _ttl()
+
+    faltan = []
+    if forzar:
+        faltan = simbolos
+    else:
+        ahora = time.time()
+        with _lock:
+            for simbolo in simbolos:
+                entrada = _cache.get(simbolo)
+                if entrada and ahora - entrada[1] < ttl:
+                    resultado[simbolo] = entrada[0]
+                else:
+                    faltan.append(simbolo)
+    if not faltan:
+        return resultado
+
+    filas = {fila.simbolo: fila for fila in CotizacionCache.objects.filter(simbolo__in=faltan)}
+    if not forzar:
+        vigentes = [
+            fila for fila in filas.values()
+            if (timezone.now() - fila.actualizado).total_seconds() < ttl
+        ]
+        for fila in vigentes:
+            _guardar_en_proceso(fila.simbolo, fila.precio, fila.actualizado.timestamp())
+            resultado[fila.simbolo] = fila.precio
+        faltan = [s for s in faltan if s not in resultado]
+
+    nuevos = {}
+    for inicio in range(0, len(faltan), SIMBOLOS_POR_LLAMADA):
+        nuevos.update(consultar_api(faltan[inicio:inicio + SIMBOLOS_POR_LLAMADA]))
+    guardar(nuevos)
+
+    for simbolo in faltan:
+        if simbolo in nuevos:
+            resultado[simbolo] = nuevos[simbolo]
+        else:
+            # Mejor un precio algo viejo que ninguno
+            fila = filas.get(simbolo)
+            resultado[simbolo] = fila.precio if fila else None
+    return resultado
+
+
+def obtener_precio(simbolo):
+    """Precio de un símbolo (ver obtener_precios) o None"""
+    simbolo = _normalizar(simbolo)
+    if not simbolo:
+        return None
+    return obtener_precios([simbolo]).get(simbolo)
+
+
+def historial(simbolos, dias=30):
+    """
+    Serie de precios guardada de cada símbolo en los últimos `dias` días
+    ({símbolo: [(fecha, precio), ...]} en orden cronológico). No llama a la API.
+    """
+    from .models import PriceSnapshot
+
+    simbolos = sorted({_normalizar(s) for s in simbolos if _normalizar(s)})
+    series = {simbolo: [] for simbolo in simbolos}
+    puntos = PriceSnapshot.objects.filter(
+        symbol__in=simbolos,
+        captured_at__gte=timezone.now() - timedelta(days=dias)
+    ).order_by('symbol', 'captured_at').values_list('symbol', 'captured_at', 'price')
+    for simbolo, fecha, precio in puntos:
+        series[simbolo].append((fecha, precio))
+    return series
+
+
+def _periodo(fecha, por_dia):
+    if por_dia:
+        return fecha.date()
+    return fecha.replace(minute=0, second=0, microsecond=0)
+
+
+def compactar():
+    """
+    Reduce la serie histórica: deja todo el detalle de los últimos
+    PRECIOS_DETALLE_DIAS días, un punto por hora (el último de cada hora)
+    hasta PRECIOS_POR_HORA_DIAS y uno por día antes de eso. Devuelve la
+    cantidad de puntos borrados.
+    """
+    from .models import PriceSnapshot
+
+    ahora = timezone.now()
+    limite_detalle = ahora - timedelta(days=getattr(settings, 'PRECIOS_DETALLE_DIAS', 7))
+    limite_por_hora = ahora - timedelta(days=getattr(settings, 'PRECIOS_POR_HORA_DIAS', 90))
+
+    borrar = []
+    conservado = {}  # (símbolo, periodo) -> id del último punto visto
+    puntos = PriceSnapshot.objects.filter(captured_at__lt=limite_detalle).order_by(
+        'symbol', 'captured_at'
+    ).values_list('id', 'symbol', 'captured_at')
+    for id_punto, simbolo, fecha in puntos.iterator():
+        clave = (simbolo, _periodo(fecha, por_dia=fecha < limite_por_hora))
+        anterior = conservado.get(clave)
+        if anterior is not None:
+            borrar.append(anterior)
+        conservado[clave] = id_punto
+
+    borrados = 0
+    for inicio in range(0, len(borrar), 500):
+        borrados += PriceSnapshot.objects.filter(id__in=borrar[inicio:inicio + 500]).delete()[0]
+    return borrados
+
+
+def reiniciar():
+    """Vacía la caché del proceso (útil en tests)"""
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,295 @@
+"""
+Generación por lotes de recomendaciones personalizadas.
+
+1. Se eligen solo los usuarios con gastos o evaluaciones posteriores a su
+   última PersonalizedRecommendation (o sin ninguna), con subconsultas en
+   una sola consulta.
+2. Los resúmenes de cada usuario (gasto por categoría de los últimos 30
+   días, límite mensual y última evaluación) se arman con consultas
+   agregadas para todo el lote, no una por usuario.
+3. El generador (IA, o reglas locales si la IA no responde) corre en
+   paralelo con un límite de llamadas por segundo; los hilos no tocan la
+   base.
+4. Las recomendaciones se guardan con bulk_create.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from . import gemini
+
+
+TIPOS_VALIDOS = {'contenido', 'reto', 'alerta', 'simulador'}
+
+DIAS_RESUMEN = 30
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+class LimitadorTasa:
+    """Permite como máximo `por_segundo` llamadas por segundo entre todos los hilos"""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo and por_segundo > 0 else 0.0
+        self._lock = threading.Lock()
+        self._siguiente = time.monotonic()
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+# ============================================
+# SELECCIÓN Y RESÚMENES
+# ============================================
+
+def usuarios_con_cambios(usuarios=None, forzar=False):
+    """
+    Usuarios (de `usuarios`, por defecto todos los no bloqueados) cuyos
+    gastos o evaluaciones cambiaron desde su última recomendación. Con
+    `forzar` se devuelven todos.
+    """
+    from .models import Expense, FinancialCompetencyAssessment, PersonalizedRecommendation, UserProfile
+
+    if usuarios is None:
+        usuarios = UserProfile.objects.filter(is_blocked=False)
+    if forzar:
+        return usuarios
+
+    ultima_recomendacion = PersonalizedRecommendation.objects.filter(
+        user=OuterRef('pk')
+    ).order_by('-fecha_recomendacion').values('fecha_recomendacion')[:1]
+    ultimo_gasto = Expense.objects.filter(user=OuterRef('pk')).order_by('-date').values('date')[:1]
+    ultima_evaluacion = FinancialCompetencyAssessment.objects.filter(
+        user=OuterRef('pk')
+    ).order_by('-fecha_evaluacion').values('fecha_evaluacion')[:1]
+
+    return usuarios.annotate(
+        ultima_recomendacion=Subquery(ultima_recomendacion),
+        ultimo_gasto=Subquery(ultimo_gasto),
+        ultima_evaluacion=Subquery(ultima_evaluacion),
+    ).filter(
+        Q(ultimo_gasto__isnull=False) | Q(ultima_evaluacion__isnull=False)
+    ).filter(
+        Q(ultima_recomendacion__isnull=True)
+        | Q(ultimo_gasto__gt=F('ultima_recomendacion'))
+        | Q(ultima_evaluacion__gt=F('ultima_recomendacion'))
+    )
+
+
+def construir_resumenes(usuarios):
+    """
+    Resumen por usuario para el generador, armado con cuatro consultas
+    para todo el lote. Retorna {user_id: resumen}.
+    """
+    from .models import Expense, FinancialCompetencyAssessment
+
+    resumenes = {
+        u['id']: {
+            'user_id': u['id'],
+            'nombre': u['first_name'],
+            'limite_mensual': u['monthly_limit'],
+            'gastos': {},
+            'total_gastos': 0.0,
+            'cantidad_gastos': 0,
+            'evaluacion': None,
+        }
+        for u in usuarios.values('id', 'first_name', 'monthly_limit')
+    }
+    if not resumenes:
+        return resumenes
+
+    desde = timezone.now() - timedelta(days=DIAS_RESUMEN)
+    gastos = Expense.objects.filter(user_id__in=resumenes, date__gte=desde).values(
+        'user_id', 'category'
+    ).annotate(total=Sum('amount'), cantidad=Count('id'))
+    for fila in gastos:
+        resumen = resumenes[fila['user_id']]
+        resumen['gastos'][fila['category']] = round(fila['total'] or 0, 2)
+        resumen['total_gastos'] = round(resumen['total_gastos'] + (fila['total'] or 0), 2)
+        resumen['cantidad_gastos'] += fila['cantidad']
+
+    # Solo la última evaluación de cada usuario
+    ultimas = list(FinancialCompetencyAssessment.objects.filter(user_id__in=resumenes).values('user_id').annotate(
+        ultima=Max('fecha_evaluacion')
+    ))
+    filtro = Q()
+    for fila in ultimas:
+        filtro |= Q(user_id=fila['user_id'], fecha_evaluacion=fila['ultima'])
+    if ultimas:
+        evaluaciones = FinancialCompetencyAssessment.objects.filter(filtro).values(
+            'user_id', 'puntaje_total', 'nivel_competencia', 'conocimiento_presupuesto',
+            'conocimiento_ahorro', 'conocimiento_credito', 'conocimiento_inversiones',
+            'conocimiento_fraudes', 'monto_deuda_actual'
+        )
+        for fila in evaluaciones:
+            resumenes[fila.pop('user_id')]['evaluacion'] = fila
+
+    return resumenes
+
+
+# ============================================
+# GENERADORES
+# ============================================
+
+def construir_prompt(resumen):
+    evaluacion = resumen['evaluacion'] or {}
+    gastos = ', '.join(f'{c}: S/. {m}' for c, m in sorted(resumen['gastos'].items())) or 'sin gastos registrados'
+    return f"""Eres un asesor financiero para jóvenes en Perú. Genera 3 recomendaciones personalizadas.
+
+Datos del usuario (últimos {DIAS_RESUMEN} días):
+- Gastos por categoría: {gastos}
+- Total gastado: S/. {resumen['total_gastos']} (límite mensual: S/. {resumen['limite_mensual']})
+- Nivel de competencia financiera: {evaluacion.get('nivel_competencia', 'sin evaluación')}
+- Puntajes (0-100): presupuesto {evaluacion.get('conocimiento_presupuesto', '-')}, ahorro {evaluacion.get('conocimiento_ahorro', '-')}, crédito {evaluacion.get('conocimiento_credito', '-')}, inversiones {evaluacion.get('conocimiento_inversiones', '-')}, fraudes {evaluacion.get('conocimiento_fraudes', '-')}
+- Deuda actual: S/. {evaluacion.get('monto_deuda_actual', 0)}
+
+Responde SOLO con JSON en este formato:
+{{
+  "recomendaciones": [
+    {{
+      "tipo_recomendacion": "contenido|reto|alerta|simulador",
+      "contenido": "La recomendación concreta (máximo 2 oraciones)",
+      "razon": "Por qué se recomienda según sus datos"
+    }}
+  ]
+}}"""
+
+
+def validar(recomendaciones):
+    validas = []
+    for rec in recomendaciones or []:
+        if not isinstance(rec, dict):
+            continue
+        tipo = str(rec.get('tipo_recomendacion', '')).strip().lower()
+        contenido = str(rec.get('contenido', '')).strip()
+        if tipo in TIPOS_VALIDOS and contenido:
+            validas.append({
+                'tipo_recomendacion': tipo,
+                'contenido': contenido,
+                'razon': str(rec.get('razon', '')).strip(),
+            })
+    return validas
+
+
+def recomendaciones_locales(resumen):
+    """Recomendaciones por reglas simples (cuando la IA no está disponible)"""
+    recomendaciones = []
+    limite = resumen['limite_mensual'] or 0
+    evaluacion = resumen['evaluacion'] or {}
+
+    if limite and resumen['total_gastos'] > limite:
+        recomendaciones.append({
+            'tipo_recomendacion': 'alerta',
+            'contenido': f"Superaste tu límite mensual de S/. {limite:.2f}. Revisa tus gastos y ajusta tu presupuesto.",
+            'razon': f"Gastaste S/. {resumen['total_gastos']:.2f} en los últimos {DIAS_RESUMEN} días.",
+        })
+    if resumen['gastos']:
+        categoria, monto = max(resumen['gastos'].items(), key=lambda item: item[1])
+        recomendaciones.append({
+            'tipo_recomendacion': 'reto',
+            'contenido': f"Intenta reducir un 10% tus gastos en {categoria} durante las próximas semanas.",
+            'razon': f"{categoria} es tu mayor gasto (S/. {monto:.2f}).",
+        })
+    if evaluacion:
+        puntajes = {
+            'presupuesto': evaluacion.get('conocimiento_presupuesto', 0),
+            'ahorro': evaluacion.get('conocimiento_ahorro', 0),
+            'crédito': evaluacion.get('conocimiento_credito', 0),
+            'inversiones': evaluacion.get('conocimiento_inversiones', 0),
+            'fraudes': evaluacion.get('conocimiento_fraudes', 0),
+        }
+        tema, puntaje = min(puntajes.items(), key=lambda item: item[1])
+        recomendaciones.append({
+            'tipo_recomendacion': 'contenido',
+            'contenido': f"Revisa el contenido educativo sobre {tema} para reforzar tus conocimientos.",
+            'razon': f"Es tu tema con menor puntaje en la última evaluación ({puntaje}).",
+        })
+    if evaluacion.get('monto_deuda_actual'):
+        recomendaciones.append({
+            'tipo_recomendacion': 'simulador',
+            'contenido': "Usa el simulador de crédito para planificar cómo pagar tu deuda actual.",
+            'razon': f"Tienes una deuda de S/. {evaluacion['monto_deuda_actual']:.2f}.",
+        })
+    return recomendaciones
+
+
+def generar_para_resumen(resumen):
+    """Recomendaciones de la IA para el resumen; si falla, las de reglas locales. Retorna (lista, origen)"""
+    if gemini.circuito_abierto() or gemini.obtener_modelo() is None:
+        return recomendaciones_locales(resumen), 'local'
+    try:
+        datos = gemini.generar_json(construir_prompt(resumen), familia='recomendaciones')
+        recomendaciones = validar(datos.get('recomendaciones') if isinstance(datos, dict) else None)
+        if recomendaciones:
+            return recomendaciones, 'ia'
+    except Exception as e:
+        print(f"Error generando recomendaciones con IA para el usuario {resumen['user_id']}: {str(e)}")
+    return recomendaciones_locales(resumen), 'local'
+
+
+# ============================================
+# PIPELINE
+# ============================================
+
+def ejecutar(usuarios=None, forzar=False, limpiar=False, dry_run=False, hilos=None, por_segundo=None):
+    """
+    Corre el pipeline completo y retorna un reporte con cantidades y
+    segundos por etapa. Con `dry_run` solo selecciona y arma los
+    resúmenes: no llama al generador ni escribe.
+    """
+    from .models import PersonalizedRecommendation
+
+    reporte = {'tiempos': {}, 'usuarios': 0, 'generadas': 0, 'por_ia': 0, 'por_reglas': 0, 'sin_recomendaciones': 0}
+
+    inicio = time.perf_counter()
+    seleccionados = usuarios_con_cambios(usuarios, forzar=forzar)
+    resumenes = construir_resumenes(seleccionados)
+    reporte['usuarios'] = len(resumenes)
+    reporte['tiempos']['seleccion_y_resumenes'] = time.perf_counter() - inicio
+    if dry_run or not resumenes:
+        return reporte
+
+    hilos = hilos or _config('RECOMENDACIONES_HILOS', 4)
+    limitador = LimitadorTasa(por_segundo if por_segundo is not None else _config('RECOMENDACIONES_POR_SEGUNDO', 2))
+
+    def generar(resumen):
+        limitador.esperar()
+        return resumen['user_id'], generar_para_resumen(resumen)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='recomendaciones') as executor:
+        resultados = list(executor.map(generar, resumenes.values()))
+    reporte['tiempos']['generacion'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    nuevas = []
+    for user_id, (recomendaciones, origen) in resultados:
+        if not recomendaciones:
+            reporte['sin_recomendaciones'] += 1
+            continue
+        reporte['por_ia' if origen == 'ia' else 'por_reglas'] += 1
+        nuevas.extend(PersonalizedRecommendation(user_id=user_id, **rec) for rec in recomendaciones)
+
+    with transaction.atomic():
+        if limpiar:
+            con_nuevas = {rec.user_id for rec in nuevas}
+            PersonalizedRecommendation.objects.filter(user_id__in=con_nuevas).delete()
+        PersonalizedRecommendation.objects.bulk_create(nuevas, batch_size=500)
+    reporte['generadas'] = len(nuevas)
+    reporte['tiempos']['escritura'] = time.perf_counter() - inicio
+    return reporte
@@ -0,0 +1,89 @@
+"""
+Rol de administrador del usuario de la sesión.
+
+Un UserProfile es administrador si existe un User de Django con su email
+que sea staff o superusuario. En vez de buscar ese User en cada render, el
+resultado se guarda en la sesión junto con la versión de roles vigente
+(una entrada del cache de Django). Guardar o borrar un User que cambie
+is_staff/is_superuser/email sube la versión e invalida todos los
+resultados guardados. Como red de seguridad (por ejemplo con un cache
+local por proceso) cada resultado vence a los ROLES_TTL segundos.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import perfil as perfil_sesion
+
+
+CLAVE_SESION = 'rol_admin'
+CLAVE_VERSION = 'roles:version'
+CAMPOS_ROL = {'is_staff', 'is_superuser', 'email'}
+
+
+def version():
+    """Versión actual de los roles (cambia cada vez que se invalida)"""
+    cache.add(CLAVE_VERSION, 1, timeout=None)
+    return cache.get(CLAVE_VERSION) or 1
+
+
+def invalidar():
+    """Invalida el rol guardado en todas las sesiones"""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, 2, timeout=None)
+
+
+def consultar_admin(email):
+    """Consulta sin caché: ¿hay un User de Django staff o superusuario con ese email?"""
+    return User.objects.filter(email=email).filter(
+        Q(is_staff=True) | Q(is_superuser=True)
+    ).exists()
+
+
+def es_admin(request):
+    """Si el usuario de la sesión es administrador (con caché en la sesión)"""
+    if hasattr(request, '_es_admin'):
+        return request._es_admin
+
+    user_profile = perfil_sesion.obtener(request)
+    if user_profile is None:
+        return False
+
+    ahora = time.time()
+    vigente = version()
+    guardado = request.session.get(CLAVE_SESION)
+    if (
+        guardado
+        and guardado.get('user_id') == user_profile.id
+        and guardado.get('email') == user_profile.email
+        and guardado.get('version') == vigente
+        and guardado.get('expira', 0) > ahora
+    ):
+        admin = guardado['admin']
+    else:
+        admin = consultar_admin(user_profile.email)
+        request.session[CLAVE_SESION] = {
+            'user_id': user_profile.id,
+            'email': user_profile.email,
+            'admin': admin,
+            'version': vigente,
+            'expira': ahora + getattr(settings, 'ROLES_TTL', 300),
+        }
+    request._es_admin = admin
+    return admin
+
+
+def usuario_guardado(sender, instance, created=False, update_fields=None, **kwargs):
+    """post_save de User: invalida si pudo cambiar el rol (no con solo last_login)"""
+    if update_fields is not None and not CAMPOS_ROL.intersection(update_fields):
+        return
+    invalidar()
+
+
+def usuario_borrado(sender, instance, **kwargs):
+    invalidar()
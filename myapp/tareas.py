@@ -0,0 +1,189 @@
+"""
+Cola de trabajos en segundo plano guardada en la base de datos.
+
+Los trabajos se encolan en la tabla TareaSegundoPlano (un solo trabajo
+activo por tipo y usuario) y los procesa un número fijo de hilos, ya sea
+dentro del proceso web (TAREAS_MODO = 'proceso') o con el comando
+`python manage.py run_workers` (TAREAS_MODO = 'comando'). Los trabajos
+fallidos se reintentan con espera exponencial y los que quedan "en
+proceso" tras reiniciarse un worker se recuperan automáticamente.
+"""
+import contextvars
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metricas
+
+
+# Función que ejecuta cada tipo de trabajo. Recibe el usuario (o None) y
+# los datos del trabajo como argumentos con nombre, y debe lanzar una
+# excepción si el trabajo no pudo completarse.
+MANEJADORES = {
+    'pool_evaluacion': 'myapp.pool.reponer_evaluaciones',
+    'pool_frase': 'myapp.pool.reponer_frases',
+    'aviso_bloqueo': 'myapp.acceso.enviar_aviso_bloqueo',
+}
+
+_lock = threading.Lock()
+_hilos = []
+_hay_trabajo = threading.Event()
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def clave_tarea(tipo, user=None, datos=None):
+    clave = f"{tipo}:{user.id if user else 'global'}"
+    if datos:
+        clave += ':' + ','.join(f"{k}={v}" for k, v in sorted(datos.items()))
+    return clave
+
+
+def encolar(tipo, user=None, datos=None):
+    """
+    Encola un trabajo si no hay otro pendiente o en proceso del mismo tipo
+    para el mismo usuario y con los mismos datos. Retorna la tarea creada o
+    None si ya existía.
+    """
+    from .models import TareaSegundoPlano
+
+    if tipo not in MANEJADORES:
+        raise ValueError(f"Tipo de tarea desconocido: {tipo}")
+
+    clave = clave_tarea(tipo, user, datos)
+    if TareaSegundoPlano.objects.filter(clave=clave, estado__in=['pendiente', 'en_proceso']).exists():
+        return None
+
+    try:
+        with transaction.atomic():
+            tarea = TareaSegundoPlano.objects.create(tipo=tipo, user=user, clave=clave, datos=datos or {})
+    except IntegrityError:
+        # Otro request encoló el mismo trabajo al mismo tiempo
+        return None
+
+    if _config('TAREAS_MODO', 'proceso') == 'proceso':
+        iniciar_trabajadores()
+    _hay_trabajo.set()
+    return tarea
+
+
+def _recuperar_abandonadas():
+    """Devuelve a la cola los trabajos "en proceso" de workers que murieron o se reciclaron"""
+    from .models import TareaSegundoPlano
+
+    limite = timezone.now() - timedelta(seconds=_config('TAREAS_TIEMPO_MAXIMO', 600))
+    TareaSegundoPlano.objects.filter(
+        estado='en_proceso',
+        fecha_actualizacion__lt=limite
+    ).update(estado='pendiente', fecha_actualizacion=timezone.now())
+
+
+def tomar_siguiente():
+    """Reclama atómicamente el siguiente trabajo listo para ejecutarse (o None)"""
+    from .models import TareaSegundoPlano
+
+    _recuperar_abandonadas()
+    candidatos = TareaSegundoPlano.objects.filter(
+        estado='pendiente',
+        ejecutar_despues__lte=timezone.now()
+    ).values_list('id', flat=True)[:5]
+
+    for tarea_id in candidatos:
+        reclamada = TareaSegundoPlano.objects.filter(id=tarea_id, estado='pendiente').update(
+            estado='en_proceso',
+            fecha_actualizacion=timezone.now()
+        )
+        if reclamada:
+            return TareaSegundoPlano.objects.select_related('user').get(id=tarea_id)
+    return None
+
+
+def ejecutar(tarea):
+    """Ejecuta un trabajo reclamado; si falla lo reprograma con espera exponencial"""
+    # Las llamadas externas del trabajo se atribuyen a "tarea:<tipo>" en las métricas
+    contexto = contextvars.copy_context()
+    contexto.run(metricas.fijar_vista, f'tarea:{tarea.tipo}')
+    try:
+        manejador = import_string(MANEJADORES[tarea.tipo])
+        contexto.run(manejador, tarea.user, **(tarea.datos or {}))
+    except Exception as e:
+        print(f"Error en tarea {tarea.tipo} ({tarea.clave}): {str(e)}")
+        tarea.intentos += 1
+        tarea.ultimo_error = str(e)
+        if tarea.intentos >= _config('TAREAS_MAX_INTENTOS', 3):
+            tarea.estado = 'fallida'
+        else:
+            espera = _config('TAREAS_ESPERA_BASE', 30) * (2 ** (tarea.intentos - 1))
+            tarea.estado = 'pendiente'
+            tarea.ejecutar_despues = timezone.now() + timedelta(seconds=espera)
+        tarea.save()
+        return False
+    finally:
+        metricas.guardar_si_corresponde()
+
+    # Los resultados quedan en sus propias tablas; la tarea ya no es necesaria
+    tarea.delete()
+    return True
+
+
+def procesar_pendientes(maximo=None):
+    """Procesa trabajos listos hasta vaciar la cola (o hasta `maximo`). Retorna cuántos ejecutó"""
+    procesadas = 0
+    while maximo is None or procesadas < maximo:
+        tarea = tomar_siguiente()
+        if tarea is None:
+            break
+        ejecutar(tarea)
+        procesadas += 1
+    return procesadas
+
+
+def _bucle_trabajador(detener=None):
+    intervalo = _config('TAREAS_INTERVALO', 5)
+    while detener is None or not detener.is_set():
+        try:
+            close_old_connections()
+            if procesar_pendientes(maximo=1) == 0:
+                _hay_trabajo.wait(intervalo)
+                _hay_trabajo.clear()
+        except Exception as e:
+            print(f"Error en trabajador de tareas: {str(e)}")
+            _hay_trabajo.wait(intervalo)
+        finally:
+            close_old_connections()
+
+
+def iniciar_trabajadores(cantidad=None, detener=None):
+    """Arranca (una sola vez por proceso) el pool fijo de hilos trabajadores"""
+    cantidad = cantidad or _config('TAREAS_HILOS', 2)
+    with _lock:
+        vivos = [h for h in _hilos if h.is_alive()]
+        _hilos[:] = vivos
+        for i in range(len(vivos), cantidad):
+            hilo = threading.Thread(
+                target=_bucle_trabajador,
+                args=(detener,),
+                name=f'tareas-{i}'
+            )
+            hilo.daemon = True
+            hilo.start()
+            _hilos.append(hilo)
+        return list(_hilos)
+
+
+def profundidad_cola():
+    """Cantidad de trabajos por tipo y estado, p. ej. {'pool_frase': {'pendiente': 1}}"""
+    from .models import TareaSegundoPlano
+
+    resumen = {}
+    filas = TareaSegundoPlano.objects.values('tipo', 'estado').annotate(total=Count('id'))
+    for fila in filas:
+        resumen.setdefault(fila['tipo'], {})[fila['estado']] = fila['total']
+    return resumen
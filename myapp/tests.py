@@ -131,6 +131,8 @@ class ExpenseTest(TestCase):
 
 class InvestmentTest(TestCase):
     def setUp(self):
+        from . import precios
+        precios.reiniciar()  # Que el precio de AAPL de otro test no quede en memoria
         self.user = UserProfile.objects.create(
             email='test4@example.com', 
             password=make_password('pass'),
@@ -155,7 +157,7 @@ class InvestmentTest(TestCase):
         """Test cálculo del total invertido"""
         self.assertEqual(self.investment.total_invested(), 750.0)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_current_price(self, mock_get):
         """Test obtención del precio actual"""
         mock_response = MagicMock()
@@ -165,7 +167,7 @@ class InvestmentTest(TestCase):
         price = self.investment.get_current_price()
         self.assertEqual(price, 175.50)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_current_value(self, mock_get):
         """Test cálculo del valor actual"""
         mock_response = MagicMock()
@@ -175,7 +177,7 @@ class InvestmentTest(TestCase):
         current_value = self.investment.current_value()
         self.assertEqual(current_value, 877.5)  # 5 * 175.50
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_profit_loss(self, mock_get):
         """Test cálculo de ganancia/pérdida"""
         mock_response = MagicMock()
@@ -339,7 +341,7 @@ class FormsTest(TestCase):
         form = LoginForm(data=form_data)
         self.assertFalse(form.is_valid())
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_register_form_valid(self, mock_get):
         """Test formulario de registro válido"""
         # Mock de la API de validación de email
@@ -446,7 +448,7 @@ class ViewsTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'form')
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     @patch('django.core.mail.send_mail')
     def test_register_view_post_valid(self, mock_send_mail, mock_get):
         """Test vista de registro POST válido"""
@@ -559,7 +561,7 @@ class ViewsTest(TestCase):
         response = self.client.get('/profile/')
         self.assertEqual(response.status_code, 200)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_investment_view_with_api(self, mock_get):
         """Test vista de inversiones con API mock"""
         mock_response = MagicMock()
@@ -593,7 +595,7 @@ class IntegrationTest(TestCase):
             monthly_limit=2000.0
         )
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     @patch('django.core.mail.send_mail')
     def test_complete_user_flow(self, mock_send_mail, mock_get):
         """Test flujo completo: registro, login, agregar tarjeta, registrar gasto"""
@@ -857,8 +859,8 @@ class AdditionalViewsTest(TestCase):
         """Test GET de chatbot_view"""
         response = self.client.get('/chatbot/')
         self.assertEqual(response.status_code, 200)
-        # Verificar que se inicializó chat_historial si no existía
-        self.assertIn('chat_historial', self.client.session)
+        # El historial ya no se guarda en la sesión (ver ContextoChatUsuario)
+        self.assertNotIn('chat_historial', self.client.session)
 
     @patch('myapp.views.client')
     def test_chatbot_view_get_no_historial(self, mock_client):
@@ -871,9 +873,9 @@ class AdditionalViewsTest(TestCase):
         
         response = self.client.get('/chatbot/')
         self.assertEqual(response.status_code, 200)
-        # Verificar que se inicializó chat_historial (líneas 375-376)
-        self.assertIn('chat_historial', self.client.session)
-        self.assertEqual(self.client.session['chat_historial'], [])
+        # Sin historial la vista muestra una conversación vacía
+        self.assertEqual(list(response.context['historial']), [])
+        self.assertNotIn('chat_historial', self.client.session)
 
     @patch('myapp.views.client')
     def test_chatbot_view_post(self, mock_client):
@@ -1061,7 +1063,7 @@ class AdditionalViewsTest(TestCase):
         self.assertEqual(response.status_code, 302)  # Redirige a profile
         self.assertFalse(PaymentMethod.objects.filter(id=card.id).exists())
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_delete_investment_view(self, mock_get):
         """Test delete_investment_view"""
         mock_response = MagicMock()
@@ -1245,7 +1247,7 @@ class AdditionalModelsTest(TestCase):
             price_at_purchase=150.0
         )
         
-        with patch('requests.get') as mock_get:
+        with patch('requests.Session.get') as mock_get:
             mock_response = MagicMock()
             mock_response.json.return_value = {}  # Sin precio
             mock_get.return_value = mock_response
@@ -1263,7 +1265,7 @@ class AdditionalModelsTest(TestCase):
             price_at_purchase=150.0
         )
         
-        with patch('requests.get') as mock_get:
+        with patch('requests.Session.get') as mock_get:
             mock_response = MagicMock()
             mock_response.json.return_value = {}
             mock_get.return_value = mock_response
@@ -1299,7 +1301,7 @@ class AdditionalFormsTest(TestCase):
         form = MonthlyLimitForm(data={'monthly_limit': 1500.0})
         self.assertTrue(form.is_valid())
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_register_form_invalid_email_format(self, mock_get):
         """Test RegisterForm con email de formato inválido - cubre línea 139"""
         mock_response = MagicMock()
@@ -1322,7 +1324,7 @@ class AdditionalFormsTest(TestCase):
         errors_str = str(form.errors).lower()
         self.assertTrue('formato' in errors_str or 'válido' in errors_str)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_register_form_deliverability_not_deliverable(self, mock_get):
         """Test RegisterForm con deliverability != DELIVERABLE - cubre línea 147"""
         mock_response = MagicMock()
@@ -1345,7 +1347,7 @@ class AdditionalFormsTest(TestCase):
         errors_str = str(form.errors).lower()
         self.assertTrue('verificar' in errors_str or 'acepte' in errors_str or 'deliverable' in errors_str)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_register_form_disposable_email(self, mock_get):
         """Test RegisterForm con email desechable"""
         mock_response = MagicMock()
@@ -1672,7 +1674,7 @@ class EdgeCasesTest(TestCase):
         response = self.client.post('/trivia/', {'opcion_seleccionada': 'b'})
         self.assertEqual(response.status_code, 200)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_investment_view_api_error(self, mock_get):
         """Test investment_view con error de API"""
         mock_get.side_effect = Exception("API Error")
@@ -1847,7 +1849,7 @@ class AdditionalCoverageTest(TestCase):
         session['user_id'] = self.user.id
         session.save()
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_register_view_post_invalid(self, mock_get):
         """Test register_view POST con formulario inválido"""
         mock_response = MagicMock()
@@ -1889,7 +1891,7 @@ class AdditionalCoverageTest(TestCase):
         response = self.client.get('/inversiones/')
         self.assertEqual(response.status_code, 200)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_investment_view_post_no_price(self, mock_get):
         """Test investment_view POST sin precio en respuesta"""
         mock_response = MagicMock()
@@ -1904,7 +1906,7 @@ class AdditionalCoverageTest(TestCase):
         # Verificar que se mostró el mensaje de error
         self.assertContains(response, 'No se pudo obtener', status_code=200)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_investment_view_post_valid_with_price(self, mock_get):
         """Test investment_view POST válido con precio - cubre líneas 412->438"""
         mock_response = MagicMock()
@@ -2337,7 +2339,7 @@ class AdditionalCoverageTest(TestCase):
         })
         self.assertEqual(response.status_code, 200)  # Debe renderizar con errores
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     @patch('django.core.mail.send_mail')
     def test_register_view_send_mail_exception(self, mock_send_mail, mock_get):
         """Test register_view cuando send_mail lanza excepción - cubre líneas 128-129"""
@@ -2764,6 +2766,2264 @@ class AdditionalCoverageTest(TestCase):
         self.assertEqual(self.user.points, 30)
 
 
+class GeminiRegistroTest(TestCase):
+    """Tests para el registro compartido del modelo de Gemini"""
+
+    def setUp(self):
+        from . import gemini
+        self.gemini = gemini
+        gemini.reiniciar()
+
+    def tearDown(self):
+        self.gemini.reiniciar()
+
+    def test_sin_api_key_no_resuelve(self):
+        """Sin GEMINI_API_KEY no se prueba ningún modelo"""
+        with self.settings(GEMINI_API_KEY=''), patch('myapp.gemini._resolver') as mock_resolver:
+            self.assertIsNone(self.gemini.obtener_modelo())
+            mock_resolver.assert_not_called()
+
+    def test_resuelve_una_sola_vez(self):
+        """El modelo se resuelve una vez y se reutiliza en llamadas siguientes"""
+        modelo = MagicMock()
+        with self.settings(GEMINI_API_KEY='key'), \
+                patch('myapp.gemini._resolver', return_value=('gemini-2.0-flash', modelo)) as mock_resolver:
+            self.assertIs(self.gemini.obtener_modelo(), modelo)
+            self.assertIs(self.gemini.obtener_modelo(), modelo)
+            self.assertEqual(mock_resolver.call_count, 1)
+            self.assertEqual(self.gemini.nombre_modelo(), 'gemini-2.0-flash')
+
+    def test_resolucion_fallida_no_reintenta_inmediatamente(self):
+        """Si ningún modelo responde, no se vuelve a sondear en cada request"""
+        with self.settings(GEMINI_API_KEY='key'), \
+                patch('myapp.gemini._resolver', return_value=(None, None)) as mock_resolver:
+            self.assertIsNone(self.gemini.obtener_modelo())
+            self.assertIsNone(self.gemini.obtener_modelo())
+            self.assertEqual(mock_resolver.call_count, 1)
+
+    def test_generar_contenido_no_hace_pruebas_extra(self):
+        """Cada llamada usa el modelo resuelto sin prompts de prueba adicionales"""
+        modelo = MagicMock()
+        modelo.generate_content.return_value = MagicMock(text='hola')
+        with self.settings(GEMINI_API_KEY='key'), \
+                patch('myapp.gemini._resolver', return_value=('gemini-2.0-flash', modelo)):
+            self.gemini.generar_contenido('uno')
+            self.gemini.generar_contenido('dos')
+        self.assertEqual(modelo.generate_content.call_count, 2)
+
+    def test_fallo_dentro_del_ttl_no_resondea(self):
+        """Un fallo poco después de verificar el modelo no dispara un re-sondeo"""
+        modelo = MagicMock()
+        with self.settings(GEMINI_API_KEY='key', GEMINI_MODELO_TTL=600), \
+                patch('myapp.gemini._resolver', return_value=('gemini-2.0-flash', modelo)), \
+                patch('myapp.gemini.threading.Thread') as mock_thread:
+            self.gemini.obtener_modelo()
+            self.gemini.reportar_fallo()
+            mock_thread.assert_not_called()
+
+    def test_fallo_tras_ttl_resondea_en_segundo_plano(self):
+        """Tras expirar el TTL, un fallo re-sondea en segundo plano y cambia de modelo"""
+        viejo, nuevo = MagicMock(), MagicMock()
+        with self.settings(GEMINI_API_KEY='key', GEMINI_MODELO_TTL=0), \
+                patch('myapp.gemini._resolver', side_effect=[('viejo', viejo), ('nuevo', nuevo)]):
+            self.assertIs(self.gemini.obtener_modelo(), viejo)
+            with patch('myapp.gemini.threading.Thread') as mock_thread:
+                self.gemini.reportar_fallo()
+                self.gemini.reportar_fallo()
+                # Solo un re-sondeo a la vez
+                self.assertEqual(mock_thread.call_count, 1)
+                target = mock_thread.call_args.kwargs['target']
+            target()
+            self.assertIs(self.gemini.obtener_modelo(), nuevo)
+
+
+class EvaluacionConcurrenteTest(TestCase):
+    """Tests para la generación concurrente de evaluaciones"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = UserProfile.objects.create(
+            email='eval@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+        session = self.client.session
+        session['user_id'] = self.user.id
+        session.save()
+
+    def test_secciones_lentas_usan_banco_local(self):
+        """Las categorías que no responden antes del límite usan el banco local"""
+        import threading
+        from .views import generar_evaluacion_concurrente, CATEGORIAS_EVALUACION
+        liberar = threading.Event()
+        pregunta_ia = {'pregunta': 'IA', 'opciones': {'A': '1', 'B': '2', 'C': '3', 'D': '4'}, 'respuesta_correcta': 'A'}
+
+        def generar_categoria(categoria, cantidad=10):
+            if categoria == 'fraudes':
+                liberar.wait(5)
+            return [pregunta_ia]
+
+        with patch('myapp.views.generar_preguntas_evaluacion_ia', side_effect=generar_categoria), \
+                patch('myapp.views.generar_preguntas_brecha_teorico_practica_ia', return_value=[pregunta_ia]):
+            preguntas, brecha = generar_evaluacion_concurrente(tiempo_limite=0.5)
+        liberar.set()
+
+        self.assertEqual(list(preguntas.keys()), CATEGORIAS_EVALUACION)
+        self.assertEqual(preguntas['presupuesto'], [pregunta_ia])
+        self.assertTrue(len(preguntas['fraudes']) > 0)
+        self.assertNotIn(pregunta_ia, preguntas['fraudes'])
+        self.assertEqual(brecha['teorico'], [pregunta_ia])
+
+    def test_llamadas_en_paralelo(self):
+        """Las 7 llamadas corren a la vez: la espera total es cercana a la más lenta"""
+        import time
+        from .views import generar_evaluacion_concurrente
+
+        def lenta(*args, **kwargs):
+            time.sleep(0.3)
+            return []
+
+        with patch('myapp.views.generar_preguntas_evaluacion_ia', side_effect=lenta), \
+                patch('myapp.views.generar_preguntas_brecha_teorico_practica_ia', side_effect=lenta):
+            inicio = time.monotonic()
+            generar_evaluacion_concurrente(tiempo_limite=5)
+            duracion = time.monotonic() - inicio
+        self.assertLess(duracion, 1.5)
+
+    def test_sin_banco_local_deja_secciones_vacias(self):
+        """En segundo plano no se rellenan secciones con el banco local"""
+        from .views import generar_evaluacion_concurrente
+        with patch('myapp.views.generar_preguntas_evaluacion_ia', return_value=[]), \
+                patch('myapp.views.generar_preguntas_brecha_teorico_practica_ia', return_value=[]):
+            preguntas, brecha = generar_evaluacion_concurrente(usar_banco_local=False)
+        self.assertTrue(all(p == [] for p in preguntas.values()))
+        self.assertEqual(brecha, {'teorico': [], 'practico': []})
+
+    def test_evaluacion_view_sin_ia_usa_banco_local(self):
+        """Sin IA disponible la evaluación se arma con el banco local"""
+        with self.settings(GEMINI_API_KEY='', TAREAS_MODO='comando'):
+            response = self.client.get('/evaluacion/')
+        self.assertEqual(response.status_code, 200)
+        for preguntas in response.context['preguntas_evaluacion'].values():
+            self.assertTrue(len(preguntas) > 0)
+        self.assertTrue(len(response.context['preguntas_brecha']['teorico']) > 0)
+
+
+class CacheIATest(TestCase):
+    """Tests para la caché persistente de respuestas de la IA"""
+
+    def setUp(self):
+        from . import cache_ia, gemini
+        self.cache_ia = cache_ia
+        self.gemini = gemini
+        gemini.reiniciar()
+        cache_ia.reiniciar_estadisticas()
+        self.modelo = MagicMock()
+        self.modelo.generate_content.return_value = MagicMock(
+            text='```json\n{"es_correcta": true, "es_similar": false, "explicacion": "ok"}\n```'
+        )
+
+    def tearDown(self):
+        self.gemini.reiniciar()
+
+    def test_clave_depende_de_modelo_prompt_y_parametros(self):
+        """La clave cambia si cambia el modelo, el prompt o los parámetros"""
+        base = self.cache_ia.calcular_clave('m1', 'hola', {'t': 1})
+        self.assertEqual(base, self.cache_ia.calcular_clave('m1', 'hola', {'t': 1}))
+        self.assertNotEqual(base, self.cache_ia.calcular_clave('m2', 'hola', {'t': 1}))
+        self.assertNotEqual(base, self.cache_ia.calcular_clave('m1', 'chau', {'t': 1}))
+        self.assertNotEqual(base, self.cache_ia.calcular_clave('m1', 'hola', {'t': 2}))
+
+    def test_verificacion_usa_cache(self):
+        """La misma verificación solo llama a la IA una vez"""
+        from .views import verificar_respuesta_ia
+        with self.settings(GEMINI_API_KEY='key'), \
+                patch('myapp.gemini._resolver', return_value=('gemini-2.0-flash', self.modelo)):
+            # Un caso dudoso para el verificador local, así que se consulta a la IA
+            primero = verificar_respuesta_ia('presupuesto', 'presupuestación')
+            segundo = verificar_respuesta_ia('presupuesto', '  presupuestación ')
+        self.assertTrue(primero['es_correcta'])
+        self.assertEqual(primero, segundo)
+        self.assertEqual(self.modelo.generate_content.call_count, 1)
+        stats = self.cache_ia.estadisticas()['verificacion']
+        self.assertEqual(stats, {'aciertos': 1, 'fallos': 1})
+
+    def test_familia_sin_ttl_no_se_cachea(self):
+        """Las familias con TTL 0 siempre llaman a la IA"""
+        from .models import RespuestaIACache
+        with self.settings(GEMINI_API_KEY='key', IA_CACHE_TTL={'frase': 0}), \
+                patch('myapp.gemini._resolver', return_value=('gemini-2.0-flash', self.modelo)):
+            self.gemini.generar_json('prompt', familia='frase')
+            self.gemini.generar_json('prompt', familia='frase')
+        self.assertEqual(self.modelo.generate_content.call_count, 2)
+        self.assertFalse(RespuestaIACache.objects.exists())
+
+    def test_respuesta_invalida_no_se_cachea(self):
+        """Una respuesta que no es JSON no queda guardada"""
+        from .models import RespuestaIACache
+        self.modelo.generate_content.return_value = MagicMock(text='no es json')
+        with self.settings(GEMINI_API_KEY='key'), \
+                patch('myapp.gemini._resolver', return_value=('gemini-2.0-flash', self.modelo)):
+            with self.assertRaises(ValueError):
+                self.gemini.generar_json('prompt', familia='verificacion')
+        self.assertFalse(RespuestaIACache.objects.exists())
+
+    def test_entradas_vencidas_no_se_usan(self):
+        """Una entrada vencida cuenta como fallo"""
+        from .models import RespuestaIACache
+        self.cache_ia.guardar('brecha', 'm', 'prompt', '{}')
+        RespuestaIACache.objects.update(expira_en=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(self.cache_ia.obtener('brecha', 'm', 'prompt'))
+
+    def test_limite_desaloja_lo_menos_usado(self):
+        """Al superar el máximo se borran las entradas con acceso más antiguo"""
+        from .models import RespuestaIACache
+        with self.settings(IA_CACHE_MAX_ENTRADAS=2):
+            self.cache_ia.guardar('brecha', 'm', 'uno', '1')
+            self.cache_ia.guardar('brecha', 'm', 'dos', '2')
+            RespuestaIACache.objects.filter(respuesta='1').update(
+                ultimo_acceso=timezone.now() - timedelta(hours=1)
+            )
+            RespuestaIACache.objects.filter(respuesta='2').update(
+                ultimo_acceso=timezone.now() - timedelta(hours=2)
+            )
+            # Acceder a "uno" lo vuelve el más reciente
+            self.assertEqual(self.cache_ia.obtener('brecha', 'm', 'uno'), '1')
+            self.cache_ia.guardar('brecha', 'm', 'tres', '3')
+        self.assertEqual(
+            set(RespuestaIACache.objects.values_list('respuesta', flat=True)), {'1', '3'}
+        )
+
+
+class TareasSegundoPlanoTest(TestCase):
+    """Tests para la cola de trabajos en segundo plano"""
+
+    def setUp(self):
+        from . import tareas
+        self.tareas = tareas
+        self.user = UserProfile.objects.create(
+            email='tareas@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+
+    def test_encolar_no_duplica_trabajos_activos(self):
+        """Solo hay un trabajo activo por tipo y usuario"""
+        from .models import TareaSegundoPlano
+        with self.settings(TAREAS_MODO='comando'):
+            self.assertIsNotNone(self.tareas.encolar('pool_evaluacion', self.user))
+            self.assertIsNone(self.tareas.encolar('pool_evaluacion', self.user))
+            self.assertIsNotNone(self.tareas.encolar('pool_frase', self.user))
+        self.assertEqual(TareaSegundoPlano.objects.count(), 2)
+        self.assertEqual(
+            self.tareas.profundidad_cola(),
+            {'pool_evaluacion': {'pendiente': 1}, 'pool_frase': {'pendiente': 1}}
+        )
+
+    def test_reponer_encola_en_vez_de_crear_hilos(self):
+        """pool.reponer solo encola una vez"""
+        from . import pool
+        from .models import TareaSegundoPlano
+        with self.settings(TAREAS_MODO='comando'), patch('threading.Thread') as mock_thread:
+            pool.reponer('frase')
+            pool.reponer('frase')
+            mock_thread.assert_not_called()
+        self.assertEqual(TareaSegundoPlano.objects.filter(tipo='pool_frase').count(), 1)
+
+    @patch('myapp.views.generar_frase_completar_ia')
+    def test_procesar_trabajo_exitoso(self, mock_generar):
+        """Un trabajo exitoso guarda su resultado y sale de la cola"""
+        from .models import TareaSegundoPlano, FraseCompletar
+        mock_generar.return_value = {'frase_completa': 'La TEA es una tasa', 'palabra_clave': 'TEA'}
+        with self.settings(TAREAS_MODO='comando'):
+            self.tareas.encolar('pool_frase', self.user)
+            self.assertEqual(self.tareas.procesar_pendientes(), 1)
+        self.assertFalse(TareaSegundoPlano.objects.exists())
+        self.assertEqual(FraseCompletar.objects.filter(origen='ia').count(), 1)
+
+    @patch('myapp.views.generar_frase_completar_ia', return_value=None)
+    def test_reintento_con_espera_y_fallo_final(self, mock_generar):
+        """Los fallos se reintentan con espera exponencial hasta el máximo de intentos"""
+        from .models import TareaSegundoPlano
+        with self.settings(TAREAS_MODO='comando', TAREAS_MAX_INTENTOS=2, TAREAS_ESPERA_BASE=60):
+            self.tareas.encolar('pool_frase', self.user)
+            self.tareas.procesar_pendientes()
+            tarea = TareaSegundoPlano.objects.get()
+            self.assertEqual(tarea.estado, 'pendiente')
+            self.assertEqual(tarea.intentos, 1)
+            self.assertGreater(tarea.ejecutar_despues, timezone.now() + timedelta(seconds=50))
+
+            # Todavía no está lista para reintentarse
+            self.assertEqual(self.tareas.procesar_pendientes(), 0)
+
+            TareaSegundoPlano.objects.update(ejecutar_despues=timezone.now())
+            self.tareas.procesar_pendientes()
+            tarea.refresh_from_db()
+            self.assertEqual(tarea.estado, 'fallida')
+            self.assertEqual(tarea.intentos, 2)
+
+            # Una tarea fallida no bloquea encolar una nueva
+            self.assertIsNotNone(self.tareas.encolar('pool_frase', self.user))
+
+    def test_recupera_tareas_abandonadas(self):
+        """Un trabajo que quedó "en proceso" demasiado tiempo vuelve a la cola"""
+        from .models import TareaSegundoPlano
+        with self.settings(TAREAS_MODO='comando', TAREAS_TIEMPO_MAXIMO=60):
+            self.tareas.encolar('pool_frase', self.user)
+            TareaSegundoPlano.objects.update(estado='en_proceso')
+            TareaSegundoPlano.objects.filter(estado='en_proceso').update(
+                fecha_actualizacion=timezone.now() - timedelta(minutes=5)
+            )
+            tarea = self.tareas.tomar_siguiente()
+        # Se recuperó y se volvió a reclamar
+        self.assertIsNotNone(tarea)
+        self.assertEqual(tarea.estado, 'en_proceso')
+        self.assertGreater(tarea.fecha_actualizacion, timezone.now() - timedelta(minutes=1))
+
+    def test_comando_run_workers_estado(self):
+        """run_workers --estado muestra la profundidad de la cola"""
+        from io import StringIO
+        from django.core.management import call_command
+        with self.settings(TAREAS_MODO='comando'):
+            self.tareas.encolar('pool_evaluacion', self.user)
+        salida = StringIO()
+        call_command('run_workers', '--estado', stdout=salida)
+        self.assertIn('pool_evaluacion: pendiente: 1', salida.getvalue())
+
+
+class PoolPregeneradasTest(TestCase):
+    """Tests para el pool compartido de evaluaciones y la reposición de frases"""
+
+    def setUp(self):
+        from . import pool
+        self.pool = pool
+        self.user = UserProfile.objects.create(
+            email='pool@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+        self.otro = UserProfile.objects.create(
+            email='pool2@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Otro',
+            last_name='User'
+        )
+
+    def _pregunta(self, texto):
+        return {
+            'pregunta': texto,
+            'opciones': {'A': '1', 'B': '2', 'C': '3', 'D': '4'},
+            'respuesta_correcta': 'A',
+            'dificultad': 'basico'
+        }
+
+    def test_evaluacion_descarta_preguntas_ya_en_el_pool(self):
+        """Un set nuevo no repite preguntas de sets disponibles"""
+        primero = self.pool.agregar_evaluacion(
+            {'ahorro': [self._pregunta('¿Qué es ahorrar?')]},
+            {'teorico': [], 'practico': []}
+        )
+        segundo = self.pool.agregar_evaluacion(
+            {'ahorro': [self._pregunta('¿Qué es ahorrar?'), self._pregunta('¿Qué es un CTS?')]},
+            {'teorico': [], 'practico': []}
+        )
+        self.assertIsNotNone(primero)
+        self.assertEqual(len(segundo.preguntas_evaluacion['ahorro']), 1)
+        self.assertEqual(segundo.preguntas_evaluacion['ahorro'][0]['pregunta'], '¿Qué es un CTS?')
+        # Un set sin preguntas nuevas no entra al pool
+        self.assertIsNone(self.pool.agregar_evaluacion(
+            {'ahorro': [self._pregunta('¿que es ahorrar?')]}, {}
+        ))
+
+    def test_evaluacion_no_se_repite_y_el_pool_se_comparte(self):
+        """Cada usuario ve cada set una vez; otros usuarios pueden verlo también"""
+        evaluacion = self.pool.agregar_evaluacion({'ahorro': [self._pregunta('¿Qué es ahorrar?')]}, {})
+        with self.settings(TAREAS_MODO='comando', POOL_OBJETIVOS={'evaluacion': 0}):
+            self.assertEqual(self.pool.tomar_evaluacion(self.user), evaluacion)
+            self.assertIsNone(self.pool.tomar_evaluacion(self.user))
+            self.assertEqual(self.pool.tomar_evaluacion(self.otro), evaluacion)
+        evaluacion.refresh_from_db()
+        self.assertEqual(evaluacion.veces_servida, 2)
+        self.assertFalse(evaluacion.usada)
+
+    def test_retira_tras_usos_maximos(self):
+        """Un set servido POOL_USOS_MAXIMOS veces sale del pool"""
+        evaluacion = self.pool.agregar_evaluacion({'ahorro': [self._pregunta('¿Qué es ahorrar?')]}, {})
+        with self.settings(TAREAS_MODO='comando', POOL_OBJETIVOS={'evaluacion': 0}, POOL_USOS_MAXIMOS=1):
+            self.pool.tomar_evaluacion(self.user)
+            self.assertIsNone(self.pool.tomar_evaluacion(self.otro))
+        evaluacion.refresh_from_db()
+        self.assertTrue(evaluacion.usada)
+
+    def test_reponedor_llena_hasta_el_objetivo(self):
+        """El trabajo de reposición agrega frases al banco hasta cubrir el déficit y luego no se encola más"""
+        from . import tareas
+        from .models import FraseCompletar
+        frases = iter([
+            {'frase_completa': f'Frase número {i} sobre ahorro', 'palabra_clave': 'ahorro'}
+            for i in range(10)
+        ])
+        with self.settings(TAREAS_MODO='comando', POOL_OBJETIVOS={'frase': 3}, POOL_LOTE=5), \
+                patch('myapp.views.generar_frase_completar_ia', side_effect=lambda **kwargs: next(frases)):
+            self.assertIsNotNone(self.pool.reponer('frase'))
+            tareas.procesar_pendientes()
+            self.assertIsNone(self.pool.reponer('frase'))
+            self.assertEqual(self.pool.inventario()['frase'], {'disponibles': 3, 'objetivo': 3})
+        self.assertEqual(FraseCompletar.objects.filter(origen='ia').count(), 3)
+
+    def test_usuario_sin_contenido_nuevo_fuerza_reposicion(self):
+        """Si el usuario ya vio todo el pool se encola reposición aunque se cumpla el objetivo"""
+        from .models import TareaSegundoPlano
+        evaluacion = self.pool.agregar_evaluacion({'ahorro': [self._pregunta('¿Qué es ahorrar?')]}, {})
+        evaluacion.usada_por.add(self.user)
+        with self.settings(TAREAS_MODO='comando', POOL_OBJETIVOS={'evaluacion': 1}):
+            self.assertIsNone(self.pool.tomar_evaluacion(self.user))
+        self.assertTrue(TareaSegundoPlano.objects.filter(tipo='pool_evaluacion').exists())
+
+
+class EvaluacionServidaTest(TestCase):
+    """Tests para calificar la evaluación contra el set que se mostró"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = UserProfile.objects.create(
+            email='servida@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+        session = self.client.session
+        session['user_id'] = self.user.id
+        session.save()
+        pregunta = {
+            'pregunta': '¿Qué es ahorrar?',
+            'opciones': {'A': 'Guardar', 'B': 'Gastar', 'C': 'Prestar', 'D': 'Nada'},
+            'respuesta_correcta': 'A',
+            'dificultad': 'basico'
+        }
+        self.preguntas_evaluacion = {c: [pregunta] for c in ['presupuesto', 'ahorro', 'credito', 'inversiones', 'fraudes']}
+        self.preguntas_brecha = {'teorico': [pregunta], 'practico': [pregunta]}
+
+    def _mostrar(self):
+        with self.settings(TAREAS_MODO='comando'), \
+                patch('myapp.views.generar_evaluacion',
+                      return_value=(self.preguntas_evaluacion, self.preguntas_brecha)):
+            return self.client.get('/evaluacion/')
+
+    def test_get_fija_el_set_mostrado(self):
+        """El GET guarda el set mostrado y lo referencia en el formulario"""
+        from .models import EvaluacionServida
+        response = self._mostrar()
+        servida = EvaluacionServida.objects.get(user=self.user)
+        self.assertEqual(servida.preguntas_evaluacion, self.preguntas_evaluacion)
+        self.assertContains(response, f'value="{servida.id}"')
+        self.assertEqual(self.client.session['evaluacion_servida_id'], str(servida.id))
+
+    def test_post_califica_sin_generar(self):
+        """El POST califica contra el set fijado y no llama a la IA ni al pool"""
+        from .models import EvaluacionServida, FinancialCompetencyAssessment
+        self._mostrar()
+        servida = EvaluacionServida.objects.get(user=self.user)
+        datos = {f'pregunta_{c}_0': 'A' for c in self.preguntas_evaluacion}
+        datos.update({'evaluacion_servida_id': str(servida.id), 'brecha_teorico_0': 'A', 'brecha_practico_0': 'A'})
+        with patch('myapp.views.generar_evaluacion') as mock_generar, \
+                patch('myapp.pool.tomar_evaluacion') as mock_pool:
+            response = self.client.post('/evaluacion/', datos)
+            mock_generar.assert_not_called()
+            mock_pool.assert_not_called()
+        self.assertRedirects(response, '/progreso-individual/', fetch_redirect_response=False)
+        assessment = FinancialCompetencyAssessment.objects.get(user=self.user)
+        self.assertEqual(assessment.conocimiento_ahorro, 5)
+        self.assertEqual(assessment.conocimiento_teorico, 5)
+        servida.refresh_from_db()
+        self.assertIsNotNone(servida.fecha_respuesta)
+
+    def test_post_repetido_no_califica_dos_veces(self):
+        """Reenviar el mismo formulario no crea otra evaluación"""
+        from .models import EvaluacionServida, FinancialCompetencyAssessment
+        self._mostrar()
+        servida_id = str(EvaluacionServida.objects.get(user=self.user).id)
+        self.client.post('/evaluacion/', {'evaluacion_servida_id': servida_id})
+        response = self.client.post('/evaluacion/', {'evaluacion_servida_id': servida_id})
+        self.assertRedirects(response, '/evaluacion/', fetch_redirect_response=False)
+        self.assertEqual(FinancialCompetencyAssessment.objects.filter(user=self.user).count(), 1)
+
+    def test_post_sin_set_valido_redirige(self):
+        """Un id inexistente o de otro usuario no se califica"""
+        from .models import EvaluacionServida, FinancialCompetencyAssessment
+        otro = UserProfile.objects.create(email='otro@example.com', password='x', first_name='O', last_name='U')
+        ajena = EvaluacionServida.objects.create(
+            user=otro, preguntas_evaluacion=self.preguntas_evaluacion, preguntas_brecha=self.preguntas_brecha
+        )
+        for valor in ['no-es-un-uuid', str(ajena.id)]:
+            response = self.client.post('/evaluacion/', {'evaluacion_servida_id': valor})
+            self.assertRedirects(response, '/evaluacion/', fetch_redirect_response=False)
+        self.assertFalse(FinancialCompetencyAssessment.objects.exists())
+
+    def test_recargar_muestra_la_misma_evaluacion(self):
+        """Recargar la página reutiliza el set abierto; regenerar crea otro"""
+        from .models import EvaluacionServida
+        self._mostrar()
+        with patch('myapp.views.generar_evaluacion') as mock_generar, \
+                patch('myapp.pool.tomar_evaluacion') as mock_pool:
+            response = self.client.get('/evaluacion/')
+            mock_generar.assert_not_called()
+            mock_pool.assert_not_called()
+        servida = EvaluacionServida.objects.get(user=self.user)
+        self.assertContains(response, f'value="{servida.id}"')
+        with patch('myapp.views.generar_evaluacion',
+                   return_value=(self.preguntas_evaluacion, self.preguntas_brecha)):
+            self.client.get('/evaluacion/?regenerar=1')
+        self.assertEqual(EvaluacionServida.objects.filter(user=self.user).count(), 2)
+
+    def test_error_al_calificar_deja_la_evaluacion_abierta(self):
+        """Si la calificación falla no se marca como respondida y se puede reenviar"""
+        from .models import EvaluacionServida, FinancialCompetencyAssessment
+        self._mostrar()
+        servida = EvaluacionServida.objects.get(user=self.user)
+        datos = {'evaluacion_servida_id': str(servida.id)}
+        with patch('myapp.views.UserMetrics.actualizar_mejora', side_effect=RuntimeError('falló')):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/evaluacion/', datos)
+        servida.refresh_from_db()
+        self.assertIsNone(servida.fecha_respuesta)
+        self.assertFalse(FinancialCompetencyAssessment.objects.exists())
+        response = self.client.post('/evaluacion/', datos)
+        self.assertRedirects(response, '/progreso-individual/', fetch_redirect_response=False)
+        servida.refresh_from_db()
+        self.assertIsNotNone(servida.fecha_respuesta)
+
+
+class EvaluacionUnaLlamadaTest(TestCase):
+    """Tests para la evaluación generada en una sola llamada en streaming"""
+
+    def setUp(self):
+        from . import evaluacion_ia, gemini
+        self.evaluacion_ia = evaluacion_ia
+        self.gemini = gemini
+        gemini.reiniciar()
+
+    def tearDown(self):
+        self.gemini.reiniciar()
+
+    def _pregunta(self, texto, correcta='B'):
+        return {
+            'pregunta': texto,
+            'opciones': {'A': 'Uno', 'B': 'Dos', 'C': 'Tres', 'D': 'Cuatro'},
+            'respuesta_correcta': correcta,
+            'dificultad': 'facil'
+        }
+
+    def _documento(self, cantidad=10):
+        secciones = {}
+        for seccion in self.evaluacion_ia.CATEGORIAS_EVALUACION:
+            secciones[seccion] = [self._pregunta(f'{seccion} {i}') for i in range(cantidad)]
+        for seccion in self.evaluacion_ia.SECCIONES_BRECHA:
+            secciones[seccion] = [self._pregunta(f'{seccion} {i}') for i in range(5)]
+        return json.dumps(secciones, ensure_ascii=False)
+
+    def _modelo_stream(self, texto, tamanio=37):
+        modelo = MagicMock()
+        modelo.generate_content.side_effect = lambda *a, **k: iter(
+            [MagicMock(text=texto[i:i + tamanio]) for i in range(0, len(texto), tamanio)]
+        )
+        return modelo
+
+    def test_parser_por_fragmentos(self):
+        """El parser arma las secciones aunque el JSON llegue en trozos y con bloque markdown"""
+        texto = '```json\n' + self._documento() + '\n```'
+        parser = self.evaluacion_ia.ParserEvaluacion()
+        for i in range(0, len(texto), 7):
+            parser.alimentar(texto[i:i + 7])
+        resultado = parser.resultado()
+        self.assertEqual(len(resultado), 7)
+        self.assertEqual(len(resultado['ahorro']), 10)
+        self.assertEqual(resultado['teorico'][0]['pregunta'], 'teorico 0')
+        self.assertEqual(parser.completas, set(resultado))
+
+    def test_parser_recupera_secciones_parciales(self):
+        """Si el stream se corta, se conservan las preguntas ya cerradas"""
+        texto = self._documento()
+        corte = texto.index('"credito"') + 400
+        parser = self.evaluacion_ia.ParserEvaluacion()
+        parser.alimentar(texto[:corte])
+        resultado = parser.resultado()
+        self.assertEqual(len(resultado['presupuesto']), 10)
+        self.assertIn('credito', resultado)
+        self.assertLess(len(resultado['credito']), 10)
+        self.assertNotIn('credito', parser.completas)
+        self.assertNotIn('fraudes', resultado)
+
+    def test_parser_descarta_preguntas_invalidas(self):
+        """Preguntas sin 4 opciones o con respuesta inválida se descartan; las comillas escapadas no confunden al parser"""
+        mala = self._pregunta('Sin opción D')
+        del mala['opciones']['D']
+        texto = json.dumps({
+            'ahorro': [
+                self._pregunta('¿Qué es un "fondo" de {emergencia}?', correcta=' c '),
+                mala,
+                self._pregunta('Respuesta Z', correcta='Z'),
+            ]
+        }, ensure_ascii=False)
+        parser = self.evaluacion_ia.ParserEvaluacion()
+        parser.alimentar(texto)
+        self.assertEqual(parser.descartadas, 2)
+        self.assertEqual(parser.resultado()['ahorro'][0]['respuesta_correcta'], 'C')
+
+    def test_una_sola_llamada_con_esquema(self):
+        """Toda la evaluación sale de una única llamada con esquema JSON"""
+        modelo = self._modelo_stream(self._documento())
+        with self.settings(GEMINI_API_KEY='key'), patch('myapp.gemini._resolver', return_value=('m', modelo)):
+            preguntas, brecha = self.evaluacion_ia.generar_en_una_llamada()
+        self.assertEqual(modelo.generate_content.call_count, 1)
+        kwargs = modelo.generate_content.call_args.kwargs
+        self.assertTrue(kwargs['stream'])
+        self.assertEqual(kwargs['generation_config']['response_mime_type'], 'application/json')
+        self.assertEqual(set(preguntas), set(self.evaluacion_ia.CATEGORIAS_EVALUACION))
+        self.assertEqual(len(brecha['practico']), 5)
+
+    def test_secciones_incompletas_se_completan_con_banco(self):
+        """generar_evaluacion usa el banco local para las secciones con pocas preguntas válidas"""
+        from .views import generar_evaluacion
+        modelo = self._modelo_stream(self._documento(cantidad=3))
+        with self.settings(GEMINI_API_KEY='key', EVALUACION_MODO_GENERACION='una_llamada'), \
+                patch('myapp.gemini._resolver', return_value=('m', modelo)), \
+                patch('myapp.views.generar_preguntas_evaluacion_ia') as mock_seccion:
+            preguntas, brecha = generar_evaluacion(tiempo_limite=5)
+            mock_seccion.assert_not_called()
+        # 3 de 10 no alcanza el mínimo: las categorías vienen del banco local
+        self.assertEqual(len(preguntas['ahorro']), 10)
+        self.assertNotIn('ahorro 0', [p['pregunta'] for p in preguntas['ahorro']])
+        # La brecha sí llegó completa desde la IA
+        self.assertEqual(brecha['teorico'][0]['pregunta'], 'teorico 0')
+
+    def test_limite_de_tiempo_cierra_el_stream(self):
+        """Al vencer el límite, el hilo deja de leer el stream y lo cierra en el siguiente fragmento"""
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        leidos = []
+        cerrado = threading.Event()
+        seguir = threading.Event()
+
+        def stream_lento(*args, **kwargs):
+            try:
+                for i in range(100):
+                    if i == 1:
+                        seguir.wait(5)
+                    leidos.append(i)
+                    yield ' '
+            finally:
+                cerrado.set()
+
+        with ThreadPoolExecutor(max_workers=1) as executor, \
+                patch('myapp.gemini.generar_contenido_stream', side_effect=stream_lento):
+            preguntas, brecha = self.evaluacion_ia.generar_en_una_llamada(tiempo_limite=0.2, executor=executor)
+            seguir.set()
+            self.assertTrue(cerrado.wait(5))
+        self.assertEqual((preguntas, brecha), ({}, {}))
+        self.assertLess(len(leidos), 100)
+
+
+
+class ChatbotStreamTest(TestCase):
+    """Tests para el chatbot por Server-Sent Events"""
+
+    def setUp(self):
+        from . import gemini
+        self.gemini = gemini
+        gemini.reiniciar()
+        self.client = Client()
+        self.user = UserProfile.objects.create(
+            email='stream@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+        session = self.client.session
+        session['user_id'] = self.user.id
+        session.save()
+        self.modelo = MagicMock()
+        self.modelo.generate_content.side_effect = lambda *a, **k: iter(
+            [MagicMock(text='Ahorra '), MagicMock(text='el **10%**'), MagicMock(text=' de tu sueldo.')]
+        )
+
+    def tearDown(self):
+        self.gemini.reiniciar()
+
+    def _eventos(self, response):
+        contenido = b''.join(response.streaming_content).decode('utf-8')
+        eventos = []
+        for bloque in contenido.strip().split('\n\n'):
+            nombre = 'message'
+            for linea in bloque.split('\n'):
+                if linea.startswith('event: '):
+                    nombre = linea[7:]
+                elif linea.startswith('data: '):
+                    eventos.append((nombre, json.loads(linea[6:])))
+        return eventos
+
+    def test_stream_envia_fragmentos_y_guarda_historial(self):
+        """Cada fragmento llega como evento y la respuesta completa queda en el historial"""
+        with self.settings(GEMINI_API_KEY='key'), patch('myapp.gemini._resolver', return_value=('m', self.modelo)):
+            response = self.client.post('/chatbot/stream/', {'mensaje': '¿Cuánto ahorro?'})
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            eventos = self._eventos(response)
+        textos = [datos['texto'] for nombre, datos in eventos if nombre == 'message']
+        self.assertEqual(textos, ['Ahorra ', 'el **10%**', ' de tu sueldo.'])
+        nombre, fin = eventos[-1]
+        self.assertEqual(nombre, 'fin')
+        self.assertEqual(fin['respuesta'], 'Ahorra el **10%** de tu sueldo.')
+        self.assertIn('<strong>10%</strong>', fin['html'])
+        self.assertTrue(self.modelo.generate_content.call_args.kwargs['stream'])
+        from .models import TurnoChat
+        self.assertEqual(
+            list(TurnoChat.objects.filter(user=self.user).values('pregunta', 'respuesta')),
+            [{'pregunta': '¿Cuánto ahorro?', 'respuesta': 'Ahorra el **10%** de tu sueldo.'}]
+        )
+
+    def test_prompt_incluye_el_mensaje_una_sola_vez(self):
+        """El historial previo va en el prompt y el mensaje nuevo no se duplica"""
+        session = self.client.session
+        session['chat_historial'] = [{'pregunta': 'Hola', 'respuesta': 'Hola, ¿en qué te ayudo?'}]
+        session.save()
+        with self.settings(GEMINI_API_KEY='key'), patch('myapp.gemini._resolver', return_value=('m', self.modelo)):
+            self._eventos(self.client.post('/chatbot/stream/', {'mensaje': 'Quiero ahorrar'}))
+        prompt = self.modelo.generate_content.call_args.args[0]
+        self.assertIn('Asistente: Hola, ¿en qué te ayudo?', prompt)
+        self.assertEqual(prompt.count('Quiero ahorrar'), 1)
+        # El historial que quedaba en la sesión pasó a la base
+        from .models import TurnoChat
+        self.assertEqual(TurnoChat.objects.filter(user=self.user).count(), 2)
+        self.assertNotIn('chat_historial', self.client.session)
+
+    def test_stream_sin_modelo(self):
+        """Sin API key se envía el aviso de no disponible y también se guarda"""
+        with self.settings(GEMINI_API_KEY=''):
+            eventos = self._eventos(self.client.post('/chatbot/stream/', {'mensaje': 'Hola'}))
+        self.assertIn('no está disponible', eventos[0][1]['texto'])
+        self.assertEqual(eventos[-1][0], 'fin')
+        from .models import TurnoChat
+        self.assertEqual(TurnoChat.objects.filter(user=self.user).count(), 1)
+
+    def test_stream_con_error_a_mitad(self):
+        """Si el stream se corta se conserva lo recibido"""
+        def cortado(*args, **kwargs):
+            yield MagicMock(text='Parcial')
+            raise RuntimeError('conexión cerrada')
+        self.modelo.generate_content.side_effect = cortado
+        with self.settings(GEMINI_API_KEY='key'), patch('myapp.gemini._resolver', return_value=('m', self.modelo)):
+            eventos = self._eventos(self.client.post('/chatbot/stream/', {'mensaje': 'Hola'}))
+        self.assertEqual(eventos[-1][1]['respuesta'], 'Parcial')
+
+    def test_stream_valida_metodo_y_mensaje(self):
+        """Solo acepta POST con un mensaje no vacío"""
+        self.assertEqual(self.client.get('/chatbot/stream/').status_code, 405)
+        self.assertEqual(self.client.post('/chatbot/stream/', {'mensaje': '  '}).status_code, 400)
+
+
+class ContextoChatTest(TestCase):
+    """Tests para el contexto acotado del chatbot"""
+
+    def _contexto(self, turnos=0, **session):
+        from .contexto_chat import ContextoChat
+        contexto = ContextoChat(dict(session))
+        for i in range(turnos):
+            contexto.agregar_turno(f'Pregunta {i}', f'Respuesta {i}. Detalle largo {i}.')
+        return contexto
+
+    def test_conversacion_corta_va_completa(self):
+        """Con pocos turnos todo va tal cual y sin resumen"""
+        contexto = self._contexto(turnos=2)
+        prompt = contexto.conversacion('Nueva')
+        self.assertIn('Usuario: Pregunta 0\nAsistente: Respuesta 0.', prompt)
+        self.assertNotIn('Resumen', prompt)
+        self.assertTrue(prompt.endswith('Usuario: Nueva\nAsistente:'))
+
+    def test_turnos_antiguos_se_pliegan_en_resumen(self):
+        """Solo los últimos N turnos van completos; los anteriores quedan en el resumen"""
+        with self.settings(CHAT_TURNOS_RECIENTES=3, CHAT_TURNOS_GUARDADOS=20):
+            contexto = self._contexto(turnos=5)
+            prompt = contexto.conversacion('Nueva')
+        self.assertIn('Resumen de la conversación anterior', prompt)
+        self.assertIn('- Usuario: Pregunta 0 -> Asistente: Respuesta 0.', prompt)
+        self.assertNotIn('Detalle largo 1', prompt)
+        self.assertIn('Asistente: Respuesta 4. Detalle largo 4.', prompt)
+        self.assertEqual(contexto.resumidos, 2)
+
+    def test_presupuesto_de_tokens(self):
+        """Los turnos recientes que no entran en el presupuesto se omiten, empezando por los más antiguos"""
+        from .contexto_chat import ContextoChat, estimar_tokens
+        contexto = ContextoChat({})
+        for i in range(3):
+            contexto.agregar_turno(f'Pregunta {i}', 'x' * 2000)
+        with self.settings(CHAT_PRESUPUESTO_TOKENS=1200):
+            prompt = contexto.conversacion('Nueva')
+        self.assertLessEqual(estimar_tokens(prompt), 1200)
+        self.assertIn('Pregunta 2', prompt)
+        self.assertNotIn('Pregunta 0', prompt)
+
+    def test_limites_de_la_sesion(self):
+        """La sesión guarda como máximo los turnos y caracteres configurados"""
+        session = {}
+        from .contexto_chat import ContextoChat
+        with self.settings(CHAT_TURNOS_RECIENTES=2, CHAT_TURNOS_GUARDADOS=4,
+                           CHAT_RESUMEN_MAX_TOKENS=60, CHAT_MAX_CARACTERES=50):
+            for i in range(30):
+                contexto = ContextoChat(session)
+                contexto.agregar_turno(f'Pregunta {i}', 'y' * 500)
+        self.assertEqual(len(session['chat_historial']), 4)
+        self.assertEqual(session['chat_historial'][-1]['pregunta'], 'Pregunta 29')
+        self.assertEqual(len(session['chat_historial'][-1]['respuesta']), 50)
+        self.assertEqual(session['chat_resumidos'], 2)
+        self.assertLessEqual(len(session['chat_resumen']), 60 * 4)
+        self.assertIn('Pregunta 27', session['chat_resumen'])
+
+    def test_chatbot_view_usa_el_contexto(self):
+        """El POST del chatbot guarda el turno con el contexto acotado"""
+        client = Client()
+        user = UserProfile.objects.create(
+            email='contexto@example.com', password=make_password('Testpass123!'),
+            first_name='Test', last_name='User'
+        )
+        session = client.session
+        session['user_id'] = user.id
+        session.save()
+        with self.settings(GEMINI_API_KEY='', CHAT_TURNOS_RECIENTES=1, CHAT_TURNOS_GUARDADOS=1):
+            client.post('/chatbot/', {'mensaje': 'Hola'})
+            client.post('/chatbot/', {'mensaje': 'Chau'})
+        from .models import EstadoChat, TurnoChat
+        self.assertEqual(list(TurnoChat.objects.filter(user=user).values_list('pregunta', flat=True)), ['Chau'])
+        self.assertIn('Usuario: Hola', EstadoChat.objects.get(user=user).resumen)
+
+
+class VerificadorLocalTest(TestCase):
+    """Tests para el verificador local de Completar Frases"""
+
+    def setUp(self):
+        from . import verificador
+        self.verificador = verificador
+
+    def _verificar(self, esperada, respuesta, **kwargs):
+        return self.verificador.verificar_local(esperada, respuesta, **kwargs)
+
+    def test_normalizacion(self):
+        """Tildes, mayúsculas, signos y artículo inicial no importan"""
+        self.assertEqual(self.verificador.normalizar('  La Inflación!! '), 'inflacion')
+        self.assertTrue(self._verificar('inflación', 'LA INFLACION')['es_correcta'])
+        self.assertTrue(self._verificar('el interés compuesto', 'interes compuesto')['es_correcta'])
+
+    def test_siglas_y_sinonimos(self):
+        """Siglas de la tabla o formadas por iniciales cuentan como correctas en ambos sentidos"""
+        self.assertTrue(self._verificar('SBS', 'Superintendencia de Banca y Seguros')['es_correcta'])
+        self.assertTrue(self._verificar('Superintendencia de Banca y Seguros', 'sbs')['es_correcta'])
+        self.assertTrue(self._verificar('TEA', 'tasa efectiva anual')['es_correcta'])
+        self.assertTrue(self._verificar('PBI', 'PIB')['es_correcta'])
+        self.assertTrue(self._verificar('Tasa de Rendimiento Efectivo Anual', 'TREA')['es_correcta'])
+
+    def test_errores_de_escritura(self):
+        """Un error de escritura en palabras largas se tolera; en siglas no"""
+        self.assertTrue(self._verificar('diversificación', 'diversifiacción')['es_correcta'])
+        self.assertTrue(self._verificar('presupuesto', 'presupeusto')['es_correcta'])
+        self.assertFalse(self._verificar('TEA', 'TEM')['es_correcta'])
+        self.assertEqual(self.verificador.damerau_levenshtein('ca', 'ac'), 1)
+        self.assertEqual(self.verificador.damerau_levenshtein('kitten', 'sitting'), 3)
+
+    def test_parciales_e_incorrectas(self):
+        """Respuestas contenidas o relacionadas son similares; otros conceptos conocidos son incorrectos"""
+        parcial = self._verificar('interés compuesto', 'interés')
+        self.assertFalse(parcial['es_correcta'])
+        self.assertTrue(parcial['es_similar'])
+        self.assertTrue(self._verificar('fondo de emergencia', 'ahorro')['es_similar'])
+        incorrecta = self._verificar('TEA', 'IGV')
+        self.assertFalse(incorrecta['es_correcta'] or incorrecta['es_similar'])
+        self.assertFalse(self._verificar('phishing', 'hipoteca', decidir=True)['es_similar'])
+
+    def test_casos_dudosos_se_escalan(self):
+        """Solo los casos dudosos devuelven None (o se deciden si se pide)"""
+        self.assertIsNone(self._verificar('presupuesto', 'presupuestación'))
+        decidido = self._verificar('presupuesto', 'presupuestación', decidir=True)
+        self.assertTrue(decidido['es_similar'])
+        # Sin parecido en la escritura puede ser una paráfrasis: también la decide la IA
+        self.assertIsNone(self._verificar('fondo de emergencia', 'dinero guardado para imprevistos'))
+        self.assertFalse(self._verificar('phishing', 'hipoteca', decidir=True)['es_correcta'])
+
+    @patch('myapp.gemini.generar_json')
+    def test_verificar_respuesta_ia_solo_consulta_casos_dudosos(self, mock_generar):
+        """verificar_respuesta_ia no llama a la IA cuando el verificador local decide"""
+        from .views import verificar_respuesta_ia
+        mock_generar.return_value = {'es_correcta': False, 'es_similar': True, 'explicacion': 'cerca'}
+        with self.settings(GEMINI_API_KEY='key'), patch('myapp.views.obtener_modelo_gemini', return_value=MagicMock()):
+            self.assertTrue(verificar_respuesta_ia('SBS', 'superintendencia de banca y seguros')['es_correcta'])
+            self.assertFalse(verificar_respuesta_ia('TEA', 'IGV')['es_correcta'])
+            mock_generar.assert_not_called()
+            self.assertEqual(verificar_respuesta_ia('presupuesto', 'presupuestación')['explicacion'], 'cerca')
+            mock_generar.assert_called_once()
+
+
+class CircuitoGeminiTest(TestCase):
+    """Tests para el circuit breaker y los tiempos límite de Gemini"""
+
+    def setUp(self):
+        from . import gemini
+        self.gemini = gemini
+        gemini.reiniciar()
+        self.modelo = MagicMock()
+        self.modelo.generate_content.return_value = MagicMock(text='ok')
+
+    def tearDown(self):
+        self.gemini.reiniciar()
+
+    def _fallar(self, veces):
+        self.modelo.generate_content.side_effect = TimeoutError('lento')
+        for _ in range(veces):
+            with self.assertRaises(TimeoutError):
+                self.gemini.generar_contenido('hola')
+
+    def test_llamadas_llevan_tiempo_limite_por_familia(self):
+        """Cada llamada pasa request_options con el timeout de su familia"""
+        with self.settings(GEMINI_API_KEY='key', GEMINI_TIEMPOS_LIMITE={'chatbot': 7}), \
+                patch('myapp.gemini._resolver', return_value=('m', self.modelo)):
+            self.gemini.generar_contenido('hola', familia='chatbot')
+            self.assertEqual(self.modelo.generate_content.call_args.kwargs['request_options'], {'timeout': 7})
+            self.gemini.generar_contenido('hola')
+            self.assertEqual(
+                self.modelo.generate_content.call_args.kwargs['request_options'],
+                {'timeout': self.gemini.TIEMPO_LIMITE_GENERICO}
+            )
+
+    def test_abre_tras_n_fallos_y_falla_rapido(self):
+        """Tras N fallos seguidos no se llama a la API"""
+        with self.settings(GEMINI_API_KEY='key', GEMINI_CIRCUITO_FALLOS=3), \
+                patch('myapp.gemini._resolver', return_value=('m', self.modelo)), \
+                patch('myapp.gemini.reportar_fallo'):
+            self._fallar(3)
+            self.assertEqual(self.gemini.estado_circuito(), 'abierto')
+            self.assertTrue(self.gemini.circuito_abierto())
+            with self.assertRaises(self.gemini.CircuitoAbierto):
+                self.gemini.generar_contenido('hola')
+        self.assertEqual(self.modelo.generate_content.call_count, 3)
+
+    def test_semiabierto_deja_una_prueba(self):
+        """Pasada la espera una llamada de prueba exitosa cierra el circuito"""
+        with self.settings(GEMINI_API_KEY='key', GEMINI_CIRCUITO_FALLOS=1, GEMINI_CIRCUITO_ESPERA=0), \
+                patch('myapp.gemini._resolver', return_value=('m', self.modelo)), \
+                patch('myapp.gemini.reportar_fallo'):
+            self._fallar(1)
+            self.assertEqual(self.gemini.estado_circuito(), 'abierto')
+            # La prueba falla: vuelve a abrirse
+            self._fallar(1)
+            self.assertEqual(self.gemini.estado_circuito(), 'abierto')
+            # La prueba sale bien: se cierra
+            self.modelo.generate_content.side_effect = None
+            self.assertEqual(self.gemini.generar_contenido('hola').text, 'ok')
+            self.assertEqual(self.gemini.estado_circuito(), 'cerrado')
+
+    def test_semiabierto_rechaza_llamadas_concurrentes(self):
+        """Mientras hay una prueba en curso las demás llamadas fallan rápido"""
+        with self.settings(GEMINI_CIRCUITO_FALLOS=1, GEMINI_CIRCUITO_ESPERA=0):
+            self.gemini._registrar_en_circuito(False)
+            self.gemini._permitir_llamada()
+            self.assertEqual(self.gemini.estado_circuito(), 'semiabierto')
+            with self.assertRaises(self.gemini.CircuitoAbierto):
+                self.gemini._permitir_llamada()
+
+    def test_vistas_usan_alternativas_locales_con_circuito_abierto(self):
+        """Con el circuito abierto no se llama a la IA: banco de frases y verificador local"""
+        from .models import FraseCompletar
+        from .views import obtener_modelo_gemini, verificar_respuesta_ia, generar_frase_completar_ia
+        FraseCompletar.objects.create(frase_completa='La SBS supervisa a los bancos', palabra_clave='SBS')
+        client = Client()
+        user = UserProfile.objects.create(
+            email='circuito@example.com', password=make_password('Testpass123!'),
+            first_name='Test', last_name='User'
+        )
+        session = client.session
+        session['user_id'] = user.id
+        session.save()
+        with self.settings(GEMINI_API_KEY='key', GEMINI_CIRCUITO_FALLOS=1, TAREAS_MODO='comando'), \
+                patch('myapp.gemini._resolver', return_value=('m', self.modelo)):
+            self.gemini._registrar_en_circuito(False)
+            self.assertIsNone(obtener_modelo_gemini())
+            self.assertIsNone(generar_frase_completar_ia())
+            self.assertTrue(verificar_respuesta_ia('presupuesto', 'presupuestación')['es_similar'])
+            response = client.get('/completar-frases/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('La ______________________ supervisa', response.context['frase_con_espacio'])
+        self.modelo.generate_content.assert_not_called()
+
+    def test_recomendaciones_no_resuelven_modelo_con_circuito_abierto(self):
+        """Con el circuito abierto las recomendaciones no esperan a sondear los modelos"""
+        from . import recomendaciones
+        with self.settings(GEMINI_API_KEY='key', GEMINI_CIRCUITO_FALLOS=1), \
+                patch('myapp.gemini._resolver', return_value=('m', self.modelo)) as mock_resolver, \
+                patch('myapp.recomendaciones.recomendaciones_locales', return_value=['local']):
+            self.gemini._registrar_en_circuito(False)
+            self.assertEqual(recomendaciones.generar_para_resumen({}), (['local'], 'local'))
+        mock_resolver.assert_not_called()
+
+    def test_resolucion_no_bloquea_el_circuito(self):
+        """Mientras se sondean los modelos, el circuito responde sin esperar y la resolución es única"""
+        import threading
+        import time
+        liberar = threading.Event()
+        empezo = threading.Event()
+        llamadas = []
+
+        def resolver_lento():
+            llamadas.append(1)
+            empezo.set()
+            liberar.wait(5)
+            return 'm', self.modelo
+
+        resultados = []
+        with self.settings(GEMINI_API_KEY='key'), patch('myapp.gemini._resolver', side_effect=resolver_lento):
+            hilos = [threading.Thread(target=lambda: resultados.append(self.gemini.obtener_modelo())) for _ in range(2)]
+            for hilo in hilos:
+                hilo.start()
+            self.assertTrue(empezo.wait(5))
+            inicio = time.monotonic()
+            self.assertFalse(self.gemini.circuito_abierto())
+            self.gemini._registrar_en_circuito(True)
+            self.assertLess(time.monotonic() - inicio, 1)
+            liberar.set()
+            for hilo in hilos:
+                hilo.join(5)
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(resultados, [self.modelo, self.modelo])
+
+
+class BancoFrasesTest(TestCase):
+    """Tests para servir Completar Frases desde el banco FraseCompletar"""
+
+    def setUp(self):
+        from . import banco_frases
+        from .models import FraseCompletar
+        self.banco = banco_frases
+        self.client = Client()
+        self.user = UserProfile.objects.create(
+            email='banco@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+        session = self.client.session
+        session['user_id'] = self.user.id
+        session.save()
+        self.faciles = [
+            FraseCompletar.objects.create(frase_completa=f'El ahorro número {i} es importante', palabra_clave='ahorro', nivel_dificultad=1)
+            for i in range(3)
+        ]
+        self.dificil = FraseCompletar.objects.create(
+            frase_completa='La TCEA incluye todos los costos del crédito', palabra_clave='TCEA', nivel_dificultad=3
+        )
+
+    def test_mascara_guardada_sin_importar_mayusculas(self):
+        """La frase con espacio se calcula al guardar aunque la palabra clave difiera en mayúsculas"""
+        from .models import FraseCompletar
+        frase = FraseCompletar.objects.create(frase_completa='La Inflación sube los precios', palabra_clave='inflación')
+        self.assertEqual(frase.frase_con_espacio, 'La ______________________ sube los precios')
+        self.assertEqual(frase.obtener_frase_con_espacio(), frase.frase_con_espacio)
+        self.assertEqual(self.banco.enmascarar('Sin la palabra', 'ahorro'), '')
+
+    def test_no_repite_hasta_terminar_el_banco(self):
+        """El cursor recorre todo el banco sin repetir y al dar la vuelta encola la reposición"""
+        from .models import TareaSegundoPlano, CursorFrasesCompletar
+        with self.settings(TAREAS_MODO='comando', POOL_OBJETIVOS={'frase': 0}):
+            vistas = [self.banco.siguiente_frase(self.user).id for _ in range(4)]
+            self.assertEqual(len(set(vistas)), 4)
+            self.assertFalse(TareaSegundoPlano.objects.filter(tipo='pool_frase').exists())
+            self.assertEqual(self.banco.siguiente_frase(self.user).id, vistas[0])
+        self.assertTrue(TareaSegundoPlano.objects.filter(tipo='pool_frase').exists())
+        self.assertEqual(CursorFrasesCompletar.objects.get(user=self.user, nivel=0).vueltas, 1)
+
+    def test_filtra_por_nivel(self):
+        """Con un nivel elegido solo se sirven frases de ese nivel"""
+        with self.settings(TAREAS_MODO='comando', POOL_OBJETIVOS={'frase': 0}):
+            self.assertEqual(self.banco.siguiente_frase(self.user, 3), self.dificil)
+            self.assertEqual(self.banco.siguiente_frase(self.user, 3), self.dificil)
+            self.assertEqual(self.banco.siguiente_frase(self.user, 1).nivel_dificultad, 1)
+
+    def test_frases_de_la_ia_se_agregan_sin_duplicar(self):
+        """La misma frase (ignorando mayúsculas, tildes y espacios) entra una sola vez al banco"""
+        from .models import FraseCompletar
+        frase, creada = self.banco.agregar_frase('La inflación reduce el poder adquisitivo', 'inflación')
+        _, repetida = self.banco.agregar_frase('la  INFLACION reduce el poder adquisitivo', 'Inflacion')
+        self.assertTrue(creada)
+        self.assertFalse(repetida)
+        self.assertEqual(frase.origen, 'ia')
+        self.assertTrue(frase.activa)
+        self.assertEqual(FraseCompletar.objects.filter(origen='ia').count(), 1)
+        # Si la palabra clave no aparece en la frase no se puede jugar
+        invalida, _ = self.banco.agregar_frase('Una frase cualquiera', 'ahorro')
+        self.assertFalse(invalida.activa)
+
+    @patch('myapp.views.generar_frase_completar_ia')
+    def test_vista_sirve_del_banco_sin_llamar_a_la_ia(self, mock_generar):
+        """La vista usa el banco con el nivel elegido y lo recuerda en la sesión"""
+        with self.settings(TAREAS_MODO='comando', POOL_OBJETIVOS={'frase': 0}):
+            response = self.client.get('/completar-frases/?nivel=3')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['frase_con_espacio'], self.dificil.frase_con_espacio)
+            self.assertEqual(self.client.session['palabra_clave_actual'], 'TCEA')
+            response = self.client.get('/completar-frases/')
+            self.assertEqual(response.context['nivel'], 3)
+        mock_generar.assert_not_called()
+
+    @patch('myapp.views.generar_frase_completar_ia')
+    def test_reposicion_con_el_nivel_del_usuario(self, mock_generar):
+        """Al dar la vuelta en un nivel, la reposición genera frases de ese nivel"""
+        from . import tareas
+        from .models import FraseCompletar, TareaSegundoPlano
+        mock_generar.return_value = {'frase_completa': 'El encaje bancario limita los préstamos', 'palabra_clave': 'encaje bancario'}
+        with self.settings(TAREAS_MODO='comando', POOL_OBJETIVOS={'frase': 0}, POOL_LOTE=1):
+            for _ in range(2):
+                self.banco.siguiente_frase(self.user, nivel=3)
+            self.assertEqual(TareaSegundoPlano.objects.get(tipo='pool_frase').datos, {'nivel': 3})
+            tareas.procesar_pendientes()
+        mock_generar.assert_called_with(nivel=3)
+        self.assertEqual(FraseCompletar.objects.get(palabra_clave='encaje bancario').nivel_dificultad, 3)
+
+    def test_populate_encuentra_frases_por_hash(self):
+        """El comando de población reconoce una frase que solo cambia en mayúsculas o espacios"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import FraseCompletar
+        FraseCompletar.objects.create(
+            frase_completa='la  TEA es la Tasa Efectiva Anual que incluye todos los costos y comisiones de un crédito.',
+            palabra_clave='tasa efectiva anual'
+        )
+        call_command('populate_frases_completar', stdout=StringIO())
+        self.assertEqual(FraseCompletar.objects.filter(frase_completa__icontains='Tasa Efectiva Anual que incluye').count(), 1)
+        call_command('populate_frases_completar', stdout=StringIO())
+
+    def test_migracion_borra_frases_repetidas_sin_hash(self):
+        """Las frases que la migración 0028 dejó sin hash por repetidas se borran y las demás reciben su hash"""
+        import importlib
+        from django.apps import apps
+        from .models import FraseCompletar
+        from .pool import hash_contenido
+        migracion = importlib.import_module('myapp.migrations.0033_deduplicar_frases')
+        # bulk_create no pasa por save(): quedan sin hash, como las dejaba la migración
+        FraseCompletar.objects.bulk_create([
+            FraseCompletar(frase_completa='EL ahorro número 0 es importante ', palabra_clave='Ahorro'),
+            FraseCompletar(frase_completa='El presupuesto ordena tus gastos', palabra_clave='presupuesto'),
+        ])
+        repetida = FraseCompletar.objects.get(frase_completa='EL ahorro número 0 es importante ')
+        sin_hash = FraseCompletar.objects.get(frase_completa='El presupuesto ordena tus gastos')
+
+        migracion.deduplicar_frases(apps, None)
+        self.assertFalse(FraseCompletar.objects.filter(id=repetida.id).exists())
+        sin_hash.refresh_from_db()
+        self.assertEqual(sin_hash.hash_contenido, hash_contenido(sin_hash.frase_completa, sin_hash.palabra_clave))
+        self.assertEqual(migracion._hash_contenido('Ahorro ', 'X'), hash_contenido('ahorro', 'x'))
+        sin_hash.save()
+
+
+
+class BackendsFalsosTest(TestCase):
+    """Tests para los backends falsos de Gemini y Twelve Data y el comando medir_latencias"""
+
+    def test_gemini_falso_responde_segun_el_prompt(self):
+        """El registro de Gemini resuelve el módulo falso y cada familia recibe su formato"""
+        from . import backends_falsos, gemini
+        from .views import generar_frase_completar_ia
+        with self.settings(GEMINI_API_KEY='clave-falsa', IA_CACHE_TTL={}), \
+                backends_falsos.gemini_falso() as genai:
+            frase = generar_frase_completar_ia()
+            self.assertIn(frase['palabra_clave'].lower(), frase['frase_completa'].lower())
+            fragmentos = list(gemini.generar_contenido_stream('Hola', familia='chatbot'))
+            self.assertGreater(len(fragmentos), 1)
+            self.assertEqual(''.join(fragmentos), backends_falsos.RESPUESTA_CHAT)
+            self.assertTrue(genai.modelos)
+        self.assertIsNone(gemini.nombre_modelo())
+
+    def test_gemini_falso_respeta_tiempo_limite_y_fallos(self):
+        """La latencia mayor al tiempo límite de la familia y los fallos inyectados llegan como errores"""
+        from . import backends_falsos, gemini
+        with self.settings(GEMINI_API_KEY='clave-falsa', GEMINI_TIEMPOS_LIMITE={'frase': 0.01}), \
+                backends_falsos.gemini_falso():
+            gemini.obtener_modelo()
+            gemini._estado['modelo'].config = backends_falsos.ConfigFalsa(latencia=0.05)
+            with self.assertRaises(TimeoutError):
+                gemini.generar_contenido('prompt', familia='frase')
+            gemini._estado['modelo'].config = backends_falsos.ConfigFalsa(tasa_fallo=1.0)
+            with self.assertRaises(backends_falsos.ErrorSimulado):
+                gemini.generar_contenido('prompt', familia='chatbot')
+
+    def test_servidor_twelve_data(self):
+        """El servidor falso responde /price y /quote para uno o varios símbolos y simula el límite de la API"""
+        import requests
+        from . import backends_falsos
+        with backends_falsos.ServidorTwelveData() as servidor:
+            precio = requests.get(f'{servidor.url}/price?symbol=AAPL&apikey=x').json()
+            self.assertAlmostEqual(float(precio['price']), backends_falsos.precio_base('AAPL'), delta=backends_falsos.precio_base('AAPL') * 0.011)
+            varios = requests.get(f'{servidor.url}/quote?symbol=AAPL,MSFT').json()
+            self.assertEqual(set(varios), {'AAPL', 'MSFT'})
+            self.assertEqual(varios['MSFT']['symbol'], 'MSFT')
+            servidor.config = backends_falsos.ConfigFalsa(tasa_fallo=1.0)
+            fallo = requests.get(f'{servidor.url}/price?symbol=AAPL')
+            self.assertEqual(fallo.status_code, 429)
+            self.assertEqual(fallo.json()['status'], 'error')
+
+            user = UserProfile.objects.create(
+                email='falsos@example.com', password=make_password('Testpass123!'),
+                first_name='Test', last_name='User'
+            )
+            servidor.config = backends_falsos.ConfigFalsa()
+            inversion = Investment.objects.create(user=user, company='Apple', symbol='AAPL', shares=1, price_at_purchase=10)
+            with self.settings(TWELVE_DATA_URL=servidor.url):
+                self.assertIsNotNone(inversion.get_current_price())
+
+    def test_comando_medir_latencias(self):
+        """El comando recorre los flujos y reporta percentiles sin dejar datos"""
+        from io import StringIO
+        from django.core.management import call_command
+        salida = StringIO()
+        usuarios = UserProfile.objects.count()
+        call_command(
+            'medir_latencias', '--iteraciones', '2', '--latencia-ia', '0', '--latencia-precios', '0',
+            '--flujos', 'frases,inversiones', '--json', stdout=salida
+        )
+        resultado = json.loads(salida.getvalue())
+        self.assertEqual(resultado['vistas']['GET completar_frases']['n'], 2)
+        self.assertEqual(resultado['vistas']['POST investments']['errores'], 0)
+        self.assertIn('p99', resultado['vistas']['GET investments'])
+        self.assertGreater(resultado['llamadas_precios'], 0)
+        self.assertEqual(UserProfile.objects.count(), usuarios)
+
+
+class MetricasExternasTest(TestCase):
+    """Tests para las métricas de llamadas a Gemini y Twelve Data"""
+
+    def setUp(self):
+        from . import gemini, metricas, precios
+        self.gemini = gemini
+        self.metricas = metricas
+        gemini.reiniciar()
+        metricas.reiniciar()
+        precios.reiniciar()
+        self.client = Client()
+        self.user = UserProfile.objects.create(
+            email='metricas@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+        session = self.client.session
+        session['user_id'] = self.user.id
+        session.save()
+
+    def tearDown(self):
+        self.gemini.reiniciar()
+
+    def test_registra_llamadas_errores_y_tokens_de_gemini(self):
+        """Cada llamada a Gemini suma latencia, tokens y errores por modelo y familia"""
+        modelo = MagicMock()
+        modelo.generate_content.return_value = MagicMock(text='{"ok": true}')
+        with self.settings(GEMINI_API_KEY='key', GEMINI_CIRCUITO_FALLOS=10), \
+                patch('myapp.gemini._resolver', return_value=('gemini-test', modelo)):
+            self.gemini.generar_contenido('x' * 40, familia='frase')
+            modelo.generate_content.side_effect = TimeoutError('lento')
+            with self.assertRaises(TimeoutError):
+                self.gemini.generar_contenido('prompt', familia='frase')
+
+        fila = self.metricas.resumen('operacion')[0]
+        self.assertEqual(fila['clave'], 'gemini gemini-test:frase')
+        self.assertEqual(fila['llamadas'], 2)
+        self.assertEqual(fila['errores'], {'TimeoutError': 1})
+        # La llamada fallida no tiene respuesta de la que contar tokens
+        self.assertEqual(fila['tokens_entrada'], 10)
+        self.assertEqual(sum(fila['histograma'].values()), 2)
+
+    @patch('requests.Session.get')
+    def test_twelve_data_y_atribucion_por_vista(self, mock_get):
+        """Las consultas de precios se atribuyen a la vista que las hizo y se cuentan los errores de la API"""
+        mock_get.return_value = MagicMock(status_code=200, json=lambda: {'code': 429, 'status': 'error'})
+        Investment.objects.create(user=self.user, company='Apple', symbol='AAPL', shares=1, price_at_purchase=10)
+        with self.settings(TWELVE_API_KEY='key'):
+            self.client.get(reverse('investments'))
+
+        por_vista = {fila['clave']: fila for fila in self.metricas.resumen('vista')}
+        self.assertIn('investments', por_vista)
+        self.assertGreater(por_vista['investments']['llamadas'], 0)
+        por_operacion = {fila['clave']: fila for fila in self.metricas.resumen('operacion')}
+        self.assertEqual(por_operacion['twelvedata /price']['errores'], {'API 429': por_operacion['twelvedata /price']['llamadas']})
+
+    def test_percentil_del_histograma(self):
+        """El percentil es el límite del bucket donde cae; en el último bucket se usa el máximo"""
+        histograma = [0] * (len(self.metricas.BUCKETS_MS) + 1)
+        histograma[0], histograma[-1] = 90, 10
+        self.assertEqual(self.metricas.percentil_histograma(histograma, 50), self.metricas.BUCKETS_MS[0])
+        self.assertEqual(self.metricas.percentil_histograma(histograma, 99, 45000), 45000)
+        self.assertIsNone(self.metricas.percentil_histograma([0, 0], 50))
+
+    def test_endpoint_solo_para_administradores(self):
+        """El endpoint JSON responde 403 a usuarios comunes y las métricas a administradores"""
+        from django.contrib.auth.models import User
+        self.metricas.registrar('twelvedata', '/price', 120, vista='investments')
+        response = self.client.get(reverse('admin_metricas'))
+        self.assertEqual(response.status_code, 403)
+
+        User.objects.create_user(username='admin', email='metricas@example.com', password='x', is_staff=True)
+        response = self.client.get(reverse('admin_metricas'))
+        self.assertEqual(response.status_code, 200)
+        datos = response.json()
+        self.assertEqual(datos['por_operacion'][0]['clave'], 'twelvedata /price')
+        self.assertEqual(datos['por_vista'][0]['clave'], 'investments')
+
+    def test_comando_lee_lo_guardado(self):
+        """El comando muestra lo guardado en la base y --reiniciar lo borra"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import MetricaLlamadaExterna
+        self.metricas.registrar('gemini', 'm:chatbot', 300, error='TimeoutError', vista='chatbot')
+        self.metricas.guardar()
+        self.assertEqual(MetricaLlamadaExterna.objects.count(), 1)
+
+        salida = StringIO()
+        call_command('metricas_externas', '--por', 'vista', stdout=salida)
+        self.assertIn('chatbot', salida.getvalue())
+        self.assertIn('TimeoutError: 1', salida.getvalue())
+        call_command('metricas_externas', '--reiniciar', stdout=StringIO())
+        self.assertFalse(MetricaLlamadaExterna.objects.exists())
+
+
+class GenerarRecomendacionesTest(TestCase):
+    """Tests para el pipeline por lotes de recomendaciones personalizadas"""
+
+    def setUp(self):
+        from . import recomendaciones
+        self.recomendaciones = recomendaciones
+        self.usuarios = [
+            UserProfile.objects.create(
+                email=f'rec{i}@example.com', password=make_password('Testpass123!'),
+                first_name=f'Usuario{i}', last_name='Test', monthly_limit=100
+            )
+            for i in range(3)
+        ]
+
+    def _gasto(self, user, monto, categoria='Comida'):
+        return Expense.objects.create(user=user, amount=monto, category=categoria, store_name='Tienda')
+
+    def test_selecciona_solo_usuarios_con_cambios(self):
+        """Solo entran usuarios con gastos o evaluaciones posteriores a su última recomendación"""
+        from .models import PersonalizedRecommendation
+        con_cambios, al_dia, sin_datos = self.usuarios
+        self._gasto(al_dia, 10)
+        PersonalizedRecommendation.objects.create(user=al_dia, tipo_recomendacion='reto', contenido='x', razon='y')
+        PersonalizedRecommendation.objects.create(user=con_cambios, tipo_recomendacion='reto', contenido='x', razon='y')
+        self._gasto(con_cambios, 10)
+
+        seleccionados = set(self.recomendaciones.usuarios_con_cambios().values_list('id', flat=True))
+        self.assertEqual(seleccionados, {con_cambios.id})
+        self.assertEqual(self.recomendaciones.usuarios_con_cambios(forzar=True).count(), 3)
+
+    def test_resumenes_en_consultas_agregadas(self):
+        """Los resúmenes de todo el lote se arman con un número fijo de consultas"""
+        from .models import FinancialCompetencyAssessment
+        for user in self.usuarios:
+            self._gasto(user, 60)
+            self._gasto(user, 50, 'Ropa')
+        FinancialCompetencyAssessment.objects.create(user=self.usuarios[0], conocimiento_ahorro=20, nivel_competencia='bajo')
+        with self.assertNumQueries(4):
+            resumenes = self.recomendaciones.construir_resumenes(UserProfile.objects.all())
+        resumen = resumenes[self.usuarios[0].id]
+        self.assertEqual(resumen['gastos'], {'Comida': 60, 'Ropa': 50})
+        self.assertEqual(resumen['total_gastos'], 110)
+        self.assertEqual(resumen['evaluacion']['conocimiento_ahorro'], 20)
+        self.assertIsNone(resumenes[self.usuarios[1].id]['evaluacion'])
+        # Reglas locales: alerta por superar el límite y reto sobre la mayor categoría
+        tipos = [r['tipo_recomendacion'] for r in self.recomendaciones.recomendaciones_locales(resumen)]
+        self.assertIn('alerta', tipos)
+        self.assertIn('reto', tipos)
+
+    @patch('myapp.gemini.generar_json')
+    @patch('myapp.gemini.obtener_modelo', return_value=MagicMock())
+    def test_pipeline_genera_en_paralelo_y_guarda_en_lote(self, mock_modelo, mock_json):
+        """El generador se llama una vez por usuario con cambios y los resultados se guardan; la segunda corrida no hace nada"""
+        from .models import PersonalizedRecommendation
+        mock_json.return_value = {'recomendaciones': [
+            {'tipo_recomendacion': 'reto', 'contenido': 'Ahorra S/. 50', 'razon': 'Gastas mucho en comida'},
+            {'tipo_recomendacion': 'desconocido', 'contenido': 'Se descarta', 'razon': ''},
+        ]}
+        for user in self.usuarios[:2]:
+            self._gasto(user, 30)
+
+        reporte = self.recomendaciones.ejecutar(hilos=2, por_segundo=0)
+        self.assertEqual(reporte['usuarios'], 2)
+        self.assertEqual(reporte['por_ia'], 2)
+        self.assertEqual(mock_json.call_count, 2)
+        self.assertEqual(PersonalizedRecommendation.objects.count(), 2)
+
+        self.assertEqual(self.recomendaciones.ejecutar(por_segundo=0)['usuarios'], 0)
+        self.assertEqual(mock_json.call_count, 2)
+
+    def test_sin_ia_usa_reglas_locales(self):
+        """Sin modelo de IA disponible se guardan las recomendaciones por reglas"""
+        from .models import PersonalizedRecommendation
+        self._gasto(self.usuarios[0], 500)
+        with self.settings(GEMINI_API_KEY=''):
+            reporte = self.recomendaciones.ejecutar(por_segundo=0)
+        self.assertEqual(reporte['por_reglas'], 1)
+        self.assertTrue(PersonalizedRecommendation.objects.filter(user=self.usuarios[0], tipo_recomendacion='alerta').exists())
+
+    def test_comando_dry_run_no_escribe(self):
+        """--dry-run informa cuántos usuarios se procesarían y los tiempos sin crear recomendaciones"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import PersonalizedRecommendation
+        self._gasto(self.usuarios[0], 30)
+        salida = StringIO()
+        with patch('myapp.recomendaciones.generar_para_resumen') as mock_generar:
+            call_command('generar_recomendaciones', '--dry-run', stdout=salida)
+        mock_generar.assert_not_called()
+        self.assertIn('Usuarios con cambios: 1', salida.getvalue())
+        self.assertIn('seleccion_y_resumenes', salida.getvalue())
+        self.assertFalse(PersonalizedRecommendation.objects.exists())
+
+
+class PreciosCacheTest(TestCase):
+    """Tests para la caché compartida de precios de Twelve Data"""
+
+    def setUp(self):
+        from . import precios
+        self.precios = precios
+        precios.reiniciar()
+        self.client = Client()
+        self.user = UserProfile.objects.create(
+            email='precios@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+        for symbol, company in [('AAPL', 'Apple Inc.'), ('MSFT', 'Microsoft')]:
+            Investment.objects.create(user=self.user, company=company, symbol=symbol, shares=2, price_at_purchase=100)
+        session = self.client.session
+        session['user_id'] = self.user.id
+        session.save()
+
+    def _respuesta(self, precio):
+        return MagicMock(status_code=200, json=lambda: {'price': precio})
+
+    @patch('requests.Session.get')
+    def test_una_sola_consulta_agrupada_para_la_tabla(self, mock_get):
+        """La tabla de inversiones pide todos sus símbolos en una llamada y la repite solo al vencer la caché"""
+        mock_get.return_value = MagicMock(status_code=200, json=lambda: {
+            'AAPL': {'price': '120.00'},
+            'MSFT': {'price': '130.00'},
+        })
+        response = self.client.get(reverse('investments'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(mock_get.call_args.kwargs['params']['symbol'], 'AAPL,MSFT')
+        self.assertIn('timeout', mock_get.call_args.kwargs)
+        self.assertContains(response, '240.0')  # valor actual de AAPL: 2 acciones x 120
+        self.assertEqual(response.context['portafolio']['valor_actual'], 500.0)
+        self.assertEqual(response.context['portafolio']['ganancia'], 100.0)
+        self.client.get(reverse('investments'))
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('requests.Session.get')
+    def test_cache_compartida_entre_procesos_por_la_base(self, mock_get):
+        """Sin la memoria del proceso se usa el precio guardado en CotizacionCache mientras no venza"""
+        from .models import CotizacionCache
+        mock_get.return_value = self._respuesta('120.00')
+        self.assertEqual(self.precios.obtener_precio('aapl'), 120.0)
+        self.assertTrue(CotizacionCache.objects.filter(simbolo='AAPL', precio=120.0).exists())
+
+        self.precios.reiniciar()
+        self.assertEqual(self.precios.obtener_precio('AAPL'), 120.0)
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('requests.Session.get')
+    def test_precio_vencido_se_vuelve_a_consultar(self, mock_get):
+        """Con el TTL vencido se consulta de nuevo; si la API falla se usa el último precio conocido"""
+        mock_get.return_value = self._respuesta('120.00')
+        # Sin reintentos del cliente HTTP para contar una llamada por consulta
+        with self.settings(PRECIOS_TTL=0, HTTP_REINTENTOS=0):
+            self.assertEqual(self.precios.obtener_precio('AAPL'), 120.0)
+            mock_get.return_value = self._respuesta('130.00')
+            self.assertEqual(self.precios.obtener_precio('AAPL'), 130.0)
+            mock_get.return_value = MagicMock(status_code=429, json=lambda: {'code': 429, 'status': 'error'})
+            self.assertEqual(self.precios.obtener_precio('AAPL'), 130.0)
+            # Sin precio conocido no hay a qué volver
+            self.assertIsNone(self.precios.obtener_precio('INVALID'))
+        self.assertEqual(mock_get.call_count, 4)
+
+    @patch('requests.Session.get')
+    def test_compra_reutiliza_el_precio_en_cache(self, mock_get):
+        """Registrar una inversión usa el mismo precio que se muestra en la tabla"""
+        mock_get.return_value = self._respuesta('120.00')
+        with self.settings(TWELVE_API_KEY='key'):
+            self.client.post(reverse('investments'), {'company': 'AAPL', 'shares': 1})
+
+        self.assertEqual(mock_get.call_count, 2)  # AAPL al comprar y MSFT en la tabla
+        self.assertTrue(Investment.objects.filter(user=self.user, symbol='AAPL', shares=1, price_at_purchase=120.0).exists())
+
+    @patch('requests.Session.get')
+    def test_lotes_y_simbolos_sin_precio(self, mock_get):
+        """Muchos símbolos se piden en lotes; los que la API no devuelve quedan sin precio"""
+        simbolos = [f'S{i}' for i in range(self.precios.SIMBOLOS_POR_LLAMADA + 5)]
+
+        def responder(url, params=None, **kwargs):
+            pedidos = params['symbol'].split(',')
+            return MagicMock(status_code=200, json=lambda: {
+                s: {'price': '10'} if s != 'S3' else {'code': 400, 'status': 'error'} for s in pedidos
+            })
+        mock_get.side_effect = responder
+
+        cotizaciones = self.precios.obtener_precios(simbolos)
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertIsNone(cotizaciones['S3'])
+        self.assertEqual(cotizaciones['S0'], 10.0)
+        self.assertEqual(len(cotizaciones), len(simbolos))
+
+    @patch('requests.Session.get')
+    def test_comando_refrescar_precios(self, mock_get):
+        """El comando actualiza en una llamada los símbolos de todos los usuarios aunque la caché esté vigente"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import CotizacionCache
+        otro = UserProfile.objects.create(email='otro-precios@example.com', password=make_password('x'))
+        Investment.objects.create(user=otro, company='Tesla', symbol='TSLA', shares=1, price_at_purchase=100)
+        self.precios.guardar({'AAPL': 1.0})
+        mock_get.return_value = MagicMock(status_code=200, json=lambda: {
+            'AAPL': {'price': '120.00'}, 'MSFT': {'price': '130.00'}, 'TSLA': {'code': 400, 'status': 'error'},
+        })
+
+        salida = StringIO()
+        with self.settings(TWELVE_API_KEY='key'):
+            call_command('refrescar_precios', stdout=salida)
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertIn('2 de 3', salida.getvalue())
+        self.assertIn('TSLA', salida.getvalue())
+        self.assertEqual(CotizacionCache.objects.get(simbolo='AAPL').precio, 120.0)
+        self.assertEqual(self.precios.obtener_precio('MSFT'), 130.0)
+
+    def test_historial_sin_puntos_repetidos(self):
+        """Cada precio nuevo agrega un punto a la serie, pero un precio sin cambios no"""
+        from .models import PriceSnapshot
+        inicio = timezone.now()
+        with patch('myapp.precios.timezone.now', return_value=inicio):
+            self.precios.guardar({'AAPL': 120.0})
+        with patch('myapp.precios.timezone.now', return_value=inicio + timedelta(minutes=5)):
+            self.precios.guardar({'AAPL': 120.0})
+        with patch('myapp.precios.timezone.now', return_value=inicio + timedelta(minutes=10)):
+            self.precios.guardar({'AAPL': 125.0})
+
+        self.assertEqual(list(PriceSnapshot.objects.values_list('price', flat=True)), [120.0, 125.0])
+        serie = self.precios.historial(['aapl'])['AAPL']
+        self.assertEqual([precio for _, precio in serie], [120.0, 125.0])
+
+    def test_compactar_historial_viejo(self):
+        """Los puntos viejos quedan en uno por hora y los muy viejos en uno por día"""
+        from .models import PriceSnapshot
+        ahora = timezone.now().replace(minute=0, second=0, microsecond=0)
+
+        def puntos(base, minutos):
+            PriceSnapshot.objects.bulk_create([
+                PriceSnapshot(symbol='AAPL', price=100 + m, captured_at=base + timedelta(minutes=m))
+                for m in minutos
+            ])
+        puntos(ahora - timedelta(days=1), [0, 10, 20])  # reciente: todo el detalle
+        puntos(ahora - timedelta(days=10), [0, 10, 20, 70])  # dos horas distintas
+        puntos((ahora - timedelta(days=200)).replace(hour=0), [0, 300, 600])  # mismo día
+
+        with self.settings(PRECIOS_DETALLE_DIAS=7, PRECIOS_POR_HORA_DIAS=90):
+            self.assertEqual(self.precios.compactar(), 4)
+
+        self.assertEqual(PriceSnapshot.objects.count(), 6)
+        # Se conserva el último punto de cada periodo
+        self.assertEqual(
+            list(PriceSnapshot.objects.filter(captured_at__lt=ahora - timedelta(days=7)).values_list('price', flat=True)),
+            [700.0, 120.0, 170.0]
+        )
+
+    @patch('requests.Session.get')
+    def test_pagina_muestra_historial_sin_llamar_a_la_api(self, mock_get):
+        """Con precios vigentes la página lee la caché y el historial sin consultar a Twelve Data"""
+        from .models import PriceSnapshot
+        self.precios.guardar({'AAPL': 120.0, 'MSFT': 130.0})
+        PriceSnapshot.objects.create(symbol='AAPL', price=110.0, captured_at=timezone.now() - timedelta(days=3))
+        self.precios.reiniciar()
+
+        response = self.client.get(reverse('investments'))
+
+        mock_get.assert_not_called()
+        self.assertContains(response, 'historial-precios')
+        self.assertEqual(len(response.context['historial']['AAPL']), 2)
+        self.assertEqual(response.context['historial']['AAPL'][0]['y'], 110.0)
+
+
+class AnaliticaPortafolioTest(TestCase):
+    """Tests para la analítica de portafolios sobre el historial de precios"""
+
+    def setUp(self):
+        from . import analitica, precios
+        self.analitica = analitica
+        analitica.reiniciar()
+        precios.reiniciar()
+        self.user = UserProfile.objects.create(
+            email='analitica@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+        self.hoy = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def _serie(self, symbol, precios_por_dia):
+        from .models import PriceSnapshot
+        inicio = self.hoy - timedelta(days=len(precios_por_dia) - 1)
+        PriceSnapshot.objects.bulk_create([
+            PriceSnapshot(symbol=symbol, price=precio, captured_at=inicio + timedelta(days=i))
+            for i, precio in enumerate(precios_por_dia)
+        ])
+
+    def _inversion(self, symbol, shares, precio, dias_atras):
+        inv = Investment.objects.create(
+            user=self.user, company=symbol, symbol=symbol, shares=shares, price_at_purchase=precio
+        )
+        Investment.objects.filter(id=inv.id).update(date=(self.hoy - timedelta(days=dias_atras)).date())
+        inv.refresh_from_db()
+        return inv
+
+    def test_rentabilidad_caida_y_pesos(self):
+        """Calcula rentabilidad ponderada en el tiempo, máxima caída, volatilidad y pesos"""
+        self._serie('AAPL', [100, 110, 99])
+        self._serie('MSFT', [50, 50, 50])
+        aapl = self._inversion('AAPL', 1, 100, 5)
+        msft = self._inversion('MSFT', 2, 50, 5)
+        aapl._precio_actual, msft._precio_actual = 99.0, 50.0
+
+        resultado = self.analitica.calcular([aapl, msft])
+
+        self.assertEqual(resultado['dias'], 3)
+        # Portafolio: 200 -> 210 -> 199
+        self.assertEqual(resultado['rentabilidad'], -0.5)
+        self.assertEqual(resultado['max_caida'], 5.24)
+        pesos = {p['symbol']: p['peso'] for p in resultado['posiciones']}
+        self.assertEqual(pesos, {'AAPL': 49.75, 'MSFT': 50.25})
+        volatilidades = {p['symbol']: p['volatilidad'] for p in resultado['posiciones']}
+        self.assertEqual(volatilidades['MSFT'], 0.0)
+        self.assertGreater(volatilidades['AAPL'], 0)
+        self.assertGreater(resultado['volatilidad'], 0)
+
+    def test_compras_nuevas_no_cuentan_como_ganancia(self):
+        """Una posición comprada a mitad del periodo no infla la rentabilidad del día de la compra"""
+        self._serie('AAPL', [100, 100, 100])
+        self._serie('MSFT', [50, 50, 50])
+        aapl = self._inversion('AAPL', 1, 100, 5)
+        msft = self._inversion('MSFT', 10, 50, 1)
+        aapl._precio_actual, msft._precio_actual = 100.0, 50.0
+
+        resultado = self.analitica.calcular([aapl, msft])
+        self.assertEqual(resultado['rentabilidad'], 0.0)
+        self.assertEqual(resultado['max_caida'], 0.0)
+
+    def test_cache_hasta_el_proximo_precio(self):
+        """El resultado se reutiliza hasta que se guarda un precio nuevo de sus símbolos"""
+        from .models import PriceSnapshot
+        self._serie('AAPL', [100, 110])
+        inversiones = [self._inversion('AAPL', 1, 100, 5)]
+        inversiones[0]._precio_actual = 110.0
+
+        with patch.object(self.analitica, 'calcular', wraps=self.analitica.calcular) as mock_calcular:
+            self.analitica.analizar_usuario(self.user, inversiones)
+            self.analitica.analizar_usuario(self.user, inversiones)
+            self.assertEqual(mock_calcular.call_count, 1)
+
+            PriceSnapshot.objects.create(symbol='AAPL', price=120, captured_at=self.hoy + timedelta(hours=1))
+            resultado = self.analitica.analizar_usuario(self.user, inversiones)
+            self.assertEqual(mock_calcular.call_count, 2)
+        self.assertEqual(resultado['rentabilidad'], 20.0)
+
+    @patch('requests.Session.get')
+    def test_vista_muestra_analitica(self, mock_get):
+        """La página de inversiones muestra la analítica calculada con los precios guardados"""
+        from . import precios
+        self._serie('AAPL', [100, 110])
+        self._inversion('AAPL', 1, 100, 5)
+        precios.guardar({'AAPL': 110.0})
+        client = Client()
+        session = client.session
+        session['user_id'] = self.user.id
+        session.save()
+
+        response = client.get(reverse('investments'))
+
+        mock_get.assert_not_called()
+        self.assertContains(response, 'Análisis del portafolio')
+        self.assertEqual(response.context['analitica']['rentabilidad'], 10.0)
+
+
+class HttpClienteTest(TestCase):
+    """Tests para el cliente HTTP compartido"""
+
+    def setUp(self):
+        from . import http_cliente
+        self.http = http_cliente
+        http_cliente.reiniciar()
+
+    def test_una_sesion_por_host(self):
+        """Las URLs del mismo host comparten sesión (y conexiones); otro host tiene la suya"""
+        sesion_a, _ = self.http.sesion('https://api.ejemplo.com/price?symbol=AAPL')
+        sesion_b, _ = self.http.sesion('https://api.ejemplo.com/quote')
+        sesion_c, _ = self.http.sesion('https://otro.ejemplo.com/v1/')
+        self.assertIs(sesion_a, sesion_b)
+        self.assertIsNot(sesion_a, sesion_c)
+
+    @patch('myapp.http_cliente.time.sleep')
+    @patch('requests.Session.get')
+    def test_reintenta_429_y_5xx_con_timeout_por_defecto(self, mock_get, mock_sleep):
+        """Una respuesta 503 se reintenta tras una espera; siempre se envía un timeout"""
+        mock_get.side_effect = [MagicMock(status_code=503), MagicMock(status_code=200)]
+        with self.settings(HTTP_TIMEOUT_CONEXION=2, HTTP_TIMEOUT_LECTURA=7):
+            response = self.http.get('https://api.ejemplo.com/price')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args.kwargs['timeout'], (2, 7))
+        mock_sleep.assert_called_once()
+
+    @patch('myapp.http_cliente.time.sleep')
+    @patch('requests.Session.get')
+    def test_reintentos_acotados(self, mock_get, mock_sleep):
+        """Después de HTTP_REINTENTOS reintentos se lanza el último error; los 4xx no se reintentan"""
+        import requests
+        mock_get.side_effect = requests.exceptions.ConnectionError('sin red')
+        with self.settings(HTTP_REINTENTOS=2):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.http.get('https://api.ejemplo.com/price')
+        self.assertEqual(mock_get.call_count, 3)
+
+        mock_get.reset_mock(side_effect=True)
+        mock_get.return_value = MagicMock(status_code=404)
+        self.assertEqual(self.http.get('https://api.ejemplo.com/price').status_code, 404)
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('myapp.http_cliente.time.sleep')
+    @patch('requests.Session.get')
+    def test_validacion_de_email_sin_reintentos(self, mock_get, mock_sleep):
+        """La validación del correo al registrarse usa un timeout corto y no reintenta"""
+        import requests
+        from .forms import RegisterForm
+        mock_get.side_effect = requests.exceptions.Timeout('lento')
+        form = RegisterForm(data={'email': 'nuevo@example.com'})
+        form.cleaned_data = {'email': 'nuevo@example.com'}
+        with self.settings(VALIDACION_EMAIL_TIMEOUT=2):
+            self.assertEqual(form.clean_email(), 'nuevo@example.com')
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(mock_get.call_args.kwargs['timeout'], 2)
+        mock_sleep.assert_not_called()
+
+    def test_espera_exponencial_con_jitter(self):
+        """La espera crece al doble en cada reintento más un jitter de hasta la espera base"""
+        with self.settings(HTTP_ESPERA_BASE=0.2):
+            for _ in range(20):
+                self.assertTrue(0.2 <= self.http.espera_reintento(1) <= 0.4)
+                self.assertTrue(0.8 <= self.http.espera_reintento(3) <= 1.0)
+
+    @patch('requests.Session.get')
+    def test_limite_de_requests_por_host(self, mock_get):
+        """Con el host lleno se lanza HostSaturado (un ConnectionError) en vez de esperar sin límite"""
+        import requests
+        with self.settings(HTTP_MAX_POR_HOST=1, HTTP_ESPERA_LUGAR=0.05):
+            _, lugares = self.http.sesion('https://api.ejemplo.com/')
+            lugares.acquire()
+            try:
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    self.http.get('https://api.ejemplo.com/price')
+            finally:
+                lugares.release()
+            mock_get.return_value = MagicMock(status_code=200)
+            self.assertEqual(self.http.get('https://api.ejemplo.com/price').status_code, 200)
+        mock_get.assert_called_once()
+
+
+class ActividadUsuariosTest(TestCase):
+    """Tests para el registro en lote de sesiones y días activos"""
+
+    def setUp(self):
+        from . import actividad
+        self.actividad = actividad
+        actividad.reiniciar()
+        self.user = UserProfile.objects.create(
+            email='actividad@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+
+    def tearDown(self):
+        self.actividad.reiniciar()
+
+    def test_accesos_repetidos_no_escriben(self):
+        """Los accesos seguidos se juntan en memoria y se guardan como una sesión y un día"""
+        from .models import UserMetrics
+        ahora = timezone.now()
+        self.actividad.registrar(self.user.id, ahora)
+        with self.assertNumQueries(0):
+            for minutos in range(1, 5):
+                self.actividad.registrar(self.user.id, ahora + timedelta(minutes=minutos))
+        self.assertFalse(UserMetrics.objects.filter(user=self.user).exists())
+
+        self.assertEqual(self.actividad.guardar(), 1)
+        metrics = UserMetrics.objects.get(user=self.user)
+        self.assertEqual((metrics.sesiones_totales, metrics.dias_activos), (1, 1))
+        self.assertEqual(metrics.fecha_ultima_actividad, ahora + timedelta(minutes=4))
+
+    def test_sesion_nueva_y_dia_nuevo_sobre_metricas_existentes(self):
+        """Se suma a lo guardado: sesión nueva tras 30 minutos de inactividad y un día por día nuevo"""
+        from .models import UserMetrics
+        ayer = timezone.now() - timedelta(days=1)
+        UserMetrics.objects.create(user=self.user, sesiones_totales=5, dias_activos=3)
+        UserMetrics.objects.filter(user=self.user).update(fecha_ultima_actividad=ayer)
+
+        ahora = timezone.now()
+        self.actividad.registrar(self.user.id, ahora)
+        self.actividad.registrar(self.user.id, ahora + timedelta(minutes=10))
+        self.actividad.registrar(self.user.id, ahora + timedelta(minutes=45))
+        self.actividad.guardar()
+
+        metrics = UserMetrics.objects.get(user=self.user)
+        self.assertEqual(metrics.sesiones_totales, 7)
+        self.assertEqual(metrics.dias_activos, 4)
+
+    def test_decorador_guarda_en_lote(self):
+        """Las vistas protegidas solo cuentan en memoria hasta llegar al umbral o al intervalo"""
+        from .models import UserMetrics
+        client = Client()
+        session = client.session
+        session['user_id'] = self.user.id
+        session.save()
+
+        with self.settings(ACTIVIDAD_INTERVALO=3600, ACTIVIDAD_UMBRAL=2):
+            self.actividad.guardar()  # reinicia el intervalo
+            client.get(reverse('investments'))
+            client.get(reverse('investments'))
+            self.assertFalse(UserMetrics.objects.filter(user=self.user).exists())
+
+            otro = UserProfile.objects.create(email='otro-actividad@example.com', password=make_password('x'))
+            self.actividad.registrar(otro.id)
+            client.get(reverse('investments'))
+
+        self.assertEqual(UserMetrics.objects.get(user=self.user).sesiones_totales, 1)
+        self.assertTrue(UserMetrics.objects.filter(user=otro).exists())
+
+    def test_usuario_inexistente_no_rompe_el_guardado(self):
+        """Los contadores de un usuario que ya no existe se descartan sin afectar a los demás"""
+        from .models import UserMetrics
+        self.actividad.registrar(999999)
+        self.actividad.registrar(self.user.id)
+        self.assertEqual(self.actividad.guardar(), 1)
+        self.assertEqual(UserMetrics.objects.get(user=self.user).dias_activos, 1)
+
+
+class PerfilRequestTest(TestCase):
+    """Tests para el perfil de la sesión cargado una vez por request"""
+
+    def setUp(self):
+        self.user = UserProfile.objects.create(
+            email='perfil@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+        self.client = Client()
+        session = self.client.session
+        session['user_id'] = self.user.id
+        session.save()
+
+    def _request(self):
+        from django.contrib.sessions.backends.db import SessionStore
+        from django.test import RequestFactory
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.session['user_id'] = self.user.id
+        return request
+
+    def test_una_consulta_del_perfil_por_pagina(self):
+        """La vista, el decorador y el context processor comparten una sola carga del perfil"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('investments'))
+
+        self.assertEqual(response.status_code, 200)
+        import re
+        # Solo cargas por id (el guardado en lote de actividad consulta con "id IN")
+        perfiles = [q['sql'] for q in consultas if re.search(r'FROM "myapp_userprofile" WHERE "myapp_userprofile"\."id" = \d', q['sql'])]
+        self.assertEqual(len(perfiles), 1)
+
+    def test_modo_verificacion_detecta_consultas_redundantes(self):
+        """Con la verificación activa, volver a pedir el perfil por id lanza AssertionError"""
+        from django.db import connection
+        from . import perfil
+        request = self._request()
+        request.session.save()
+        with connection.execute_wrapper(perfil.VerificadorConsultas(request)):
+            self.assertEqual(perfil.obtener(request), self.user)
+            self.assertEqual(perfil.obtener(request), self.user)  # desde la caché del request
+            with self.assertRaises(AssertionError):
+                UserProfile.objects.get(id=self.user.id)
+
+    def test_select_related_opcional(self):
+        """PERFIL_SELECT_RELATED trae las relaciones en la misma consulta"""
+        from .models import UserMetrics
+        from . import perfil
+        UserMetrics.objects.create(user=self.user, sesiones_totales=3)
+        with self.settings(PERFIL_SELECT_RELATED=('metrics',)):
+            request = self._request()
+            with self.assertNumQueries(1):
+                self.assertEqual(perfil.obtener(request).metrics.sesiones_totales, 3)
+
+    def test_sin_sesion_o_perfil_inexistente(self):
+        """Sin usuario en la sesión no hay perfil; request.profile lanza DoesNotExist como .get()"""
+        from . import perfil
+        request = self._request()
+        del request.session['user_id']
+        self.assertIsNone(perfil.obtener(request))
+        request.session['user_id'] = 999999
+        self.assertIsNone(perfil.obtener(request))
+        with self.assertRaises(UserProfile.DoesNotExist):
+            perfil.obtener_o_error(request)
+
+
+class RolesAdminTest(TestCase):
+    """Tests para el rol de administrador guardado en la sesión"""
+
+    def setUp(self):
+        self.user = UserProfile.objects.create(
+            email='roles@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+        self.client = Client()
+        session = self.client.session
+        session['user_id'] = self.user.id
+        session.save()
+
+    def _consultas_auth(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        return response, len([q for q in consultas if 'FROM "auth_user"' in q['sql']])
+
+    def test_rol_guardado_en_la_sesion(self):
+        """Solo el primer render consulta auth_user; los siguientes usan la sesión"""
+        _, primera = self._consultas_auth(reverse('investments'))
+        response, segunda = self._consultas_auth(reverse('investments'))
+        self.assertEqual(primera, 1)
+        self.assertEqual(segunda, 0)
+        self.assertFalse(response.context['is_admin'])
+
+    def test_cambio_de_staff_invalida(self):
+        """Dar o quitar staff a un User se refleja en el siguiente request"""
+        from django.contrib.auth.models import User
+        response = self.client.get(reverse('admin_metricas'))
+        self.assertEqual(response.status_code, 403)
+
+        django_user = User.objects.create_user('roles', email='roles@example.com', password='x', is_staff=True)
+        self.assertEqual(self.client.get(reverse('admin_metricas')).status_code, 200)
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['is_admin'])
+
+        django_user.is_staff = False
+        django_user.save()
+        self.assertEqual(self.client.get(reverse('admin_metricas')).status_code, 403)
+
+    def test_login_no_invalida(self):
+        """Actualizar solo last_login no cambia la versión de roles"""
+        from django.contrib.auth.models import User
+        from . import roles
+        django_user = User.objects.create_user('otro-rol', email='otro-rol@example.com', password='x')
+        antes = roles.version()
+        django_user.last_login = timezone.now()
+        django_user.save(update_fields=['last_login'])
+        self.assertEqual(roles.version(), antes)
+        django_user.is_superuser = True
+        django_user.save(update_fields=['is_superuser'])
+        self.assertNotEqual(roles.version(), antes)
+
+    def test_rol_vencido_se_vuelve_a_consultar(self):
+        """Pasado ROLES_TTL el rol se vuelve a consultar aunque no haya cambios"""
+        with self.settings(ROLES_TTL=0):
+            self._consultas_auth(reverse('investments'))
+            _, consultas = self._consultas_auth(reverse('investments'))
+        self.assertEqual(consultas, 1)
+
+
+class AccesoLoginTest(TestCase):
+    """Tests para el control de intentos de login (acceso.py)"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = Client()
+        self.user = UserProfile.objects.create(
+            email='acceso@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+
+    def _login(self, password, email='acceso@example.com', ip='10.0.0.1'):
+        return self.client.post('/login/', {'email': email, 'password': password}, REMOTE_ADDR=ip)
+
+    def test_fallos_se_guardan_y_bloquean(self):
+        """Los fallos se guardan en login_attempts y al tercero se bloquea"""
+        self._login('mala')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.login_attempts, 1)
+        self.assertFalse(self.user.is_blocked)
+
+        self._login('mala')
+        self._login('mala')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.login_attempts, 3)
+        self.assertTrue(self.user.is_blocked)
+
+    def test_login_correcto_reinicia_intentos(self):
+        """Un login correcto reinicia login_attempts"""
+        self._login('mala')
+        response = self._login('Testpass123!')
+        self.assertEqual(response.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.login_attempts, 0)
+
+    def test_bloqueado_no_calcula_hash(self):
+        """Un usuario bloqueado se rechaza sin verificar la contraseña"""
+        self.user.is_blocked = True
+        self.user.save()
+        with patch('myapp.views.check_password') as mock_check:
+            response = self._login('Testpass123!')
+        mock_check.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('user_id', self.client.session)
+
+    def test_ventana_por_email_sin_consultar_base(self):
+        """Con la ventana del email llena se rechaza antes de buscar al usuario"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        for _ in range(3):
+            self._login('mala', email='noexiste@example.com')
+        with patch('myapp.views.check_password') as mock_check, \
+                CaptureQueriesContext(connection) as consultas:
+            response = self._login('mala', email='noexiste@example.com')
+        mock_check.assert_not_called()
+        self.assertFalse(any('myapp_userprofile' in q['sql'] for q in consultas.captured_queries))
+        self.assertIn('Demasiados intentos fallidos con este correo', str(response.context['form'].errors))
+
+    def test_ventana_por_ip(self):
+        """Muchos fallos desde una IP la rechazan aunque cambie el email"""
+        with self.settings(LOGIN_MAX_INTENTOS_IP=4):
+            for i in range(4):
+                self._login('mala', email=f'otro{i}@example.com')
+            with patch('myapp.views.check_password') as mock_check:
+                response = self._login('Testpass123!')
+            mock_check.assert_not_called()
+            self.assertIn('desde tu conexión', str(response.context['form'].errors))
+            self.assertNotIn('user_id', self.client.session)
+
+            # Desde otra IP el usuario sí puede entrar
+            response = self._login('Testpass123!', ip='10.0.0.2')
+            self.assertEqual(response.status_code, 302)
+
+    def test_ventana_deslizante_vence(self):
+        """Los fallos fuera de la ventana ya no cuentan"""
+        from myapp import acceso
+
+        with patch('myapp.acceso.time.time', return_value=1000.0):
+            for _ in range(2):
+                acceso.registrar_fallo('acceso@example.com', '10.0.0.1', self.user)
+        with patch('myapp.acceso.time.time', return_value=1000.0 + 901):
+            self.assertIsNone(acceso.rechazo('acceso@example.com', '10.0.0.1'))
+            self.assertFalse(acceso.registrar_fallo('acceso@example.com', '10.0.0.1', self.user))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.login_attempts, 1)
+        self.assertFalse(self.user.is_blocked)
+
+    def test_olvidar_permite_volver_a_entrar(self):
+        """Al desbloquear se olvidan los fallos recientes del email"""
+        from myapp import acceso
+
+        for _ in range(3):
+            self._login('mala')
+        self.assertEqual(acceso.rechazo('acceso@example.com', '10.0.0.2'), 'email')
+        UserProfile.objects.filter(id=self.user.id).update(is_blocked=False, login_attempts=0)
+        acceso.olvidar('acceso@example.com')
+        response = self._login('Testpass123!', ip='10.0.0.2')
+        self.assertEqual(response.status_code, 302)
+
+    def test_bloqueo_encola_el_aviso(self):
+        """El correo de bloqueo se encola y no se envía dentro del login"""
+        from django.core import mail
+        from .models import TareaSegundoPlano
+        with self.settings(TAREAS_MODO='comando'):
+            for _ in range(3):
+                self._login('mala')
+        self.assertEqual(len(mail.outbox), 0)
+        tarea = TareaSegundoPlano.objects.get(tipo='aviso_bloqueo')
+        self.assertEqual(tarea.user_id, self.user.id)
+
+        from . import tareas
+        self.assertEqual(tareas.procesar_pendientes(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['acceso@example.com'])
+
+    def test_resetear_contrasena_desbloquea(self):
+        """Restablecer la contraseña desbloquea la cuenta y olvida los fallos"""
+        from django.utils.encoding import force_bytes
+        from django.utils.http import urlsafe_base64_encode
+        from .tokens import custom_token_generator
+        with self.settings(TAREAS_MODO='comando'):
+            for _ in range(3):
+                self._login('mala')
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_blocked)
+
+        uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        token = custom_token_generator.make_token(self.user)
+        self.client.post(reverse('resetear_contrasena', args=[uid, token]), {
+            'nueva_contrasena': 'Nueva123!', 'confirmar_contrasena': 'Nueva123!'
+        })
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_blocked)
+        self.assertEqual(self.user.login_attempts, 0)
+        self.assertEqual(self._login('Nueva123!').status_code, 302)
+
+    def test_ip_detras_de_proxy_confiable(self):
+        """Solo a través de un proxy confiable se usa X-Forwarded-For"""
+        from django.test import RequestFactory
+        from . import acceso
+        factory = RequestFactory()
+        falsificada = factory.get('/', REMOTE_ADDR='203.0.113.5', HTTP_X_FORWARDED_FOR='1.1.1.1')
+        por_proxy = factory.get('/', REMOTE_ADDR='10.0.0.9', HTTP_X_FORWARDED_FOR='1.1.1.1, 198.51.100.7, 10.0.0.8')
+        with self.settings(LOGIN_PROXIES_CONFIABLES=[]):
+            self.assertEqual(acceso.ip_cliente(por_proxy), '10.0.0.9')
+        with self.settings(LOGIN_PROXIES_CONFIABLES=['10.0.0.0/8']):
+            self.assertEqual(acceso.ip_cliente(falsificada), '203.0.113.5')
+            self.assertEqual(acceso.ip_cliente(por_proxy), '198.51.100.7')
+
+
+
+class EstadoJuegoTest(TestCase):
+    """Tests para el estado de trivia y chatbot fuera de la sesión"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = UserProfile.objects.create(
+            email='estado@example.com',
+            password=make_password('Testpass123!'),
+            first_name='Test',
+            last_name='User'
+        )
+        session = self.client.session
+        session['user_id'] = self.user.id
+        session.save()
+        self.preguntas = [
+            PreguntaTrivia.objects.create(
+                pregunta=f'Pregunta {i}',
+                opciones={'a': 'Opción A', 'b': 'Opción B'},
+                respuesta_correcta='a'
+            )
+            for i in range(3)
+        ]
+
+    def test_bitset(self):
+        """Los ids se guardan como bits y se recuperan igual"""
+        from .estado_juego import a_bitset, de_bitset
+        self.assertEqual(a_bitset([]), b'')
+        self.assertEqual(a_bitset([0, 9]), b'\x01\x02')
+        self.assertEqual(de_bitset(a_bitset({3, 8, 1000})), {3, 8, 1000})
+        self.assertEqual(len(a_bitset(range(800))), 100)
+
+    def test_trivia_no_usa_la_sesion(self):
+        """La partida se guarda en EstadoTrivia y la sesión queda sin datos del juego"""
+        from .models import EstadoTrivia
+        from .estado_juego import de_bitset
+        self.client.get('/trivia/')
+        estado = EstadoTrivia.objects.get(user=self.user)
+        self.client.post('/trivia/', {'opcion_seleccionada': 'a'})
+        estado.refresh_from_db()
+        self.assertEqual(estado.puntos, 100)
+        self.assertEqual(len(de_bitset(estado.respondidas)), 1)
+        for clave in ('puntos_trivia', 'fallos_trivia', 'preguntas_respondidas', 'pregunta_actual_id'):
+            self.assertNotIn(clave, self.client.session)
+
+    def test_trivia_no_repite_preguntas(self):
+        """Las preguntas respondidas no vuelven a salir y al terminar se reinicia la partida"""
+        from .models import EstadoTrivia
+        vistas = set()
+        for _ in range(3):
+            response = self.client.get('/trivia/')
+            vistas.add(response.context['pregunta'].id)
+            response = self.client.post('/trivia/', {'opcion_seleccionada': 'a'})
+        self.assertEqual(vistas, {p.id for p in self.preguntas})
+        # Al responder la última se muestra el resultado
+        self.assertEqual(response.context['puntos'], 300)
+        estado = EstadoTrivia.objects.get(user=self.user)
+        self.assertEqual((estado.puntos, bytes(estado.respondidas)), (0, b''))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.trivia_puntaje, 300)
+
+    def test_trivia_pasa_la_partida_de_la_sesion(self):
+        """Una partida que seguía en la sesión se pasa a la base"""
+        from .models import EstadoTrivia
+        from .estado_juego import de_bitset
+        session = self.client.session
+        session['puntos_trivia'] = 200
+        session['fallos_trivia'] = 1
+        session['preguntas_respondidas'] = [self.preguntas[0].id]
+        session.save()
+        response = self.client.get('/trivia/')
+        self.assertNotEqual(response.context['pregunta'].id, self.preguntas[0].id)
+        estado = EstadoTrivia.objects.get(user=self.user)
+        self.assertEqual((estado.puntos, estado.fallos), (200, 1))
+        self.assertIn(self.preguntas[0].id, de_bitset(estado.respondidas))
+        self.assertNotIn('preguntas_respondidas', self.client.session)
+
+    def test_guardar_solo_escribe_cambios(self):
+        """guardar() actualiza solo los campos que cambiaron"""
+        from .estado_juego import PartidaTrivia
+        partida = PartidaTrivia(self.user.id)
+        partida.guardar()
+        partida = PartidaTrivia(self.user.id)
+        self.assertEqual(partida.guardar(), {})
+        partida.puntos += 100
+        self.assertEqual(partida.guardar(), {'puntos': 100})
+
+    def test_chat_buffer_circular(self):
+        """Solo se guardan los últimos turnos y cada turno inserta una fila"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .contexto_chat import ContextoChatUsuario
+        from .models import TurnoChat
+        with self.settings(CHAT_TURNOS_RECIENTES=2, CHAT_TURNOS_GUARDADOS=3):
+            for i in range(5):
+                ContextoChatUsuario(self.user.id).agregar_turno(f'Pregunta {i}', f'Respuesta {i}.')
+            contexto = ContextoChatUsuario(self.user.id)
+            with CaptureQueriesContext(connection) as consultas:
+                contexto.agregar_turno('Pregunta 5', 'Respuesta 5.')
+        self.assertEqual(
+            list(TurnoChat.objects.filter(user=self.user).values_list('pregunta', flat=True)),
+            ['Pregunta 3', 'Pregunta 4', 'Pregunta 5']
+        )
+        inserciones = [q for q in consultas.captured_queries if q['sql'].startswith('INSERT INTO "myapp_turnochat"')]
+        self.assertEqual(len(inserciones), 1)
+        self.assertFalse(any('UPDATE "myapp_turnochat"' in q['sql'] for q in consultas.captured_queries))
+        self.assertIn('Pregunta 3', ContextoChatUsuario(self.user.id).resumen)
+
+
 if __name__ == '__main__':
     import unittest
     unittest.main()
\ No newline at end of file
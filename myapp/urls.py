@@ -15,6 +15,7 @@ urlpatterns = [
     path('reports/export/', views.export_pdf_view, name='export_pdf'),
     path('recomendaciones/', views.recommendations_view, name='recommendations'),
     path('chatbot/', views.chatbot_view, name='chatbot'),
+    path('chatbot/stream/', views.chatbot_stream_view, name='chatbot_stream'),
     path('inversiones/', views.investment_view, name='investments'),
     path('retos/', views.retos_view, name='retos'),
     path('logout/', views.logout_view, name='logout'),
@@ -61,4 +62,5 @@ urlpatterns = [
     # Admin personalizado
     path('admin-panel/', views.admin_dashboard_view, name='admin_dashboard'),
     path('admin-panel/usuario/<int:usuario_id>/', views.admin_editar_usuario_view, name='admin_editar_usuario'),
+    path('admin-panel/metricas/', views.admin_metricas_view, name='admin_metricas'),
 ]
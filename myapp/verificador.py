@@ -0,0 +1,220 @@
+"""
+Verificador local de respuestas para Completar Frases.
+
+Compara la respuesta del usuario con la palabra clave sin llamar a la IA:
+normaliza tildes, mayúsculas, signos y artículos, reconoce siglas y
+sinónimos (tabla SINONIMOS y siglas formadas por las iniciales), tolera
+errores de escritura con la distancia de Damerau-Levenshtein y compara
+palabras con similitud de conjuntos. Solo se califica como incorrecta sin
+IA una respuesta que es otro concepto conocido; los casos dudosos y las
+respuestas sin parecido en la escritura (que pueden ser una paráfrasis
+correcta que las tablas no conocen) se devuelven como None para que los
+resuelva la IA.
+"""
+import re
+import unicodedata
+
+
+ARTICULOS = {'el', 'la', 'los', 'las', 'un', 'una', 'unos', 'unas', 'lo', 'al', 'del'}
+
+# Palabras que no cuentan para siglas ni para comparar conjuntos de palabras
+CONECTORES = {'de', 'del', 'y', 'e', 'a', 'al', 'la', 'las', 'el', 'los', 'en', 'por', 'para', 'o', 'u'}
+
+# Sigla o término -> formas equivalentes (ya normalizadas: sin tildes ni mayúsculas)
+SINONIMOS = {
+    'sbs': ['superintendencia de banca y seguros', 'superintendencia de banca seguros y afp'],
+    'sunat': ['superintendencia nacional de aduanas y de administracion tributaria',
+              'superintendencia nacional de administracion tributaria'],
+    'smv': ['superintendencia del mercado de valores'],
+    'bcrp': ['banco central de reserva del peru', 'banco central de reserva', 'banco central'],
+    'bvl': ['bolsa de valores de lima'],
+    'igv': ['impuesto general a las ventas'],
+    'itf': ['impuesto a las transacciones financieras'],
+    'uit': ['unidad impositiva tributaria'],
+    'ruc': ['registro unico de contribuyentes'],
+    'tea': ['tasa efectiva anual'],
+    'tcea': ['tasa de costo efectivo anual', 'tasa costo efectivo anual'],
+    'trea': ['tasa de rendimiento efectivo anual', 'tasa rendimiento efectivo anual'],
+    'tna': ['tasa nominal anual'],
+    'tem': ['tasa efectiva mensual'],
+    'afp': ['administradora de fondos de pensiones', 'administradora privada de fondos de pensiones'],
+    'onp': ['oficina de normalizacion previsional'],
+    'cts': ['compensacion por tiempo de servicios', 'compensacion por tiempo de servicio'],
+    'pbi': ['pib', 'producto bruto interno', 'producto interno bruto'],
+    'ipc': ['indice de precios al consumidor'],
+    'fmi': ['fondo monetario internacional'],
+    'etf': ['fondo cotizado', 'fondo cotizado en bolsa'],
+    'fondo mutuo': ['fondos mutuos', 'fondo de inversion colectiva'],
+    'tarjeta de credito': ['tc'],
+    'fondo de emergencia': ['fondo de emergencias', 'colchon financiero', 'fondo de reserva'],
+    'deuda': ['endeudamiento'],
+    'prestamo': ['credito personal'],
+    'ganancia': ['utilidad', 'beneficio'],
+    'inflacion': ['aumento generalizado de precios', 'alza de precios'],
+    'diversificacion': ['diversificar'],
+}
+
+# Conceptos relacionados que merecen crédito parcial (es_similar)
+RELACIONADOS = {
+    'fondo de emergencia': ['ahorro', 'ahorros'],
+    'phishing': ['smishing', 'vishing', 'fraude', 'estafa', 'suplantacion'],
+    'smishing': ['phishing', 'vishing', 'fraude', 'estafa'],
+    'vishing': ['phishing', 'smishing', 'fraude', 'estafa'],
+    'inflacion': ['ipc', 'deflacion'],
+    'tea': ['tcea', 'tasa de interes', 'interes'],
+    'tcea': ['tea', 'tasa de interes', 'interes'],
+    'acciones': ['bonos', 'fondo mutuo', 'inversion'],
+    'bonos': ['acciones', 'renta fija'],
+    'presupuesto': ['planificacion', 'plan de gastos'],
+    'diversificacion': ['cartera', 'portafolio'],
+    'afp': ['onp', 'pension', 'jubilacion'],
+    'onp': ['afp', 'pension', 'jubilacion'],
+}
+
+UMBRAL_CORRECTA = 0.85
+UMBRAL_DUDOSA = 0.6
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes ni signos, sin espacios extra y sin artículo inicial"""
+    texto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'[^\w\s%]', ' ', texto)
+    palabras = texto.split()
+    while len(palabras) > 1 and palabras[0] in ARTICULOS:
+        palabras.pop(0)
+    return ' '.join(palabras)
+
+
+def _palabras(texto):
+    return [p for p in texto.split() if p not in CONECTORES]
+
+
+def _construir_canonicos():
+    canonicos = {}
+    for canonico, formas in SINONIMOS.items():
+        canonicos[canonico] = canonico
+        for forma in formas:
+            canonicos[forma] = canonico
+    return canonicos
+
+
+_CANONICOS = _construir_canonicos()
+
+
+def canonico(texto_normalizado):
+    """Forma canónica de un término (su sigla o entrada principal en SINONIMOS)"""
+    return _CANONICOS.get(texto_normalizado, texto_normalizado)
+
+
+def es_sigla_de(sigla, frase):
+    """True si `sigla` son las iniciales de las palabras significativas de `frase` (p. ej. tea / tasa efectiva anual)"""
+    if ' ' in sigla or len(sigla) < 2:
+        return False
+    palabras = _palabras(frase)
+    return len(palabras) == len(sigla) and all(p[0] == letra for p, letra in zip(palabras, sigla))
+
+
+def damerau_levenshtein(a, b):
+    """Distancia de edición con transposiciones de caracteres adyacentes (alineamiento óptimo)"""
+    if a == b:
+        return 0
+    if not a or not b:
+        return len(a) + len(b)
+
+    anterior2 = None
+    anterior = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        actual = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            costo = 0 if a[i - 1] == b[j - 1] else 1
+            actual[j] = min(
+                anterior[j] + 1,
+                actual[j - 1] + 1,
+                anterior[j - 1] + costo
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                actual[j] = min(actual[j], anterior2[j - 2] + 1)
+        anterior2, anterior = anterior, actual
+    return anterior[-1]
+
+
+def similitud_caracteres(a, b):
+    """1 - distancia / longitud mayor (1.0 = idénticas)"""
+    if not a and not b:
+        return 1.0
+    return 1 - damerau_levenshtein(a, b) / max(len(a), len(b))
+
+
+def _palabras_coinciden(a, b):
+    # Tolera un error de escritura en palabras de 5 letras o más
+    return a == b or (min(len(a), len(b)) >= 5 and damerau_levenshtein(a, b) <= 1)
+
+
+def similitud_palabras(a, b):
+    """
+    Similitud de conjuntos de palabras (sin conectores) tolerando errores de
+    escritura por palabra. Retorna (similitud, respuesta_contenida) donde la
+    segunda indica que todas las palabras de una están en la otra.
+    """
+    palabras_a = set(_palabras(a))
+    palabras_b = set(_palabras(b))
+    if not palabras_a or not palabras_b:
+        return 0.0, False
+
+    comunes = sum(1 for p in palabras_a if any(_palabras_coinciden(p, q) for q in palabras_b))
+    union = len(palabras_a) + len(palabras_b) - comunes
+    contenida = comunes == min(len(palabras_a), len(palabras_b))
+    return comunes / union, contenida
+
+
+def _resultado(es_correcta, es_similar, explicacion):
+    return {'es_correcta': es_correcta, 'es_similar': es_similar, 'explicacion': explicacion}
+
+
+def verificar_local(palabra_correcta, respuesta_usuario, decidir=False):
+    """
+    Califica la respuesta sin IA. Retorna el mismo dict que
+    verificar_respuesta_ia, o None si el caso es dudoso y conviene
+    consultar a la IA (con `decidir=True` nunca retorna None).
+    """
+    esperada = normalizar(palabra_correcta)
+    respuesta = normalizar(respuesta_usuario)
+
+    if not respuesta:
+        return _resultado(False, False, 'No escribiste una respuesta')
+
+    if respuesta == esperada:
+        return _resultado(True, False, 'Respuesta correcta')
+
+    canon_esperada = canonico(esperada)
+    canon_respuesta = canonico(respuesta)
+    if canon_esperada == canon_respuesta or es_sigla_de(respuesta, esperada) or es_sigla_de(esperada, respuesta):
+        return _resultado(True, False, 'Respuesta correcta (término equivalente)')
+
+    similitud = similitud_caracteres(respuesta, esperada)
+    # En palabras cortas (siglas) no se toleran errores de escritura
+    if min(len(respuesta), len(esperada)) >= 4 and similitud >= UMBRAL_CORRECTA:
+        return _resultado(True, False, 'Respuesta correcta (con un pequeño error de escritura)')
+
+    similitud_conjunto, contenida = similitud_palabras(respuesta, esperada)
+    if similitud_conjunto >= UMBRAL_CORRECTA:
+        return _resultado(True, False, 'Respuesta correcta')
+
+    relacionados = RELACIONADOS.get(canon_esperada, [])
+    if canon_respuesta in relacionados or respuesta in relacionados:
+        return _resultado(False, True, 'Respuesta relacionada, pero no es el término exacto')
+
+    if contenida and similitud_conjunto > 0:
+        return _resultado(False, True, 'Respuesta parcialmente correcta')
+
+    if canon_respuesta in SINONIMOS and canon_respuesta != canon_esperada:
+        # Es otro término conocido (p. ej. IGV en lugar de TEA)
+        return _resultado(False, False, 'Respuesta incorrecta: es un concepto diferente')
+
+    if not decidir:
+        # Puede ser una paráfrasis correcta que no está en las tablas: que decida la IA
+        return None
+    if max(similitud, similitud_conjunto) >= UMBRAL_DUDOSA:
+        return _resultado(False, True, 'Respuesta parcialmente correcta')
+    return _resultado(False, False, 'Respuesta incorrecta')
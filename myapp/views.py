@@ -1,7 +1,9 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse, Http404
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.db.models import Sum
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
@@ -13,15 +15,23 @@ from django.utils.encoding import force_bytes, force_str
 from django.db.models.functions import TruncMonth
 from datetime import date, timedelta
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
 import json
 import random
-import requests
 import os
 import io
+import threading
 from xhtml2pdf import pisa
 from django.template.loader import render_to_string
 
+from . import acceso, analitica, banco_frases, evaluacion_ia, gemini, metricas, pool, portafolio, precios, roles, verificador
+from .banco_preguntas import preguntas_locales, preguntas_brecha_locales
+from .evaluacion_ia import CATEGORIAS_EVALUACION
+from .contexto_chat import ContextoChatUsuario
+from .estado_juego import PartidaTrivia
 from .decorators import session_login_required
+from .templatetags.markdown_filter import markdown_filter
 from .forms import (
     LoginForm, RegisterForm, ExpenseForm, PaymentMethodForm,
     InvestmentForm, UpdateLimitForm
@@ -33,111 +43,19 @@ from .models import (
     UserMetrics, PeriodicAssessment, CreditRiskAlert, EducationalContent,
     Achievement, UserAchievement, Storyline, StoryProgress,
     FraudPreventionContent, PersonalizedRecommendation, UserContext,
-    PregeneradaEvaluacion, PregeneradaFraseCompletar
+    PregeneradaEvaluacion, EvaluacionServida
 )
 from .tokens import custom_token_generator
 
 
-def generar_evaluacion_completa_en_segundo_plano(user):
-    """Genera una evaluación completa en segundo plano y la guarda"""
-    try:
-        from threading import Thread
-        
-        def generar_y_guardar():
-            try:
-                # Generar preguntas para cada categoría
-                categorias = ['presupuesto', 'ahorro', 'credito', 'inversiones', 'fraudes']
-                todas_preguntas = {}
-                
-                for categoria in categorias:
-                    preguntas = generar_preguntas_evaluacion_ia(categoria, cantidad=10)
-                    if preguntas:
-                        todas_preguntas[categoria] = preguntas
-                    else:
-                        todas_preguntas[categoria] = []
-                
-                # Generar preguntas de brecha teórico-práctica
-                preguntas_brecha = obtener_preguntas_brecha_teorico_practica()
-                
-                # Guardar en la base de datos
-                from myapp.models import PregeneradaEvaluacion
-                PregeneradaEvaluacion.objects.create(
-                    user=user,
-                    preguntas_evaluacion=todas_preguntas,
-                    preguntas_brecha=preguntas_brecha
-                )
-            except Exception as e:
-                print(f"Error generando evaluación en segundo plano: {str(e)}")
-        
-        # Ejecutar en un hilo separado
-        thread = Thread(target=generar_y_guardar)
-        thread.daemon = True
-        thread.start()
-    except Exception as e:
-        print(f"Error iniciando generación en segundo plano: {str(e)}")
-
-
-def generar_frase_completar_en_segundo_plano(user):
-    """Genera una frase para Completar Frases en segundo plano y la guarda"""
-    try:
-        from threading import Thread
-        
-        def generar_y_guardar():
-            try:
-                frase_data = generar_frase_completar_ia()
-                if frase_data:
-                    from myapp.models import PregeneradaFraseCompletar
-                    PregeneradaFraseCompletar.objects.create(
-                        user=user,
-                        frase_completa=frase_data['frase_completa'],
-                        palabra_clave=frase_data['palabra_clave']
-                    )
-            except Exception as e:
-                print(f"Error generando frase en segundo plano: {str(e)}")
-        
-        # Ejecutar en un hilo separado
-        thread = Thread(target=generar_y_guardar)
-        thread.daemon = True
-        thread.start()
-    except Exception as e:
-        print(f"Error iniciando generación de frase en segundo plano: {str(e)}")
-
-
 def generar_preguntas_evaluacion_ia(categoria, cantidad=10):
     """Genera preguntas de evaluación usando IA para una categoría específica"""
     try:
-        import google.generativeai as genai
-        
-        api_key = getattr(settings, 'GEMINI_API_KEY', None)
-        if not api_key:
-            return []
-        
-        genai.configure(api_key=api_key)
-        
-        # Intentar con diferentes modelos
-        modelos_a_probar = ['gemini-2.0-flash', 'gemini-2.0-flash-exp', 'gemini-1.5-flash', 'gemini-1.5-pro']
-        modelo = None
-        
-        for modelo_nombre in modelos_a_probar:
-            try:
-                modelo = genai.GenerativeModel(modelo_nombre)
-                break
-            except:
-                continue
-        
+        modelo = obtener_modelo_gemini()
         if not modelo:
             return []
         
-        # Mapeo de categorías a descripciones
-        categorias_desc = {
-            'presupuesto': 'Presupuestos y planificación financiera',
-            'ahorro': 'Ahorro y gestión de ahorros',
-            'credito': 'Crédito, tarjetas de crédito y deudas',
-            'inversiones': 'Inversiones y productos financieros',
-            'fraudes': 'Fraudes digitales y seguridad financiera'
-        }
-        
-        categoria_desc = categorias_desc.get(categoria, categoria)
+        categoria_desc = evaluacion_ia.DESCRIPCION_CATEGORIAS.get(categoria, categoria)
         
         prompt = f"""Genera {cantidad} preguntas de opción múltiple sobre {categoria_desc} para una evaluación financiera en Perú.
 
@@ -166,17 +84,7 @@ Requisitos:
 
 Responde SOLO con el JSON, sin texto adicional."""
 
-        response = modelo.generate_content(prompt)
-        texto_respuesta = response.text.strip()
-        
-        # Limpiar el texto si tiene markdown
-        if texto_respuesta.startswith('```'):
-            texto_respuesta = texto_respuesta.split('```')[1]
-            if texto_respuesta.startswith('json'):
-                texto_respuesta = texto_respuesta[4:]
-        texto_respuesta = texto_respuesta.strip()
-        
-        datos = json.loads(texto_respuesta)
+        datos = gemini.generar_json(prompt, familia='evaluacion')
         return datos.get('preguntas', [])
         
     except Exception as e:
@@ -187,25 +95,7 @@ Responde SOLO con el JSON, sin texto adicional."""
 def generar_preguntas_brecha_teorico_practica_ia(tipo='teorico', cantidad=5):
     """Genera preguntas de brecha teórico-práctica usando IA (4-5 opciones)"""
     try:
-        import google.generativeai as genai
-        
-        api_key = getattr(settings, 'GEMINI_API_KEY', None)
-        if not api_key:
-            return []
-        
-        genai.configure(api_key=api_key)
-        
-        # Intentar con diferentes modelos
-        modelos_a_probar = ['gemini-2.0-flash', 'gemini-2.0-flash-exp', 'gemini-1.5-flash', 'gemini-1.5-pro']
-        modelo = None
-        
-        for modelo_nombre in modelos_a_probar:
-            try:
-                modelo = genai.GenerativeModel(modelo_nombre)
-                break
-            except:
-                continue
-        
+        modelo = obtener_modelo_gemini()
         if not modelo:
             return []
         
@@ -242,16 +132,7 @@ Requisitos:
 
 Responde SOLO con el JSON, sin texto adicional."""
 
-        response = modelo.generate_content(prompt)
-        texto_respuesta = response.text.strip()
-        
-        # Limpiar el texto si tiene markdown
-        if texto_respuesta.startswith('```'):
-            texto_respuesta = texto_respuesta.split('```')[1]
-            if texto_respuesta.startswith('json'):
-                texto_respuesta = texto_respuesta[4:]
-        
-        datos = json.loads(texto_respuesta)
+        datos = gemini.generar_json(prompt, familia='brecha')
         return datos.get('preguntas', [])
         
     except Exception as e:
@@ -270,10 +151,112 @@ def obtener_preguntas_brecha_teorico_practica():
     }
 
 
+_executor_ia = None
+_executor_ia_lock = threading.Lock()
+
+
+def _obtener_executor_ia():
+    """Pool de hilos compartido (y acotado) para las llamadas concurrentes a la IA"""
+    global _executor_ia
+    with _executor_ia_lock:
+        if _executor_ia is None:
+            _executor_ia = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IA_MAX_HILOS', 7),
+                thread_name_prefix='ia'
+            )
+        return _executor_ia
+
+
+def generar_evaluacion_concurrente(tiempo_limite=None, usar_banco_local=True):
+    """
+    Genera las 5 categorías y las 2 secciones de brecha en paralelo.
+    
+    Las llamadas que no terminan dentro de `tiempo_limite` segundos (o que
+    fallan) se completan con el banco local si `usar_banco_local` es True,
+    de modo que la página espera como máximo la llamada más lenta.
+    Retorna (preguntas_evaluacion, preguntas_brecha).
+    """
+    executor = _obtener_executor_ia()
+    tareas = {}
+    for categoria in CATEGORIAS_EVALUACION:
+        tareas[executor.submit(contextvars.copy_context().run, generar_preguntas_evaluacion_ia, categoria, cantidad=10)] = ('categoria', categoria)
+    for tipo in ('teorico', 'practico'):
+        tareas[executor.submit(contextvars.copy_context().run, generar_preguntas_brecha_teorico_practica_ia, tipo, cantidad=5)] = ('brecha', tipo)
+    
+    terminadas, pendientes = wait(tareas, timeout=tiempo_limite)
+    for futuro in pendientes:
+        futuro.cancel()
+    
+    preguntas_evaluacion = {}
+    preguntas_brecha = {}
+    for futuro, (seccion, clave) in tareas.items():
+        preguntas = []
+        if futuro in terminadas and not futuro.exception():
+            preguntas = futuro.result()
+        
+        if not preguntas and usar_banco_local:
+            if seccion == 'categoria':
+                preguntas = preguntas_locales(clave, cantidad=10)
+            else:
+                preguntas = preguntas_brecha_locales(clave, cantidad=5)
+        
+        if seccion == 'categoria':
+            preguntas_evaluacion[clave] = preguntas
+        else:
+            preguntas_brecha[clave] = preguntas
+    
+    # Mantener el orden original de las categorías
+    preguntas_evaluacion = {c: preguntas_evaluacion[c] for c in CATEGORIAS_EVALUACION}
+    return preguntas_evaluacion, preguntas_brecha
+
+
+def generar_evaluacion(tiempo_limite=None, usar_banco_local=True):
+    """
+    Genera una evaluación completa según EVALUACION_MODO_GENERACION:
+    'una_llamada' (un solo prompt en streaming con todas las secciones) o
+    'por_seccion' (los 7 prompts en paralelo). Retorna (preguntas_evaluacion, preguntas_brecha).
+    """
+    if getattr(settings, 'EVALUACION_MODO_GENERACION', 'una_llamada') != 'una_llamada':
+        return generar_evaluacion_concurrente(tiempo_limite=tiempo_limite, usar_banco_local=usar_banco_local)
+    
+    preguntas_evaluacion, preguntas_brecha = {}, {}
+    if obtener_modelo_gemini():
+        preguntas_evaluacion, preguntas_brecha = evaluacion_ia.generar_en_una_llamada(
+            tiempo_limite=tiempo_limite,
+            executor=_obtener_executor_ia()
+        )
+    
+    if usar_banco_local:
+        # Las secciones que no llegaron (o no pasaron la validación) salen del banco local
+        return completar_secciones_vacias(preguntas_evaluacion, preguntas_brecha)
+    
+    if not preguntas_evaluacion and not preguntas_brecha:
+        # La llamada única no sirvió: intentar sección por sección
+        return generar_evaluacion_concurrente(usar_banco_local=False)
+    
+    return (
+        {c: preguntas_evaluacion.get(c, []) for c in CATEGORIAS_EVALUACION},
+        {t: preguntas_brecha.get(t, []) for t in evaluacion_ia.SECCIONES_BRECHA}
+    )
+
+
+def completar_secciones_vacias(preguntas_evaluacion, preguntas_brecha):
+    """Completa con el banco local las secciones que quedaron vacías (p. ej. por preguntas repetidas en el pool)"""
+    preguntas_evaluacion = {
+        categoria: preguntas_evaluacion.get(categoria) or preguntas_locales(categoria, cantidad=10)
+        for categoria in CATEGORIAS_EVALUACION
+    }
+    preguntas_brecha = {
+        tipo: preguntas_brecha.get(tipo) or preguntas_brecha_locales(tipo, cantidad=5)
+        for tipo in ('teorico', 'practico')
+    }
+    return preguntas_evaluacion, preguntas_brecha
+
+
 @session_login_required
 def evaluaciones_view(request):
     """Vista de lista de todas las evaluaciones del usuario"""
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     evaluaciones = FinancialCompetencyAssessment.objects.filter(user=user).order_by('-fecha_evaluacion')
     
     return render(request, 'research/evaluaciones.html', {
@@ -285,160 +268,194 @@ def evaluaciones_view(request):
 @session_login_required
 def evaluacion_view(request):
     """Vista unificada para tomar evaluaciones (puede tomarse múltiples veces)"""
-    user = UserProfile.objects.get(id=request.session['user_id'])
-    from myapp.models import PregeneradaEvaluacion
-    
-    # Intentar obtener evaluación pre-generada
-    evaluacion_pregenerada = PregeneradaEvaluacion.objects.filter(
-        user=user, 
-        usada=False
-    ).order_by('fecha_creacion').first()
-    
-    if evaluacion_pregenerada and not request.GET.get('regenerar') == '1':
-        # Usar evaluación pre-generada
-        preguntas_evaluacion = evaluacion_pregenerada.preguntas_evaluacion
-        preguntas_brecha = evaluacion_pregenerada.preguntas_brecha
-        
-        # Marcar como usada
-        evaluacion_pregenerada.usada = True
-        evaluacion_pregenerada.fecha_uso = timezone.now()
-        evaluacion_pregenerada.save()
-        
-        # Generar siguiente evaluación en segundo plano
-        generar_evaluacion_completa_en_segundo_plano(user)
-    else:
-        # Generar en tiempo real si no hay pre-generada o se solicita regenerar
-        categorias = ['presupuesto', 'ahorro', 'credito', 'inversiones', 'fraudes']
-        todas_preguntas = {}
-        
-        for categoria in categorias:
-            preguntas = generar_preguntas_evaluacion_ia(categoria, cantidad=10)
-            if preguntas:
-                todas_preguntas[categoria] = preguntas
-            else:
-                todas_preguntas[categoria] = []
-        
-        preguntas_brecha = obtener_preguntas_brecha_teorico_practica()
-        preguntas_evaluacion = todas_preguntas
-        
-        # Generar siguiente evaluación en segundo plano
-        generar_evaluacion_completa_en_segundo_plano(user)
+    user = request.profile
     
     if request.method == 'POST':
-        # Procesar respuestas
-        respuestas = {}
-        respuestas_brecha_teorico = {}
-        respuestas_brecha_practico = {}
-        
-        # Procesar respuestas de preguntas generadas por IA
-        for categoria, preguntas in preguntas_evaluacion.items():
-            respuestas_categoria = []
-            for idx, pregunta in enumerate(preguntas):
-                respuesta_key = f'pregunta_{categoria}_{idx}'
+        # Calificar contra el set que se le mostró al usuario (sin generar nada)
+        evaluacion_id = request.POST.get('evaluacion_servida_id') or request.session.get('evaluacion_servida_id')
+        try:
+            evaluacion_servida = EvaluacionServida.objects.get(id=evaluacion_id, user=user)
+        except (EvaluacionServida.DoesNotExist, ValueError, ValidationError):
+            evaluacion_servida = None
+        
+        if not evaluacion_servida or evaluacion_servida.fecha_respuesta:
+            messages.error(request, 'Esta evaluación ya fue enviada o expiró. Te mostramos una nueva.')
+            return redirect('evaluacion_view')
+        
+        # Calificar y marcarla como respondida en la misma transacción: si algo falla
+        # al calificar la evaluación sigue abierta y el usuario puede volver a enviarla
+        with transaction.atomic():
+            evaluacion_servida = EvaluacionServida.objects.select_for_update().filter(
+                id=evaluacion_servida.id,
+                fecha_respuesta__isnull=True
+            ).first()
+            if not evaluacion_servida:
+                messages.error(request, 'Esta evaluación ya fue enviada o expiró. Te mostramos una nueva.')
+                return redirect('evaluacion_view')
+            
+            preguntas_evaluacion = evaluacion_servida.preguntas_evaluacion
+            preguntas_brecha = evaluacion_servida.preguntas_brecha
+            
+            # Procesar respuestas
+            respuestas = {}
+            respuestas_brecha_teorico = {}
+            respuestas_brecha_practico = {}
+            
+            # Procesar respuestas de preguntas generadas por IA
+            for categoria, preguntas in preguntas_evaluacion.items():
+                respuestas_categoria = []
+                for idx, pregunta in enumerate(preguntas):
+                    respuesta_key = f'pregunta_{categoria}_{idx}'
+                    respuesta = request.POST.get(respuesta_key)
+                    if respuesta:
+                        respuestas_categoria.append({
+                            'pregunta_idx': idx,
+                            'respuesta': respuesta,
+                            'correcta': pregunta.get('respuesta_correcta', '')
+                        })
+                respuestas[categoria] = respuestas_categoria
+            
+            # Procesar respuestas de brecha teórico-práctica
+            for idx, pregunta in enumerate(preguntas_brecha['teorico']):
+                respuesta_key = f'brecha_teorico_{idx}'
                 respuesta = request.POST.get(respuesta_key)
                 if respuesta:
-                    respuestas_categoria.append({
-                        'pregunta_idx': idx,
+                    respuestas_brecha_teorico[idx] = {
                         'respuesta': respuesta,
                         'correcta': pregunta.get('respuesta_correcta', '')
-                    })
-            respuestas[categoria] = respuestas_categoria
-        
-        # Procesar respuestas de brecha teórico-práctica
-        for idx, pregunta in enumerate(preguntas_brecha['teorico']):
-            respuesta_key = f'brecha_teorico_{idx}'
-            respuesta = request.POST.get(respuesta_key)
-            if respuesta:
-                respuestas_brecha_teorico[idx] = {
-                    'respuesta': respuesta,
-                    'correcta': pregunta.get('respuesta_correcta', '')
-                }
-        
-        for idx, pregunta in enumerate(preguntas_brecha['practico']):
-            respuesta_key = f'brecha_practico_{idx}'
-            respuesta = request.POST.get(respuesta_key)
-            if respuesta:
-                respuestas_brecha_practico[idx] = respuesta
-        
-        # Calcular puntajes por categoría
-        puntajes_categoria = {}
-        for categoria, respuestas_cat in respuestas.items():
-            correctas = sum(1 for r in respuestas_cat if r['respuesta'] == r['correcta'])
-            total = len(respuestas_cat)
-            if total > 0:
-                puntaje = 1 + int((correctas / total) * 4)
-                puntajes_categoria[categoria] = min(5, max(1, puntaje))
+                    }
+            
+            for idx, pregunta in enumerate(preguntas_brecha['practico']):
+                respuesta_key = f'brecha_practico_{idx}'
+                respuesta = request.POST.get(respuesta_key)
+                if respuesta:
+                    respuestas_brecha_practico[idx] = respuesta
+            
+            # Calcular puntajes por categoría
+            puntajes_categoria = {}
+            for categoria, respuestas_cat in respuestas.items():
+                correctas = sum(1 for r in respuestas_cat if r['respuesta'] == r['correcta'])
+                total = len(respuestas_cat)
+                if total > 0:
+                    puntaje = 1 + int((correctas / total) * 4)
+                    puntajes_categoria[categoria] = min(5, max(1, puntaje))
+                else:
+                    puntajes_categoria[categoria] = 1
+            
+            # Calcular brecha teórico-práctica
+            correctas_teorico = sum(1 for idx, r in respuestas_brecha_teorico.items() 
+                                   if r['respuesta'] == r['correcta'])
+            total_teorico = len(respuestas_brecha_teorico)
+            conocimiento_teorico = 1 + int((correctas_teorico / total_teorico) * 4) if total_teorico > 0 else 1
+            conocimiento_teorico = min(5, max(1, conocimiento_teorico))
+            
+            # Para práctico: contar respuestas correctas y convertir a escala 1-5
+            correctas_practico = 0
+            total_practico = len(respuestas_brecha_practico)
+            if total_practico > 0:
+                for idx, respuesta in respuestas_brecha_practico.items():
+                    if idx < len(preguntas_brecha['practico']):
+                        pregunta_practico = preguntas_brecha['practico'][idx]
+                        respuesta_correcta = pregunta_practico.get('respuesta_correcta', '')
+                        if respuesta == respuesta_correcta:
+                            correctas_practico += 1
+                aplicacion_practica = 1 + int((correctas_practico / total_practico) * 4) if total_practico > 0 else 1
             else:
-                puntajes_categoria[categoria] = 1
-        
-        # Calcular brecha teórico-práctica
-        correctas_teorico = sum(1 for idx, r in respuestas_brecha_teorico.items() 
-                               if r['respuesta'] == r['correcta'])
-        total_teorico = len(respuestas_brecha_teorico)
-        conocimiento_teorico = 1 + int((correctas_teorico / total_teorico) * 4) if total_teorico > 0 else 1
-        conocimiento_teorico = min(5, max(1, conocimiento_teorico))
-        
-        # Para práctico: contar respuestas correctas y convertir a escala 1-5
-        correctas_practico = 0
-        total_practico = len(respuestas_brecha_practico)
-        if total_practico > 0:
-            for idx, respuesta in respuestas_brecha_practico.items():
-                if idx < len(preguntas_brecha['practico']):
-                    pregunta_practico = preguntas_brecha['practico'][idx]
-                    respuesta_correcta = pregunta_practico.get('respuesta_correcta', '')
-                    if respuesta == respuesta_correcta:
-                        correctas_practico += 1
-            aplicacion_practica = 1 + int((correctas_practico / total_practico) * 4) if total_practico > 0 else 1
+                aplicacion_practica = 3
+            aplicacion_practica = min(5, max(1, aplicacion_practica))
+            
+            # Obtener datos adicionales del formulario
+            tiene_tarjetas = request.POST.get('tiene_tarjetas_credito') == 'on'
+            cantidad_tarjetas = int(request.POST.get('cantidad_tarjetas', 0) or 0)
+            monto_deuda = float(request.POST.get('monto_deuda_actual', 0) or 0)
+            frecuencia_pago_minimo = int(request.POST.get('frecuencia_pago_minimo', 0) or 0)
+            experiencia_fraude = request.POST.get('experiencia_fraude') == 'on'
+            
+            # Calcular número de evaluación
+            ultima_evaluacion = FinancialCompetencyAssessment.objects.filter(
+                user=user
+            ).order_by('-numero_evaluacion').first()
+            numero_evaluacion = (ultima_evaluacion.numero_evaluacion + 1) if ultima_evaluacion else 1
+            
+            # Crear nueva evaluación
+            assessment = FinancialCompetencyAssessment.objects.create(
+                user=user,
+                numero_evaluacion=numero_evaluacion,
+                conocimiento_presupuesto=puntajes_categoria.get('presupuesto', 1),
+                conocimiento_ahorro=puntajes_categoria.get('ahorro', 1),
+                conocimiento_credito=puntajes_categoria.get('credito', 1),
+                conocimiento_inversiones=puntajes_categoria.get('inversiones', 1),
+                conocimiento_fraudes=puntajes_categoria.get('fraudes', 1),
+                tiene_tarjetas_credito=tiene_tarjetas,
+                cantidad_tarjetas=cantidad_tarjetas,
+                monto_deuda_actual=monto_deuda,
+                frecuencia_pago_minimo=frecuencia_pago_minimo,
+                experiencia_fraude=experiencia_fraude,
+                conocimiento_teorico=conocimiento_teorico,
+                aplicacion_practica=aplicacion_practica
+            )
+            
+            # Actualizar métricas automáticamente (se hace en el save() del modelo)
+            # Pero también lo hacemos aquí para asegurar que se actualice
+            metrics, _ = UserMetrics.objects.get_or_create(user=user)
+            metrics.actualizar_mejora()  # Esto recalcula todo automáticamente
+            metrics.save()
+            
+            # Marcar como respondida solo si nadie la calificó mientras tanto
+            if not EvaluacionServida.objects.filter(
+                id=evaluacion_servida.id,
+                fecha_respuesta__isnull=True
+            ).update(fecha_respuesta=timezone.now()):
+                transaction.set_rollback(True)
+                messages.error(request, 'Esta evaluación ya fue enviada o expiró. Te mostramos una nueva.')
+                return redirect('evaluacion_view')
+        
+        request.session.pop('evaluacion_servida_id', None)
+        messages.success(request, f'Evaluación {numero_evaluacion} completada exitosamente. Puntaje: {assessment.puntaje_total} puntos.')
+        return redirect('progreso_individual')
+    
+    EvaluacionServida.objects.filter(
+        user=user,
+        fecha_respuesta__isnull=True,
+        fecha_creacion__lt=timezone.now() - timedelta(hours=getattr(settings, 'EVALUACION_SERVIDA_HORAS', 24))
+    ).delete()
+    
+    # Si el usuario tiene una evaluación sin enviar (p. ej. recargó la página),
+    # mostrarle la misma en vez de gastar otro set del pool
+    evaluacion_servida = None
+    if not request.GET.get('regenerar') == '1':
+        evaluacion_servida = EvaluacionServida.objects.filter(user=user, fecha_respuesta__isnull=True).first()
+    
+    if not evaluacion_servida:
+        # Tomar del pool compartido un set que el usuario no haya visto
+        evaluacion_pregenerada = None
+        if not request.GET.get('regenerar') == '1':
+            evaluacion_pregenerada = pool.tomar_evaluacion(user)
+        
+        if evaluacion_pregenerada:
+            preguntas_evaluacion, preguntas_brecha = completar_secciones_vacias(
+                evaluacion_pregenerada.preguntas_evaluacion,
+                evaluacion_pregenerada.preguntas_brecha
+            )
         else:
-            aplicacion_practica = 3
-        aplicacion_practica = min(5, max(1, aplicacion_practica))
-        
-        # Obtener datos adicionales del formulario
-        tiene_tarjetas = request.POST.get('tiene_tarjetas_credito') == 'on'
-        cantidad_tarjetas = int(request.POST.get('cantidad_tarjetas', 0) or 0)
-        monto_deuda = float(request.POST.get('monto_deuda_actual', 0) or 0)
-        frecuencia_pago_minimo = int(request.POST.get('frecuencia_pago_minimo', 0) or 0)
-        experiencia_fraude = request.POST.get('experiencia_fraude') == 'on'
-        
-        # Calcular número de evaluación
-        ultima_evaluacion = FinancialCompetencyAssessment.objects.filter(
-            user=user
-        ).order_by('-numero_evaluacion').first()
-        numero_evaluacion = (ultima_evaluacion.numero_evaluacion + 1) if ultima_evaluacion else 1
-        
-        # Crear nueva evaluación
-        assessment = FinancialCompetencyAssessment.objects.create(
+            # Generar en tiempo real si el usuario ya vio todo el pool o se solicita regenerar,
+            # con un límite de tiempo total (lo que no llegue sale del banco local)
+            preguntas_evaluacion, preguntas_brecha = generar_evaluacion(
+                tiempo_limite=getattr(settings, 'EVALUACION_TIEMPO_LIMITE', 25)
+            )
+        
+        # Fijar el set mostrado para calificar el POST contra exactamente estas preguntas
+        evaluacion_servida = EvaluacionServida.objects.create(
             user=user,
-            numero_evaluacion=numero_evaluacion,
-            conocimiento_presupuesto=puntajes_categoria.get('presupuesto', 1),
-            conocimiento_ahorro=puntajes_categoria.get('ahorro', 1),
-            conocimiento_credito=puntajes_categoria.get('credito', 1),
-            conocimiento_inversiones=puntajes_categoria.get('inversiones', 1),
-            conocimiento_fraudes=puntajes_categoria.get('fraudes', 1),
-            tiene_tarjetas_credito=tiene_tarjetas,
-            cantidad_tarjetas=cantidad_tarjetas,
-            monto_deuda_actual=monto_deuda,
-            frecuencia_pago_minimo=frecuencia_pago_minimo,
-            experiencia_fraude=experiencia_fraude,
-            conocimiento_teorico=conocimiento_teorico,
-            aplicacion_practica=aplicacion_practica
+            preguntas_evaluacion=preguntas_evaluacion,
+            preguntas_brecha=preguntas_brecha
         )
-        
-        # Actualizar métricas automáticamente (se hace en el save() del modelo)
-        # Pero también lo hacemos aquí para asegurar que se actualice
-        metrics, _ = UserMetrics.objects.get_or_create(user=user)
-        metrics.actualizar_mejora()  # Esto recalcula todo automáticamente
-        metrics.save()
-        
-        # Generar siguiente evaluación en segundo plano (ya se generó antes, pero por si acaso)
-        generar_evaluacion_completa_en_segundo_plano(user)
-        
-        messages.success(request, f'Evaluación {numero_evaluacion} completada exitosamente. Puntaje: {assessment.puntaje_total} puntos.')
-        return redirect('progreso_individual')
+    request.session['evaluacion_servida_id'] = str(evaluacion_servida.id)
     
     return render(request, 'research/evaluacion.html', {
-        'preguntas_evaluacion': preguntas_evaluacion,
-        'preguntas_brecha': preguntas_brecha,
+        'preguntas_evaluacion': evaluacion_servida.preguntas_evaluacion,
+        'preguntas_brecha': evaluacion_servida.preguntas_brecha,
+        'evaluacion_servida_id': evaluacion_servida.id,
         'user': user,
     })
 
@@ -452,10 +469,23 @@ def login_view(request):
         if form.is_valid():
             email = form.cleaned_data['email']
             password = form.cleaned_data['password']
+            ip = acceso.ip_cliente(request)
+            
+            # Los intentos rechazados no llegan a la base ni al hash de la contraseña
+            motivo = acceso.rechazo(email, ip)
+            if motivo == 'ip':
+                form.add_error(None, 'Demasiados intentos fallidos desde tu conexión. Intenta de nuevo en unos minutos.')
+                return render(request, 'login.html', {'form': form})
+            if motivo == 'email':
+                form.add_error(None, 'Demasiados intentos fallidos con este correo. Intenta de nuevo más tarde.')
+                return render(request, 'login.html', {'form': form})
             
             try:
                 user = UserProfile.objects.get(email=email)
-                if check_password(password, user.password):
+                if user.is_blocked:
+                    form.add_error(None, 'Tu cuenta está bloqueada por intentos fallidos. Restablece tu contraseña o contacta a un administrador.')
+                elif check_password(password, user.password):
+                    acceso.registrar_exito(email, user)
                     request.session['user_id'] = user.id
                     
                     # Las métricas se actualizan automáticamente en el decorator @session_login_required
@@ -463,8 +493,13 @@ def login_view(request):
                     
                     return redirect('dashboard')
                 else:
-                    form.add_error(None, 'Contraseña incorrecta')
+                    if acceso.registrar_fallo(email, ip, user):
+                        acceso.avisar_bloqueo(user)
+                        form.add_error(None, 'Tu cuenta está bloqueada por intentos fallidos. Restablece tu contraseña o contacta a un administrador.')
+                    else:
+                        form.add_error(None, 'Contraseña incorrecta')
             except UserProfile.DoesNotExist:
+                acceso.registrar_fallo(email, ip)
                 form.add_error('email', 'No existe un usuario con este correo electrónico')
     else:
         form = LoginForm()
@@ -554,6 +589,8 @@ def resetear_contrasena(request, uidb64, token):
             if nueva_contrasena and nueva_contrasena == confirmar_contrasena:
                 user.password = make_password(nueva_contrasena)
                 user.save()
+                # Quien restablece la contraseña demuestra que el correo es suyo
+                acceso.desbloquear(user)
                 mensaje = "✅ Contraseña restablecida correctamente. Puedes iniciar sesión."
                 return redirect("login")
             else:
@@ -569,7 +606,7 @@ def resetear_contrasena(request, uidb64, token):
 
 @session_login_required
 def dashboard_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     hoy = timezone.now()
     inicio_mes = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     if hoy.month == 12:
@@ -596,7 +633,7 @@ def dashboard_view(request):
 
 @session_login_required
 def profile_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     cards = PaymentMethod.objects.filter(user=user)
     return render(request, 'profile.html', {
         'user': user,
@@ -607,7 +644,7 @@ def profile_view(request):
 
 @session_login_required
 def upload_profile_photo(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     
     if request.method == 'POST' and request.FILES.get('photo'):
         if user.photo:
@@ -624,7 +661,7 @@ def upload_profile_photo(request):
 
 @session_login_required
 def update_limit_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     
     if request.method == 'POST':
         form = UpdateLimitForm(request.POST)
@@ -642,7 +679,7 @@ def update_limit_view(request):
 
 @session_login_required
 def add_card_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     if request.method == 'POST':
         form = PaymentMethodForm(request.POST)
         if form.is_valid():
@@ -657,7 +694,7 @@ def add_card_view(request):
 
 @session_login_required
 def delete_card(request, card_id):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     card = get_object_or_404(PaymentMethod, id=card_id, user=user)
     card.delete()
     return redirect('profile')
@@ -669,7 +706,7 @@ def delete_card(request, card_id):
 
 @session_login_required
 def register_expense_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     
     if request.method == 'POST':
         form = ExpenseForm(request.POST, user=user)
@@ -691,7 +728,7 @@ def register_expense_view(request):
 
 @session_login_required
 def reports_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     
     gastos_categoria = Expense.objects.filter(user=user).values('category').annotate(total=Sum('amount')).order_by('-total')
     
@@ -711,7 +748,7 @@ def reports_view(request):
 
 @session_login_required
 def export_pdf_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     mes_actual = date.today().strftime('%B %Y')
     fecha_emision = date.today().strftime('%B %d, %Y')
     
@@ -746,92 +783,62 @@ def export_pdf_view(request):
 
 @session_login_required
 def recommendations_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     recomendaciones = RecommendationVideo.objects.all()
     return render(request, 'recommendations.html', {'videos': recomendaciones})
 
 
 def obtener_modelo_gemini():
-    """Obtiene un modelo de Gemini funcional, probando diferentes opciones"""
-    try:
-        import google.generativeai as genai
-        
-        api_key = getattr(settings, 'GEMINI_API_KEY', None)
-        if not api_key:
-            return None
-        
-        genai.configure(api_key=api_key)
-        
-        # Lista de modelos a probar en orden de preferencia
-        modelos_a_probar = [
-            'gemini-2.0-flash',
-            'gemini-2.0-flash-exp',
-            'gemini-1.5-flash',
-            'gemini-1.5-pro',
-            'gemini-pro'
-        ]
-        
-        for modelo_nombre in modelos_a_probar:
-            try:
-                modelo = genai.GenerativeModel(modelo_nombre)
-                # Probar que el modelo funciona haciendo una prueba simple
-                modelo.generate_content("test")
-                return modelo
-            except Exception as e:
-                print(f"Modelo {modelo_nombre} no disponible: {str(e)}")
-                continue
-        
-        return None
-    except Exception as e:
-        print(f"Error configurando Gemini: {str(e)}")
+    """
+    Obtiene el modelo de Gemini compartido del proceso (se resuelve una sola vez).
+    Devuelve None mientras el circuito está abierto para que las vistas usen
+    directamente sus alternativas locales.
+    """
+    if gemini.circuito_abierto():
         return None
+    return gemini.obtener_modelo()
+
+
+MENSAJE_CHATBOT_NO_DISPONIBLE = "El chatbot no está disponible en este momento. Por favor, verifica la configuración de GEMINI_API_KEY en settings."
+MENSAJE_CHATBOT_ERROR = "Error al conectarse al asistente. Intenta más tarde."
+MENSAJE_CHATBOT_SATURADO = "El asistente está recibiendo demasiadas consultas en este momento. Intenta de nuevo en unos minutos."
+
+
+def _mensaje_chatbot_no_disponible():
+    if gemini.circuito_abierto():
+        return MENSAJE_CHATBOT_SATURADO
+    return MENSAJE_CHATBOT_NO_DISPONIBLE
 
 
 @csrf_exempt
 @session_login_required
 def chatbot_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
-    
-    if 'chat_historial' not in request.session:
-        request.session['chat_historial'] = []
+    user = request.profile
     
-    historial = request.session['chat_historial']
+    contexto = ContextoChatUsuario(user.id, request.session)
+    historial = contexto.historial
     
     if request.method == 'POST':
         mensaje = request.POST.get('mensaje')
         if mensaje:
-            historial.append({"pregunta": mensaje})
+            conversacion = contexto.conversacion(mensaje)
             
             modelo = obtener_modelo_gemini()
             
             if not modelo:
-                respuesta = "El chatbot no está disponible en este momento. Por favor, verifica la configuración de GEMINI_API_KEY en settings."
+                respuesta = _mensaje_chatbot_no_disponible()
             else:
                 try:
-                    # Construir el contexto de la conversación
-                    contexto = "Eres un asistente financiero útil especializado en finanzas personales para jóvenes peruanos. Responde de manera clara, concisa y adaptada al contexto peruano (soles, sistema financiero peruano)."
-                    
-                    # Construir el historial de conversación
-                    conversacion = contexto + "\n\n"
-                    for h in historial:
-                        if 'pregunta' in h:
-                            conversacion += f"Usuario: {h['pregunta']}\n"
-                        if 'respuesta' in h:
-                            conversacion += f"Asistente: {h['respuesta']}\n"
-                    
-                    # Agregar la nueva pregunta
-                    conversacion += f"Usuario: {mensaje}\nAsistente:"
-                    
                     # Generar respuesta
-                    response = modelo.generate_content(conversacion)
+                    response = gemini.generar_contenido(conversacion, familia='chatbot')
                     respuesta = response.text.strip()
                     
                 except Exception as e:
                     print(f"Error generando respuesta con Gemini: {str(e)}")
-                    respuesta = "Error al conectarse al asistente. Intenta más tarde."
+                    respuesta = MENSAJE_CHATBOT_ERROR
             
-            historial[-1]["respuesta"] = respuesta
-            request.session['chat_historial'] = historial
+            contexto.agregar_turno(mensaje, respuesta)
+            historial = contexto.historial
     
     return render(request, 'chatbot.html', {
         'historial': historial,
@@ -839,13 +846,64 @@ def chatbot_view(request):
     })
 
 
+def _evento_sse(datos, nombre=None):
+    """Formatea un evento de Server-Sent Events con datos JSON"""
+    linea_evento = f"event: {nombre}\n" if nombre else ""
+    return f"{linea_evento}data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+@session_login_required
+@require_POST
+def chatbot_stream_view(request):
+    """
+    Responde al chatbot por Server-Sent Events: cada fragmento de Gemini se
+    envía apenas llega (evento sin nombre con {"texto": ...}) y al final se
+    envía el evento "fin" con la respuesta completa ya convertida a HTML.
+    """
+    mensaje = request.POST.get('mensaje', '').strip()
+    if not mensaje:
+        return JsonResponse({'error': 'Escribe un mensaje.'}, status=400)
+    
+    contexto = ContextoChatUsuario(request.profile.id, request.session)
+    conversacion = contexto.conversacion(mensaje)
+    
+    def eventos():
+        partes = []
+        try:
+            if not obtener_modelo_gemini():
+                partes.append(_mensaje_chatbot_no_disponible())
+                yield _evento_sse({'texto': partes[0]})
+            else:
+                try:
+                    for fragmento in gemini.generar_contenido_stream(conversacion, familia='chatbot'):
+                        partes.append(fragmento)
+                        yield _evento_sse({'texto': fragmento})
+                except Exception as e:
+                    print(f"Error generando respuesta con Gemini: {str(e)}")
+                    if not partes:
+                        partes.append(MENSAJE_CHATBOT_ERROR)
+                        yield _evento_sse({'texto': MENSAJE_CHATBOT_ERROR})
+        finally:
+            # El historial se guarda aquí (fuera de la sesión), incluso si el
+            # cliente cortó el stream
+            respuesta = ''.join(partes).strip() or MENSAJE_CHATBOT_ERROR
+            contexto.agregar_turno(mensaje, respuesta)
+        
+        yield _evento_sse({'respuesta': respuesta, 'html': markdown_filter(respuesta)}, 'fin')
+    
+    response = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Evitar que un proxy (nginx) acumule la respuesta
+    return response
+
+
 # ============================================
 # INVERSIONES
 # ============================================
 
 @session_login_required
 def investment_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     mensaje = ""
     
     if request.method == 'POST':
@@ -856,12 +914,8 @@ def investment_view(request):
             
             api_key = getattr(settings, 'TWELVE_API_KEY', None)
             if api_key:
-                try:
-                    url = f"https://api.twelvedata.com/price?symbol={company_symbol}&apikey={api_key}"
-                    response = requests.get(url).json()
-                    price = float(response['price']) if 'price' in response else None
-                except Exception as e:
-                    price = None
+                # Precio compartido con la tabla de inversiones (caché de precios.py)
+                price = precios.obtener_precio(company_symbol)
             else:
                 price = None
             
@@ -879,11 +933,15 @@ def investment_view(request):
     else:
         form = InvestmentForm()
     
-    inversiones = Investment.objects.filter(user=user)
+    # Todos los precios de la tabla en una sola consulta agrupada
+    valuacion = portafolio.valorar_usuario(user)
     
     return render(request, 'investments.html', {
         'form': form,
-        'inversiones': inversiones,
+        'inversiones': valuacion['inversiones'],
+        'portafolio': valuacion,
+        'historial': portafolio.historial_grafico(valuacion['inversiones']),
+        'analitica': analitica.analizar_usuario(user, valuacion['inversiones']) if valuacion['inversiones'] else None,
         'mensaje': mensaje
     })
 
@@ -891,7 +949,7 @@ def investment_view(request):
 @require_POST
 @session_login_required
 def delete_investment_view(request, id):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     try:
         inversion = Investment.objects.get(id=id, user=user)
     except Investment.DoesNotExist:
@@ -949,7 +1007,7 @@ def actualizar_retos_usuario(user):
 
 @session_login_required
 def retos_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     retos_disponibles = Challenge.objects.filter(is_active=True).exclude(type='juego')
     retos_usuario = UserChallenge.objects.filter(user=user)
     
@@ -1031,7 +1089,7 @@ def retos_view(request):
 
 @session_login_required
 def historial_retos_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     
     historial = UserChallenge.objects.filter(
         user=user,
@@ -1069,7 +1127,7 @@ def historial_retos_view(request):
 
 @session_login_required
 def juegos_seleccion_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     
     # Obtener puntajes de trivia
     puntaje_trivia = user.trivia_puntaje or 0
@@ -1090,12 +1148,9 @@ def juegos_seleccion_view(request):
 @csrf_exempt
 @session_login_required
 def trivia_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     
-    if 'puntos_trivia' not in request.session:
-        request.session['puntos_trivia'] = 0
-        request.session['fallos_trivia'] = 0
-        request.session['preguntas_respondidas'] = []
+    partida = PartidaTrivia.del_request(request)
     
     mensaje = ""
     resultado_audio = ""
@@ -1104,7 +1159,7 @@ def trivia_view(request):
     
     if request.method == 'POST':
         seleccion = request.POST.get('opcion_seleccionada', "").strip().lower()
-        pregunta_id = request.session.get('pregunta_actual_id')
+        pregunta_id = partida.pregunta_actual_id
         
         try:
             pregunta = PreguntaTrivia.objects.get(id=pregunta_id)
@@ -1112,19 +1167,18 @@ def trivia_view(request):
             return redirect('trivia')
         
         if seleccion == pregunta.respuesta_correcta.strip().lower():
-            request.session['puntos_trivia'] += 100
+            partida.puntos += 100
             mensaje = "Correcto! Has ganado 100 puntos."
             resultado_audio = "correct"
         else:
-            request.session['fallos_trivia'] += 1
+            partida.fallos += 1
             mensaje = ""
             resultado_audio = "incorrect"
         
-        if pregunta_id not in request.session['preguntas_respondidas']:
-            request.session['preguntas_respondidas'].append(pregunta_id)
+        partida.marcar_respondida(pregunta_id)
         
-        if request.session['fallos_trivia'] >= 3:
-            puntos_finales = request.session['puntos_trivia']
+        if partida.fallos >= 3:
+            puntos_finales = partida.puntos
             if puntos_finales > user.trivia_puntaje:
                 user.trivia_puntaje = puntos_finales
                 user.save()
@@ -1135,9 +1189,8 @@ def trivia_view(request):
                 puntaje.puntaje_total = puntos_finales
             puntaje.save()
             
-            request.session['puntos_trivia'] = 0
-            request.session['fallos_trivia'] = 0
-            request.session['preguntas_respondidas'] = []
+            partida.terminar()
+            partida.guardar()
             
             return render(request, 'trivia_resultado.html', {
                 'puntos': puntos_finales,
@@ -1145,14 +1198,15 @@ def trivia_view(request):
                 'resultado_audio': resultado_audio
             })
     
-    preguntas_disponibles = PreguntaTrivia.objects.exclude(id__in=request.session['preguntas_respondidas'])
+    preguntas_disponibles = PreguntaTrivia.objects.exclude(id__in=partida.respondidas)
     if preguntas_disponibles.exists():
         pregunta_actual = random.choice(list(preguntas_disponibles))
-        request.session['pregunta_actual_id'] = pregunta_actual.id
+        partida.pregunta_actual_id = pregunta_actual.id
+        partida.guardar()
         opciones = pregunta_actual.opciones
     else:
         mensaje = "🎉 Has respondido todas las preguntas."
-        puntos_finales = request.session['puntos_trivia']
+        puntos_finales = partida.puntos
         if puntos_finales > user.trivia_puntaje:
             user.trivia_puntaje = puntos_finales
             user.save()
@@ -1162,9 +1216,8 @@ def trivia_view(request):
             puntaje.puntaje_total = puntos_finales
         puntaje.save()
         
-        request.session['puntos_trivia'] = 0
-        request.session['fallos_trivia'] = 0
-        request.session['preguntas_respondidas'] = []
+        partida.terminar()
+        partida.guardar()
         
         return render(request, 'trivia_resultado.html', {
             'puntos': puntos_finales,
@@ -1175,8 +1228,8 @@ def trivia_view(request):
     return render(request, 'trivia.html', {
         'pregunta': pregunta_actual,
         'opciones': opciones,
-        'puntos': request.session.get('puntos_trivia', 0) or 0,
-        'fallos': request.session.get('fallos_trivia', 0) or 0,
+        'puntos': partida.puntos,
+        'fallos': partida.fallos,
         'mensaje': mensaje,
         'resultado_audio': resultado_audio
     })
@@ -1198,28 +1251,17 @@ def ranking_trivia_view(request):
     })
 
 
-def generar_frase_completar_ia():
-    """Genera una oración/definición económica con IA y extrae una palabra clave"""
+DIFICULTAD_FRASES = {
+    1: "FÁCIL: un concepto básico y cotidiano (ahorro, presupuesto, gasto) en palabras simples",
+    2: "MEDIA: un concepto financiero común que requiere algo de conocimiento (TEA, diversificación, inflación)",
+    3: "DIFÍCIL: un concepto técnico o especializado (TCEA, derivados, riesgo de liquidez, encaje bancario)",
+}
+
+
+def generar_frase_completar_ia(nivel=0):
+    """Genera una oración/definición económica con IA (del nivel indicado, si hay) y extrae una palabra clave"""
     try:
-        import google.generativeai as genai
-        
-        api_key = getattr(settings, 'GEMINI_API_KEY', None)
-        if not api_key:
-            return None
-        
-        genai.configure(api_key=api_key)
-        
-        # Intentar con diferentes modelos
-        modelos_a_probar = ['gemini-2.0-flash', 'gemini-2.0-flash-exp', 'gemini-1.5-flash', 'gemini-1.5-pro']
-        modelo = None
-        
-        for modelo_nombre in modelos_a_probar:
-            try:
-                modelo = genai.GenerativeModel(modelo_nombre)
-                break
-            except:
-                continue
-        
+        modelo = obtener_modelo_gemini()
         if not modelo:
             return None
         
@@ -1275,18 +1317,10 @@ Otro ejemplo:
 }
 
 Responde SOLO con el JSON, sin texto adicional."""
+        if nivel in DIFICULTAD_FRASES:
+            prompt += f"\n\nNivel de dificultad de la oración y del término clave: {DIFICULTAD_FRASES[nivel]}."
         
-        response = modelo.generate_content(prompt)
-        texto_respuesta = response.text.strip()
-        
-        # Limpiar el texto si tiene markdown
-        if texto_respuesta.startswith('```'):
-            texto_respuesta = texto_respuesta.split('```')[1]
-            if texto_respuesta.startswith('json'):
-                texto_respuesta = texto_respuesta[4:]
-        texto_respuesta = texto_respuesta.strip()
-        
-        datos = json.loads(texto_respuesta)
+        datos = gemini.generar_json(prompt, familia='frase')
         
         # Limpiar formato markdown de la frase completa
         frase_completa = datos.get('frase_completa', '')
@@ -1312,7 +1346,7 @@ Responde SOLO con el JSON, sin texto adicional."""
 
 @session_login_required
 def completar_frases_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     
     if 'puntos_completar_frases' not in request.session:
         request.session['puntos_completar_frases'] = 0
@@ -1334,7 +1368,7 @@ def completar_frases_view(request):
         if "______________________" in frase_completa:
             frase_completa = frase_completa.replace("______________________", palabra_clave)
         
-        # Verificar respuesta con IA
+        # Verificar respuesta (local y, solo si es dudosa, con IA)
         resultado = verificar_respuesta_ia(palabra_clave, respuesta_usuario)
         
         puntos = 0
@@ -1373,9 +1407,6 @@ def completar_frases_view(request):
         if 'palabra_clave_actual' in request.session:
             del request.session['palabra_clave_actual']
         
-        # Generar siguiente frase en segundo plano
-        generar_frase_completar_en_segundo_plano(user)
-        
         return render(request, 'completar_frases.html', {
             'respuesta_usuario': respuesta_usuario,
             'resultado': resultado,
@@ -1386,28 +1417,26 @@ def completar_frases_view(request):
             'mostrar_resultado': True
         })
     
-    # Intentar obtener frase pre-generada
-    from myapp.models import PregeneradaFraseCompletar
-    frase_pregenerada = PregeneradaFraseCompletar.objects.filter(
-        user=user,
-        usada=False
-    ).order_by('fecha_creacion').first()
-    
-    if frase_pregenerada:
-        # Usar frase pre-generada
-        frase_completa = frase_pregenerada.frase_completa
-        palabra_clave = frase_pregenerada.palabra_clave
-        
-        # Marcar como usada
-        frase_pregenerada.usada = True
-        frase_pregenerada.fecha_uso = timezone.now()
-        frase_pregenerada.save()
-        
-        # Generar siguiente frase en segundo plano
-        generar_frase_completar_en_segundo_plano(user)
+    # Nivel de dificultad elegido (0 = todos), se recuerda en la sesión
+    nivel = request.GET.get('nivel', request.session.get('nivel_completar_frases', 0))
+    try:
+        nivel = int(nivel)
+    except (TypeError, ValueError):
+        nivel = 0
+    if nivel not in banco_frases.NIVELES:
+        nivel = 0
+    request.session['nivel_completar_frases'] = nivel
+    
+    # Siguiente frase del banco curado según el cursor del usuario (sin esperar a la IA)
+    frase = banco_frases.siguiente_frase(user, nivel)
+    
+    if frase:
+        frase_completa = frase.frase_completa
+        palabra_clave = frase.palabra_clave
+        frase_con_espacio = frase.frase_con_espacio
     else:
-        # Generar en tiempo real si no hay pre-generada
-        frase_data = generar_frase_completar_ia()
+        # Banco vacío para este nivel: generar en tiempo real y guardarla en el banco
+        frase_data = generar_frase_completar_ia(nivel=nivel)
         
         if not frase_data:
             messages.error(request, 'Error al generar frase. Intenta más tarde.')
@@ -1415,56 +1444,46 @@ def completar_frases_view(request):
         
         frase_completa = frase_data['frase_completa']
         palabra_clave = frase_data['palabra_clave']
+        frase_con_espacio = banco_frases.enmascarar(frase_completa, palabra_clave)
+        if not frase_con_espacio:
+            messages.error(request, 'Error al generar frase. Intenta más tarde.')
+            return redirect('juegos')
         
-        # Asegurarse de que la frase completa esté limpia (sin markdown)
-        # Ya viene limpia de generar_frase_completar_ia, pero por si acaso
-        frase_completa = frase_completa.replace('**', '').replace('*', '').replace('__', '').replace('_', '')
-        frase_completa = ' '.join(frase_completa.split())
-        
-        # Generar siguiente frase en segundo plano
-        generar_frase_completar_en_segundo_plano(user)
+        try:
+            banco_frases.agregar_frase(
+                frase_completa, palabra_clave,
+                nivel_dificultad=nivel or banco_frases.NIVEL_POR_DEFECTO
+            )
+        except Exception as e:
+            print(f"Error agregando frase al banco: {str(e)}")
     
     # Guardar en sesión la versión limpia (sin guiones, con la palabra completa)
     request.session['frase_completa_actual'] = frase_completa
     request.session['palabra_clave_actual'] = palabra_clave
     
-    # Crear frase con espacio en blanco para mostrar (usar la versión limpia)
-    frase_con_espacio = frase_completa.replace(palabra_clave, "______________________")
-    
     return render(request, 'completar_frases.html', {
         'frase_con_espacio': frase_con_espacio,
         'puntos_totales': request.session.get('puntos_completar_frases', 0),
+        'nivel': nivel,
+        'niveles': banco_frases.NIVELES.items(),
         'mostrar_resultado': False
     })
 
 
 def verificar_respuesta_ia(palabra_correcta, respuesta_usuario):
-    """Verifica si la respuesta del usuario es correcta usando IA"""
+    """Verifica si la respuesta del usuario es correcta (localmente; la IA solo resuelve los casos dudosos)"""
+    resultado = verificador.verificar_local(palabra_correcta, respuesta_usuario)
+    if resultado is not None:
+        return resultado
+    
     try:
-        import google.generativeai as genai
-        api_key = getattr(settings, 'GEMINI_API_KEY', None)
-        if not api_key:
-            return verificar_respuesta_simple(palabra_correcta, respuesta_usuario)
-        
-        genai.configure(api_key=api_key)
-        
-        # Intentar con diferentes modelos (sistema de fallback)
-        modelos_a_probar = ['gemini-2.0-flash', 'gemini-2.0-flash-exp', 'gemini-1.5-flash', 'gemini-1.5-pro', 'gemini-pro']
-        modelo = None
-        
-        for modelo_nombre in modelos_a_probar:
-            try:
-                modelo = genai.GenerativeModel(modelo_nombre)
-                # Probar que el modelo funciona
-                modelo.generate_content("test")
-                break
-            except Exception as e:
-                print(f"Modelo {modelo_nombre} no disponible: {str(e)}")
-                continue
-        
+        modelo = obtener_modelo_gemini()
         if not modelo:
             return verificar_respuesta_simple(palabra_correcta, respuesta_usuario)
         
+        # Normalizar espacios para que respuestas equivalentes compartan la entrada de caché
+        respuesta_usuario = ' '.join(respuesta_usuario.split())
+        
         prompt = f"""Evalúa si la respuesta del usuario es correcta para completar una oración de economía.
 
 Palabra correcta esperada: "{palabra_correcta}"
@@ -1492,16 +1511,7 @@ Ejemplos:
 - Palabra correcta: "fondo de emergencia", Usuario: "ahorro" → es_similar: true (relacionado)
 - Palabra correcta: "TEA", Usuario: "IGV" → es_correcta: false, es_similar: false (diferente concepto)"""
         
-        response = modelo.generate_content(prompt)
-        texto = response.text.strip()
-        
-        if texto.startswith('```'):
-            texto = texto.split('```')[1]
-            if texto.startswith('json'):
-                texto = texto[4:]
-        texto = texto.strip()
-        
-        resultado = json.loads(texto)
+        resultado = gemini.generar_json(prompt, familia='verificacion')
         return {
             'es_correcta': resultado.get('es_correcta', False),
             'es_similar': resultado.get('es_similar', False),
@@ -1513,16 +1523,8 @@ Ejemplos:
 
 
 def verificar_respuesta_simple(palabra_correcta, respuesta_usuario):
-    """Verificación simple sin IA"""
-    palabra_lower = palabra_correcta.lower().strip()
-    respuesta_lower = respuesta_usuario.lower().strip()
-    
-    if palabra_lower == respuesta_lower:
-        return {'es_correcta': True, 'es_similar': False, 'explicacion': 'Respuesta correcta'}
-    elif palabra_lower in respuesta_lower or respuesta_lower in palabra_lower:
-        return {'es_correcta': False, 'es_similar': True, 'explicacion': 'Respuesta parcialmente correcta'}
-    else:
-        return {'es_correcta': False, 'es_similar': False, 'explicacion': 'Respuesta incorrecta'}
+    """Verificación sin IA: decide también los casos dudosos con el verificador local"""
+    return verificador.verificar_local(palabra_correcta, respuesta_usuario, decidir=True)
 
 
 @session_login_required
@@ -1559,7 +1561,7 @@ def evaluacion_periodica_view(request):
 
 @session_login_required
 def progreso_individual_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     metrics, _ = UserMetrics.objects.get_or_create(user=user)
     
     # Obtener historial de evaluaciones
@@ -1618,7 +1620,7 @@ def progreso_individual_view(request):
 
 @session_login_required
 def recomendaciones_personalizadas_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     recomendaciones = PersonalizedRecommendation.objects.filter(user=user).order_by('-fecha_recomendacion')
     
     return render(request, 'research/recomendaciones_personalizadas.html', {
@@ -1629,7 +1631,7 @@ def recomendaciones_personalizadas_view(request):
 
 @session_login_required
 def marcar_recomendacion_vista(request, recomendacion_id):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     recomendacion = get_object_or_404(PersonalizedRecommendation, id=recomendacion_id, user=user)
     recomendacion.vista = True
     recomendacion.save()
@@ -1638,7 +1640,7 @@ def marcar_recomendacion_vista(request, recomendacion_id):
 
 @session_login_required
 def alertas_riesgo_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     alertas = CreditRiskAlert.objects.filter(user=user).order_by('-fecha_alerta')
     return render(request, 'research/alertas_riesgo.html', {
         'user': user,
@@ -1648,7 +1650,7 @@ def alertas_riesgo_view(request):
 
 @session_login_required
 def biblioteca_educativa_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     contenidos = EducationalContent.objects.filter(is_active=True)
     
     # Filtros
@@ -1677,7 +1679,7 @@ def biblioteca_educativa_view(request):
 
 @session_login_required
 def ver_contenido_view(request, contenido_id):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     contenido = get_object_or_404(EducationalContent, id=contenido_id, is_active=True)
     contenido.visualizaciones += 1
     contenido.save()
@@ -1689,7 +1691,7 @@ def ver_contenido_view(request, contenido_id):
 
 @session_login_required
 def logros_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     logros = Achievement.objects.filter(is_active=True)
     logros_usuario_ids = UserAchievement.objects.filter(user=user).values_list('achievement_id', flat=True)
     
@@ -1713,7 +1715,7 @@ def logros_view(request):
 
 @session_login_required
 def narrativa_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     capitulos = Storyline.objects.filter(is_active=True).order_by('capitulo_numero')
     
     # Crear lista con progreso de cada capítulo
@@ -1752,7 +1754,7 @@ def narrativa_view(request):
 
 @session_login_required
 def ver_capitulo_view(request, capitulo_id):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     capitulo = get_object_or_404(Storyline, id=capitulo_id, is_active=True)
     return render(request, 'research/ver_capitulo.html', {
         'user': user,
@@ -1762,7 +1764,7 @@ def ver_capitulo_view(request, capitulo_id):
 
 @session_login_required
 def completar_capitulo_view(request, capitulo_id):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     capitulo = get_object_or_404(Storyline, id=capitulo_id)
     
     progress, created = StoryProgress.objects.get_or_create(user=user, storyline=capitulo)
@@ -1779,14 +1781,10 @@ def completar_capitulo_view(request, capitulo_id):
 @session_login_required
 def admin_dashboard_view(request):
     """Vista personalizada de administración"""
-    from django.contrib.auth.models import User
     from django.db.models import Count, Sum
     
-    user = UserProfile.objects.get(id=request.session['user_id'])
-    
     # Verificar que el usuario sea admin
-    django_user = User.objects.filter(email=user.email).first()
-    if not django_user or (not django_user.is_staff and not django_user.is_superuser):
+    if not roles.es_admin(request):
         messages.error(request, 'No tienes permisos para acceder al panel de administración.')
         return redirect('dashboard')
     
@@ -1814,17 +1812,27 @@ def admin_dashboard_view(request):
     })
 
 
+@session_login_required
+def admin_metricas_view(request):
+    """Métricas de las llamadas a Gemini y Twelve Data en JSON (solo administradores)"""
+    # Verificar que el usuario sea admin
+    if not roles.es_admin(request):
+        return JsonResponse({'error': 'No tienes permisos para ver las métricas.'}, status=403)
+    
+    return JsonResponse({
+        'buckets_ms': metricas.BUCKETS_MS,
+        'por_operacion': metricas.resumen('operacion'),
+        'por_vista': metricas.resumen('vista'),
+    })
+
+
 @session_login_required
 def admin_editar_usuario_view(request, usuario_id):
     """Vista para editar un usuario desde el admin"""
-    from django.contrib.auth.models import User
     from django.utils.dateparse import parse_datetime
     
-    admin_user = UserProfile.objects.get(id=request.session['user_id'])
-    
     # Verificar que el usuario sea admin
-    django_user = User.objects.filter(email=admin_user.email).first()
-    if not django_user or (not django_user.is_staff and not django_user.is_superuser):
+    if not roles.es_admin(request):
         messages.error(request, 'No tienes permisos para acceder al panel de administración.')
         return redirect('dashboard')
     
@@ -1841,6 +1849,8 @@ def admin_editar_usuario_view(request, usuario_id):
         usuario.is_blocked = request.POST.get('is_blocked') == 'on'
         usuario.login_attempts = int(request.POST.get('login_attempts', usuario.login_attempts))
         usuario.save()
+        if not usuario.is_blocked:
+            acceso.olvidar(usuario.email)
         
         # Actualizar métricas si existen
         metrics, created = UserMetrics.objects.get_or_create(user=usuario)
@@ -2095,7 +2105,7 @@ def admin_editar_usuario_view(request, usuario_id):
 
 @session_login_required
 def prevencion_fraudes_view(request):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     contenidos = FraudPreventionContent.objects.filter(is_active=True).order_by('fecha_creacion')
     
     # Filtro por tipo de fraude
@@ -2112,7 +2122,7 @@ def prevencion_fraudes_view(request):
 
 @session_login_required
 def ver_fraude_view(request, fraude_id):
-    user = UserProfile.objects.get(id=request.session['user_id'])
+    user = request.profile
     fraude = get_object_or_404(FraudPreventionContent, id=fraude_id, is_active=True)
     fraude.visualizaciones += 1
     fraude.save()
@@ -49,6 +49,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'myapp.middleware.MetricasVistaMiddleware',
+    'myapp.middleware.PerfilMiddleware',
 ]
 
 ROOT_URLCONF = 'tuchanchita.urls'
@@ -138,5 +140,139 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 DEFAULT_CHARSET = 'utf-8'
 
 TWELVE_API_KEY = os.environ.get('TWELVE_API_KEY', '')
+# URL base de Twelve Data (se cambia para apuntar a un servidor falso local)
+TWELVE_DATA_URL = os.environ.get('TWELVE_DATA_URL', 'https://api.twelvedata.com')
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
-GEMINI_PROJECT_ID = os.environ.get('GEMINI_PROJECT_ID', '')
\ No newline at end of file
+GEMINI_PROJECT_ID = os.environ.get('GEMINI_PROJECT_ID', '')
+# Modelos de Gemini a probar (en orden de preferencia) y segundos durante los
+# que se confía en la última verificación del modelo resuelto
+GEMINI_MODELOS = [
+    'gemini-2.0-flash',
+    'gemini-2.0-flash-exp',
+    'gemini-1.5-flash',
+    'gemini-1.5-pro',
+    'gemini-pro',
+]
+GEMINI_MODELO_TTL = int(os.environ.get('GEMINI_MODELO_TTL', 600))
+
+# Hilos máximos para llamadas concurrentes a la IA y tiempo límite (segundos)
+# para armar una evaluación en vivo antes de usar el banco local de preguntas
+IA_MAX_HILOS = int(os.environ.get('IA_MAX_HILOS', 7))
+EVALUACION_TIEMPO_LIMITE = float(os.environ.get('EVALUACION_TIEMPO_LIMITE', 25))
+
+# Caché persistente de respuestas de la IA: TTL en segundos por familia de
+# prompts (0 = sin caché) y máximo de entradas antes de desalojar por LRU
+IA_CACHE_TTL = {
+    'verificacion': 30 * 24 * 3600,
+    'brecha': 24 * 3600,
+    'evaluacion': 0,
+    'frase': 0,
+}
+IA_CACHE_MAX_ENTRADAS = int(os.environ.get('IA_CACHE_MAX_ENTRADAS', 5000))
+
+# Cola de trabajos en segundo plano: 'proceso' arranca los hilos dentro del
+# servidor web; 'comando' deja el trabajo a `python manage.py run_workers`
+TAREAS_MODO = os.environ.get('TAREAS_MODO', 'proceso')
+TAREAS_HILOS = int(os.environ.get('TAREAS_HILOS', 2))
+TAREAS_MAX_INTENTOS = 3
+TAREAS_ESPERA_BASE = 30  # segundos; se duplica en cada reintento
+TAREAS_TIEMPO_MAXIMO = 600  # segundos antes de recuperar una tarea abandonada
+TAREAS_INTERVALO = 5  # segundos entre revisiones de la cola cuando está vacía
+
+# Pool compartido de evaluaciones y banco de frases: cantidad de elementos
+# disponibles que se intenta mantener (para 'frase', frases activas en el
+# banco FraseCompletar), usos antes de retirar una evaluación y cuántos se
+# generan como máximo por trabajo de reposición
+POOL_OBJETIVOS = {
+    'evaluacion': int(os.environ.get('POOL_OBJETIVO_EVALUACIONES', 10)),
+    'frase': int(os.environ.get('POOL_OBJETIVO_FRASES', 40)),
+}
+POOL_USOS_MAXIMOS = int(os.environ.get('POOL_USOS_MAXIMOS', 100))
+POOL_LOTE = int(os.environ.get('POOL_LOTE', 5))
+
+# Horas que se conserva un set de evaluación mostrado y sin responder
+EVALUACION_SERVIDA_HORAS = int(os.environ.get('EVALUACION_SERVIDA_HORAS', 24))
+
+# Cómo se genera una evaluación completa: 'una_llamada' (un solo prompt
+# con todas las secciones, leído en streaming) o 'por_seccion' (7 prompts en paralelo)
+EVALUACION_MODO_GENERACION = os.environ.get('EVALUACION_MODO_GENERACION', 'una_llamada')
+
+# Contexto del chatbot: presupuesto aproximado de tokens del prompt, turnos
+# recientes enviados tal cual (los anteriores se resumen), turnos guardados
+# en la sesión, tamaño máximo del resumen y caracteres por mensaje guardado
+CHAT_PRESUPUESTO_TOKENS = int(os.environ.get('CHAT_PRESUPUESTO_TOKENS', 2000))
+CHAT_TURNOS_RECIENTES = int(os.environ.get('CHAT_TURNOS_RECIENTES', 6))
+CHAT_TURNOS_GUARDADOS = int(os.environ.get('CHAT_TURNOS_GUARDADOS', 20))
+CHAT_RESUMEN_MAX_TOKENS = int(os.environ.get('CHAT_RESUMEN_MAX_TOKENS', 400))
+CHAT_MAX_CARACTERES = int(os.environ.get('CHAT_MAX_CARACTERES', 4000))
+
+# Llamadas a Gemini: segundos máximos por familia de llamada y circuit
+# breaker (fallos seguidos para abrirlo y segundos antes de probar de nuevo)
+GEMINI_TIEMPOS_LIMITE = {
+    'chatbot': int(os.environ.get('GEMINI_TIEMPO_LIMITE_CHATBOT', 30)),
+    'evaluacion': int(os.environ.get('GEMINI_TIEMPO_LIMITE_EVALUACION', 45)),
+    'frase': int(os.environ.get('GEMINI_TIEMPO_LIMITE_FRASE', 15)),
+    'verificacion': int(os.environ.get('GEMINI_TIEMPO_LIMITE_VERIFICACION', 8)),
+}
+GEMINI_CIRCUITO_FALLOS = int(os.environ.get('GEMINI_CIRCUITO_FALLOS', 5))
+GEMINI_CIRCUITO_ESPERA = int(os.environ.get('GEMINI_CIRCUITO_ESPERA', 30))
+
+# Métricas de llamadas externas (Gemini, Twelve Data): cada cuántos segundos
+# se suman a la base las métricas acumuladas en memoria de cada proceso
+METRICAS_INTERVALO = int(os.environ.get('METRICAS_INTERVALO', 60))
+
+# Comando generar_recomendaciones: generaciones en paralelo y máximo de
+# llamadas al generador por segundo (0 = sin límite)
+RECOMENDACIONES_HILOS = int(os.environ.get('RECOMENDACIONES_HILOS', 4))
+RECOMENDACIONES_POR_SEGUNDO = float(os.environ.get('RECOMENDACIONES_POR_SEGUNDO', 2))
+
+# Segundos que se reutiliza el precio de un símbolo (en memoria y en la
+# tabla CotizacionCache) antes de volver a consultar a Twelve Data
+PRECIOS_TTL = int(os.environ.get('PRECIOS_TTL', 300))
+# Segundos máximos de espera por cada llamada a Twelve Data
+PRECIOS_TIMEOUT = float(os.environ.get('PRECIOS_TIMEOUT', 5))
+# Historial de precios (PriceSnapshot): todo el detalle de los últimos
+# PRECIOS_DETALLE_DIAS días, luego un punto por hora hasta
+# PRECIOS_POR_HORA_DIAS días y uno por día antes de eso
+PRECIOS_DETALLE_DIAS = int(os.environ.get('PRECIOS_DETALLE_DIAS', 7))
+PRECIOS_POR_HORA_DIAS = int(os.environ.get('PRECIOS_POR_HORA_DIAS', 90))
+
+# Cliente HTTP compartido (http_cliente.py) para las llamadas salientes:
+# timeouts en segundos, reintentos ante fallas de red o 429/5xx (con espera
+# exponencial desde HTTP_ESPERA_BASE) y máximo de requests simultáneos por host
+HTTP_TIMEOUT_CONEXION = float(os.environ.get('HTTP_TIMEOUT_CONEXION', 3.05))
+HTTP_TIMEOUT_LECTURA = float(os.environ.get('HTTP_TIMEOUT_LECTURA', 10))
+HTTP_REINTENTOS = int(os.environ.get('HTTP_REINTENTOS', 2))
+HTTP_ESPERA_BASE = float(os.environ.get('HTTP_ESPERA_BASE', 0.2))
+HTTP_MAX_POR_HOST = int(os.environ.get('HTTP_MAX_POR_HOST', 8))
+HTTP_ESPERA_LUGAR = float(os.environ.get('HTTP_ESPERA_LUGAR', 5))
+
+# Actividad de usuarios (sesiones y días activos de UserMetrics): se guarda
+# en lote cada ACTIVIDAD_INTERVALO segundos o al juntar ACTIVIDAD_UMBRAL
+# usuarios con cambios
+ACTIVIDAD_INTERVALO = int(os.environ.get('ACTIVIDAD_INTERVALO', 30))
+ACTIVIDAD_UMBRAL = int(os.environ.get('ACTIVIDAD_UMBRAL', 50))
+
+# Perfil de la sesión (request.profile, ver perfil.py): relaciones a traer en
+# la misma consulta (p. ej. "metrics,context") y verificación de consultas
+# redundantes del perfil (lanza AssertionError; para desarrollo y tests)
+PERFIL_SELECT_RELATED = tuple(r for r in os.environ.get('PERFIL_SELECT_RELATED', '').split(',') if r)
+PERFIL_VERIFICAR_CONSULTAS = os.environ.get('PERFIL_VERIFICAR_CONSULTAS', '') == '1'
+
+# Segundos que vale el rol de administrador guardado en la sesión (ver
+# roles.py); los cambios de staff/superusuario lo invalidan antes
+ROLES_TTL = int(os.environ.get('ROLES_TTL', 300))
+
+# Intentos de login (ver acceso.py): fallos permitidos por email antes de
+# bloquear la cuenta y por IP antes de rechazar, dentro de una ventana
+# deslizante de LOGIN_VENTANA segundos
+LOGIN_MAX_INTENTOS = int(os.environ.get('LOGIN_MAX_INTENTOS', 3))
+LOGIN_MAX_INTENTOS_IP = int(os.environ.get('LOGIN_MAX_INTENTOS_IP', 30))
+LOGIN_VENTANA = int(os.environ.get('LOGIN_VENTANA', 900))
+# Direcciones o redes de los proxies inversos (separadas por comas): solo si
+# REMOTE_ADDR es uno de ellos se toma la IP del cliente de X-Forwarded-For
+LOGIN_PROXIES_CONFIABLES = [p for p in os.environ.get('LOGIN_PROXIES_CONFIABLES', '').split(',') if p.strip()]
+
+# Segundos máximos de espera de la validación del correo al registrarse
+# (Abstract API, sin reintentos); si no responde a tiempo no se bloquea el registro
+VALIDACION_EMAIL_TIMEOUT = float(os.environ.get('VALIDACION_EMAIL_TIMEOUT', 3))